@@ -8,6 +8,7 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 
+from cache import cache, USERS
 from database import get_db
 from models import User
 
@@ -53,7 +54,21 @@ def decode_token(token: str) -> Optional[dict]:
         return None
 
 
-async def get_current_user(
+def get_user_id_from_authorization(authorization: Optional[str]) -> Optional[int]:
+    """Extract the user id from a raw "Bearer <token>" header, for middleware use"""
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    payload = decode_token(token)
+    if payload is None:
+        return None
+    try:
+        return int(payload.get("sub"))
+    except (ValueError, TypeError):
+        return None
+
+
+def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: Session = Depends(get_db)
 ) -> User:
@@ -81,17 +96,27 @@ async def get_current_user(
     except (ValueError, TypeError):
         raise credentials_exception
 
-    user = db.query(User).filter(User.id == user_id).first()
-    if user is None:
+    def load_user() -> Optional[User]:
+        user = db.query(User).filter(User.id == user_id).first()
+        if user is not None:
+            # Cached detached; each request works on its own attached copy
+            db.expunge(user)
+        # Hand the pooled connection back while the request waits for a worker
+        # thread to run the endpoint
+        db.rollback()
+        return user
+
+    cached = cache.get_or_load(USERS, user_id, load_user)
+    if cached is None:
         raise credentials_exception
 
-    if not user.is_active:
+    if not cached.is_active:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="用户账户已被禁用"
         )
 
-    return user
+    return db.merge(cached, load=False)
 
 
 async def get_current_admin_user(
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""Online database backups that don't block writers.
+
+Copies the live database with SQLite's online backup API, ``pages`` pages per
+step, sleeping ``sleep`` seconds between steps so the copy doesn't saturate
+the disk while requests are running. The result is a consistent snapshot:
+
+* In WAL mode the source connection holds one read transaction for the whole
+  copy. Writers keep committing to the WAL; the backup keeps copying the
+  snapshot it started from.
+* In rollback-journal mode a read transaction would block every commit, so
+  the copy runs without one and SQLite restarts it when another connection
+  writes. After ``BACKUP_MAX_RESTARTS`` restarts the rest is copied in one
+  step, which holds the shared lock (and makes writers wait) for that step.
+
+Snapshots are written to a ``.partial`` file and renamed when complete,
+optionally gzip-compressed. Admins create and download them through
+``/api/backups``; this module is also a CLI.
+
+Examples:
+    python backup.py
+    python backup.py --output /mnt/backups/wine.db.gz --compress --pages 512 --sleep-ms 20
+"""
+
+import argparse
+import gzip
+import logging
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime
+from typing import List, Optional
+
+from database import read_engine
+from metrics import registry
+from scheduler import ScheduledTask, scheduler
+
+logger = logging.getLogger("wine_inventory.backup")
+
+BACKUP_DIR = os.path.abspath(os.getenv("BACKUP_DIR", "backups"))
+BACKUP_PAGES_PER_STEP = int(os.getenv("BACKUP_PAGES_PER_STEP", "256"))
+BACKUP_STEP_SLEEP_SECONDS = float(os.getenv("BACKUP_STEP_SLEEP_MS", "5")) / 1000
+BACKUP_MAX_RESTARTS = int(os.getenv("BACKUP_MAX_RESTARTS", "3"))
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "10"))
+# Cron expression for scheduled backups (see scheduler.py); empty disables them
+BACKUP_CRON = os.getenv("BACKUP_CRON", "")
+BACKUP_COMPRESS = os.getenv("BACKUP_COMPRESS", "").lower() in ("1", "true", "yes")
+BACKUP_PREFIX = "wine_inventory-"
+BACKUP_SUFFIXES = (".db", ".db.gz")
+COPY_CHUNK = 1024 * 1024
+
+BACKUP_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+backup_duration = registry.histogram(
+    "backup_seconds", "Wall time of online backups, compression included", BACKUP_BUCKETS
+)
+backups_total = registry.counter("backups_total", "Online backups by result")
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+def _copy(source: sqlite3.Connection, path: str, pages: int, sleep: float, max_restarts: Optional[int], stats: dict):
+    """Back source up into path, counting into stats; raise _TooManyRestarts past max_restarts"""
+    previous = None
+
+    def progress(status, remaining, total):
+        nonlocal previous
+        stats["steps"] += 1
+        stats["pages"] = total
+        # A step that made no progress means another connection wrote and SQLite started over
+        if previous is not None and remaining >= previous:
+            stats["restarts"] += 1
+            if max_restarts is not None and stats["restarts"] > max_restarts:
+                raise _TooManyRestarts()
+        previous = remaining
+        if remaining and sleep > 0:
+            time.sleep(sleep)
+
+    target = sqlite3.connect(path)
+    try:
+        source.backup(target, pages=pages, progress=progress)
+    finally:
+        target.close()
+
+
+def _compress(path: str, destination: str, sleep: float):
+    with open(path, "rb") as src, gzip.open(destination, "wb", compresslevel=6) as dst:
+        while chunk := src.read(COPY_CHUNK):
+            dst.write(chunk)
+            if sleep > 0:
+                time.sleep(sleep)
+
+
+def create_backup(
+    destination: Optional[str] = None,
+    compress: bool = False,
+    pages: int = BACKUP_PAGES_PER_STEP,
+    sleep: float = BACKUP_STEP_SLEEP_SECONDS,
+    max_restarts: int = BACKUP_MAX_RESTARTS
+) -> dict:
+    """Write a consistent snapshot of the database and return what it took"""
+    if destination is None:
+        os.makedirs(BACKUP_DIR, exist_ok=True)
+        name = f"{BACKUP_PREFIX}{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}{'.db.gz' if compress else '.db'}"
+        destination = os.path.join(BACKUP_DIR, name)
+    partial = f"{destination}.partial"
+    snapshot = f"{partial}.db" if compress else partial
+
+    started = time.monotonic()
+    connection = read_engine.raw_connection()
+    try:
+        source = connection.dbapi_connection
+        journal_mode = source.execute("PRAGMA journal_mode").fetchone()[0].lower()
+        snapshot_read = journal_mode == "wal"
+        if snapshot_read:
+            source.execute("BEGIN")
+            source.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchall()
+        stats = {"steps": 0, "restarts": 0, "pages": 0}
+        try:
+            _copy(source, snapshot, pages, sleep, None if snapshot_read else max_restarts, stats)
+        except _TooManyRestarts:
+            logger.info("Backup restarted more than %d times; copying the rest in one step", max_restarts)
+            os.remove(snapshot)
+            _copy(source, snapshot, -1, 0, None, stats)
+        finally:
+            if snapshot_read:
+                source.rollback()
+        copied = time.monotonic()
+        if compress:
+            _compress(snapshot, partial, sleep)
+            os.remove(snapshot)
+        os.replace(partial, destination)
+    except Exception:
+        backups_total.inc(result="error")
+        for leftover in (snapshot, partial):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        raise
+    finally:
+        connection.close()
+
+    duration = time.monotonic() - started
+    backup_duration.observe(duration)
+    backups_total.inc(result="ok")
+    if os.path.dirname(destination) == BACKUP_DIR:
+        _prune()
+    return {
+        "name": os.path.basename(destination),
+        "path": destination,
+        "size": os.path.getsize(destination),
+        "compressed": compress,
+        "journal_mode": journal_mode,
+        "pages": stats["pages"],
+        "steps": stats["steps"],
+        "restarts": stats["restarts"],
+        "copy_ms": round((copied - started) * 1000, 1),
+        "duration_ms": round(duration * 1000, 1)
+    }
+
+
+def list_backups() -> List[dict]:
+    """Stored backups, newest first"""
+    if not os.path.isdir(BACKUP_DIR):
+        return []
+    backups = []
+    for entry in os.scandir(BACKUP_DIR):
+        if entry.is_file() and entry.name.startswith(BACKUP_PREFIX) and entry.name.endswith(BACKUP_SUFFIXES):
+            stat = entry.stat()
+            backups.append({
+                "name": entry.name,
+                "size": stat.st_size,
+                "created_at": datetime.fromtimestamp(stat.st_mtime)
+            })
+    backups.sort(key=lambda b: b["name"], reverse=True)
+    return backups
+
+
+def backup_path(name: str) -> Optional[str]:
+    """Resolve a backup name to its file, refusing anything outside BACKUP_DIR"""
+    if os.path.basename(name) != name or not name.startswith(BACKUP_PREFIX) or not name.endswith(BACKUP_SUFFIXES):
+        return None
+    path = os.path.join(BACKUP_DIR, name)
+    return path if os.path.isfile(path) else None
+
+
+def _prune():
+    if BACKUP_KEEP <= 0:
+        return
+    for old in list_backups()[BACKUP_KEEP:]:
+        try:
+            os.remove(os.path.join(BACKUP_DIR, old["name"]))
+        except OSError:
+            pass
+
+
+if BACKUP_CRON:
+    scheduler.add(ScheduledTask(
+        "backup", lambda: create_backup(compress=BACKUP_COMPRESS), cron=BACKUP_CRON, jitter=60, timeout=3600
+    ))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Back up the database online with SQLite's backup API")
+    parser.add_argument("--output", help=f"snapshot path (default: {BACKUP_DIR}/{BACKUP_PREFIX}<timestamp>.db[.gz])")
+    parser.add_argument("--compress", action="store_true", help="gzip the snapshot")
+    parser.add_argument("--pages", type=int, default=BACKUP_PAGES_PER_STEP, help="pages copied per step (-1: all at once)")
+    parser.add_argument("--sleep-ms", type=float, default=BACKUP_STEP_SLEEP_SECONDS * 1000, help="pause between steps")
+    parser.add_argument("--max-restarts", type=int, default=BACKUP_MAX_RESTARTS,
+                        help="rollback-journal mode: restarts before copying the rest in one step")
+    args = parser.parse_args(argv)
+
+    result = create_backup(args.output, args.compress, args.pages, args.sleep_ms / 1000, args.max_restarts)
+    print(
+        f"{result['path']}: {result['size'] / 1024:.0f} KiB, {result['pages']} pages in {result['steps']} steps "
+        f"({result['restarts']} restarts, {result['journal_mode']} mode), "
+        f"copy {result['copy_ms']:.0f} ms, total {result['duration_ms']:.0f} ms"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""In-process API benchmark suite with regression thresholds.
+
+Drives the FastAPI app over ASGI (no server, no network) against generated
+datasets of several sizes and records latency percentiles and throughput for
+each endpoint. Results are written as JSON; pass ``--baseline`` to compare
+with an earlier run and exit non-zero when an endpoint regresses beyond
+``--tolerance``.
+
+Datasets are built once with generate_dataset.py and cached in ``bench_data/``;
+each run works on a fresh copy so write endpoints never change the cache.
+
+Examples:
+    python bench_api.py --sizes small
+    python bench_api.py --sizes small,medium --output bench_results/main.json
+    python bench_api.py --sizes small --baseline bench_results/main.json --tolerance 0.25
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BACKEND_DIR, "bench_data")
+RESULTS_DIR = os.path.join(BACKEND_DIR, "bench_results")
+
+DATASET_END_DATE = "2026-01-01"
+DATASET_SIZES = {
+    "small": {"wines": 1000, "transactions": 20000, "logs": 20000},
+    "medium": {"wines": 10000, "transactions": 200000, "logs": 200000},
+    "large": {"wines": 100000, "transactions": 2000000, "logs": 2000000},
+}
+
+ADMIN_EMAIL = "admin@wine.com"
+ADMIN_PASSWORD = "admin123"
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies: List[float], elapsed: float, errors: int) -> dict:
+    ordered = sorted(latencies)
+    return {
+        "iterations": len(latencies),
+        "errors": errors,
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3) if ordered else 0.0,
+        "p50_ms": round(percentile(ordered, 50) * 1000, 3),
+        "p90_ms": round(percentile(ordered, 90) * 1000, 3),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3) if ordered else 0.0,
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+    }
+
+
+def import_csv(rows: int) -> bytes:
+    lines = ["name,vintage_year,region,grape_variety,price,current_stock"]
+    lines += [f"Bench Import {i},2018,波尔多,梅洛,{100 + i},12" for i in range(rows)]
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def scenarios(wine_id: int) -> List[dict]:
+    """Endpoint scenarios; ``weight`` scales the iteration count for heavy calls"""
+    return [
+        {"name": "wines_list", "method": "GET", "url": "/api/wines?page=1&page_size=20"},
+        {"name": "wines_list_deep_page", "method": "GET", "url": "/api/wines?page=200&page_size=20&sort_by=price&sort_order=asc"},
+        {"name": "wines_search", "method": "GET", "url": "/api/wines?search=梅洛&page_size=20"},
+        {"name": "wines_filter", "method": "GET", "url": "/api/wines?region=勃艮第&stock_status=low&min_price=50&page_size=20"},
+        {"name": "wine_detail", "method": "GET", "url": f"/api/wines/{wine_id}"},
+        {"name": "wines_low_stock", "method": "GET", "url": "/api/wines/low-stock", "weight": 0.2},
+        {"name": "wines_regions", "method": "GET", "url": "/api/wines/regions"},
+        {"name": "inventory_in", "method": "POST", "url": "/api/inventory/in", "json": {"wine_id": wine_id, "quantity": 2, "reason": "bench"}},
+        {"name": "inventory_out", "method": "POST", "url": "/api/inventory/out", "json": {"wine_id": wine_id, "quantity": 1, "reason": "bench"}},
+        {"name": "inventory_list", "method": "GET", "url": "/api/inventory?page=1&page_size=20"},
+        {"name": "inventory_wine_history", "method": "GET", "url": f"/api/inventory/wine/{wine_id}", "weight": 0.2},
+        {"name": "dashboard_summary", "method": "GET", "url": "/api/dashboard/summary", "weight": 0.2},
+        {"name": "dashboard_trends_30d", "method": "GET", "url": "/api/dashboard/trends?days=30", "weight": 0.2},
+        {"name": "dashboard_distribution_region", "method": "GET", "url": "/api/dashboard/distribution/region", "weight": 0.2},
+        {"name": "dashboard_alerts", "method": "GET", "url": "/api/dashboard/alerts"},
+        {"name": "logs_list", "method": "GET", "url": "/api/logs?page=1&page_size=20"},
+        {"name": "logs_filtered", "method": "GET", "url": "/api/logs?action_type=stock_out&page=3&page_size=20"},
+        {"name": "export_wines", "method": "GET", "url": "/api/export/wines", "weight": 0.1},
+        {"name": "export_transactions", "method": "GET", "url": "/api/export/transactions?start_date=2025-12-01", "weight": 0.1},
+        {"name": "import_wines_100", "method": "POST", "url": "/api/import/wines", "files": {"file": ("bench.csv", import_csv(100), "text/csv")}, "weight": 0.2},
+    ]
+
+
+def ensure_dataset(size: str, seed: int) -> str:
+    """Build (or reuse) the cached dataset for a size"""
+    os.makedirs(DATA_DIR, exist_ok=True)
+    path = os.path.join(DATA_DIR, f"{size}-seed{seed}.db")
+    if not os.path.exists(path):
+        volumes = DATASET_SIZES[size]
+        print(f"Generating {size} dataset -> {path}")
+        partial = path + ".partial"
+        if os.path.exists(partial):
+            os.remove(partial)
+        subprocess.run([
+            sys.executable, os.path.join(BACKEND_DIR, "generate_dataset.py"),
+            "--database", partial, "--reset", "--seed", str(seed), "--end-date", DATASET_END_DATE,
+            "--wines", str(volumes["wines"]),
+            "--transactions", str(volumes["transactions"]),
+            "--logs", str(volumes["logs"]),
+        ], check=True, cwd=BACKEND_DIR)
+        os.replace(partial, path)
+    return path
+
+
+async def run_size(iterations: int, warmup: int, only: Optional[List[str]]) -> Dict[str, dict]:
+    """Benchmark every scenario against the database in DATABASE_URL"""
+    import httpx
+    from main import app
+
+    results = {}
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            response = await client.post("/api/auth/login", json={"email": ADMIN_EMAIL, "password": ADMIN_PASSWORD})
+            response.raise_for_status()
+            headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+            # The most popular wine: first by stock, which the generator skews heavily
+            response = await client.get("/api/wines?page_size=1&sort_by=current_stock&sort_order=desc", headers=headers)
+            response.raise_for_status()
+            wine_id = response.json()["items"][0]["id"]
+
+            for scenario in scenarios(wine_id):
+                if only and scenario["name"] not in only:
+                    continue
+                count = max(3, int(iterations * scenario.get("weight", 1.0)))
+
+                async def call():
+                    return await client.request(
+                        scenario["method"], scenario["url"], headers=headers,
+                        json=scenario.get("json"), files=scenario.get("files")
+                    )
+
+                for _ in range(min(warmup, count)):
+                    await call()
+
+                latencies, errors = [], 0
+                started = time.perf_counter()
+                for _ in range(count):
+                    t0 = time.perf_counter()
+                    response = await call()
+                    latencies.append(time.perf_counter() - t0)
+                    if response.status_code >= 400:
+                        errors += 1
+                elapsed = time.perf_counter() - started
+
+                results[scenario["name"]] = summarize(latencies, elapsed, errors)
+                r = results[scenario["name"]]
+                print(f"  {scenario['name']:<32} p50 {r['p50_ms']:>9.2f} ms  p95 {r['p95_ms']:>9.2f} ms  "
+                      f"{r['throughput_rps']:>8.1f} req/s  errors {errors}", flush=True)
+    return results
+
+
+def run_child(args) -> int:
+    results = asyncio.run(run_size(args.iterations, args.warmup, args.only))
+    with open(args.child_output, "w", encoding="utf-8") as f:
+        json.dump(results, f)
+    return 0
+
+
+def compare(current: dict, baseline: dict, tolerance: float, metrics=("p50_ms", "p95_ms")) -> List[str]:
+    """Regressions of current vs baseline beyond the tolerance"""
+    regressions = []
+    for size, endpoints in current["results"].items():
+        for name, result in endpoints.items():
+            base = baseline.get("results", {}).get(size, {}).get(name)
+            if base is None:
+                continue
+            for metric in metrics:
+                # Ignore sub-millisecond noise
+                limit = max(base[metric] * (1 + tolerance), base[metric] + 1.0)
+                if result[metric] > limit:
+                    regressions.append(
+                        f"{size}/{name} {metric}: {result[metric]:.2f} ms vs baseline {base[metric]:.2f} ms "
+                        f"(+{(result[metric] / base[metric] - 1) * 100 if base[metric] else float('inf'):.0f}%)"
+                    )
+            if result["errors"] > base["errors"]:
+                regressions.append(f"{size}/{name} errors: {result['errors']} vs baseline {base['errors']}")
+    return regressions
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the API in-process against generated datasets")
+    parser.add_argument("--sizes", default="small", help=f"comma-separated: {', '.join(DATASET_SIZES)}")
+    parser.add_argument("--iterations", type=int, default=50, help="requests per endpoint (heavy endpoints run fewer)")
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--only", type=lambda s: s.split(","), help="comma-separated scenario names")
+    parser.add_argument("--output", help="result JSON path (default: bench_results/api-<timestamp>.json)")
+    parser.add_argument("--baseline", help="earlier result JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown vs baseline (0.2 = 20%%)")
+    parser.add_argument("--child-output", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child_output:
+        return run_child(args)
+
+    sizes = [s.strip() for s in args.sizes.split(",") if s.strip()]
+    unknown = [s for s in sizes if s not in DATASET_SIZES]
+    if unknown:
+        parser.error(f"unknown sizes: {', '.join(unknown)}")
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "iterations": args.iterations,
+        },
+        "results": {}
+    }
+
+    for size in sizes:
+        dataset = ensure_dataset(size, args.seed)
+        workdir = tempfile.mkdtemp(prefix=f"bench-{size}-")
+        try:
+            database = os.path.join(workdir, "bench.db")
+            shutil.copyfile(dataset, database)
+            child_output = os.path.join(workdir, "results.json")
+            print(f"[{size}] {DATASET_SIZES[size]}")
+            # One process per dataset: the app binds its engine at import time
+            command = [
+                sys.executable, os.path.abspath(__file__),
+                "--iterations", str(args.iterations), "--warmup", str(args.warmup),
+                "--child-output", child_output,
+            ]
+            if args.only:
+                command += ["--only", ",".join(args.only)]
+            env = dict(os.environ, DATABASE_URL=f"sqlite:///{database}")
+            # Slow-request logging would flood the output on the larger datasets
+            env.setdefault("SLOW_REQUEST_MS", "60000")
+            subprocess.run(command, check=True, cwd=BACKEND_DIR, env=env)
+            with open(child_output, encoding="utf-8") as f:
+                report["results"][size] = json.load(f)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"api-{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Results written to {output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"\nNo regressions beyond {args.tolerance:.0%} vs {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
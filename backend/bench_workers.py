@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""Throughput scaling with the number of serve.py workers.
+
+For each worker count, starts serve.py on a fresh copy of a generated dataset,
+drives it with one loadgen.py stage and records throughput, latency and
+errors, then prints how throughput scales relative to a single worker.
+
+Examples:
+    python bench_workers.py
+    python bench_workers.py --workers 1,2,4,8 --scenario stock-burst --users 100
+"""
+
+import argparse
+import json
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import httpx
+
+import loadgen
+from bench_api import DATASET_SIZES, RESULTS_DIR, ensure_dataset
+from serve import default_workers
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_healthy(url: str, timeout: float = 120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{url}/api/health", timeout=2).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"{url} did not become healthy")
+
+
+def measure(workers: int, dataset: str, args) -> dict:
+    workdir = tempfile.mkdtemp(prefix=f"bench-workers-{workers}-")
+    database = os.path.join(workdir, "bench.db")
+    shutil.copyfile(dataset, database)
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{database}", SLOW_REQUEST_MS="60000")
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(BACKEND_DIR, "serve.py"), "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--max-requests", "0", "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_healthy(url)
+        report_path = os.path.join(workdir, "load.json")
+        loadgen.main([
+            "--url", url, "--scenario", args.scenario, "--users", str(args.users),
+            "--stage-seconds", str(args.seconds), "--seed", "1", "--output", report_path,
+        ])
+        with open(report_path, encoding="utf-8") as f:
+            stage = json.load(f)["stages"][0]
+        stage.pop("actions", None)
+        return dict(workers=workers, **stage)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        try:
+            server.wait(timeout=60)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main(argv=None) -> int:
+    cores = default_workers()
+    counts = sorted({1, 2, cores, cores * 2})
+    parser = argparse.ArgumentParser(description="Benchmark throughput against serve.py worker count")
+    parser.add_argument("--workers", default=",".join(map(str, counts)), help="comma-separated worker counts")
+    parser.add_argument("--size", default="small", choices=sorted(DATASET_SIZES))
+    parser.add_argument("--scenario", default="mixed", choices=sorted(loadgen.SCENARIOS))
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--seconds", type=float, default=30)
+    parser.add_argument("--output", help="result JSON path (default: bench_results/workers-<timestamp>.json)")
+    args = parser.parse_args(argv)
+
+    dataset = ensure_dataset(args.size, 42)
+    results = []
+    for workers in [int(n) for n in args.workers.split(",")]:
+        print(f"\n== {workers} worker(s) ==")
+        results.append(measure(workers, dataset, args))
+
+    base = results[0]["throughput_rps"] or 1
+    print(f"\n{'workers':>8} {'req/s':>9} {'scaling':>8} {'p50 ms':>9} {'p95 ms':>9} {'lock errors':>12} {'error rate':>11}")
+    for result in results:
+        print(
+            f"{result['workers']:>8} {result['throughput_rps']:>9.1f} {result['throughput_rps'] / base:>7.2f}x "
+            f"{result['p50_ms']:>9.1f} {result['p95_ms']:>9.1f} {result['errors']['lock']:>12} {result['error_rate']:>10.2%}"
+        )
+    print(f"({cores} CPU core(s) available)")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"workers-{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({
+            "meta": {"cores": cores, "scenario": args.scenario, "users": args.users, "seconds": args.seconds, "size": args.size},
+            "results": results,
+        }, f, ensure_ascii=False, indent=2)
+    print(f"Results written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,239 @@
+"""Per-process read cache with cross-process invalidation.
+
+Hot reads (the authenticated user, wine lookup lists, dashboard aggregates)
+are cached in process memory under a namespace. Every worker process keeps
+its own copy, so writes must reach all of them:
+
+* Session events map each flushed or bulk-executed write to the namespaces it
+  makes stale and bump those namespaces' rows in ``cache_versions`` inside the
+  same transaction. The writing process drops its own entries on commit.
+* Every process runs a listener thread that checks ``PRAGMA data_version``
+  (a counter SQLite bumps when another connection commits; reading it takes no
+  lock) every ``CACHE_POLL_INTERVAL_MS`` and, only when it moved, re-reads
+  ``cache_versions`` and drops the namespaces whose version changed.
+
+Entries also expire after ``CACHE_TTL_SECONDS`` so writes made outside the
+app (scripts writing to the database directly) are picked up eventually.
+``CACHE_TTL_SECONDS=0`` disables caching.
+"""
+
+import logging
+import os
+import threading
+import time
+from itertools import chain
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Set, Tuple
+
+from sqlalchemy import event, inspect
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from database import SessionLocal, read_engine
+from metrics import registry
+from models import CacheVersion
+
+logger = logging.getLogger("wine_inventory.cache")
+
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "300"))
+CACHE_POLL_INTERVAL_SECONDS = float(os.getenv("CACHE_POLL_INTERVAL_MS", "10")) / 1000
+
+USERS = "users"
+WINE_LOOKUPS = "wine_lookups"
+DASHBOARD = "dashboard"
+
+# Namespaces made stale by a write to each table
+TABLE_NAMESPACES: Dict[str, Tuple[str, ...]] = {
+    "users": (USERS,),
+    "wines": (WINE_LOOKUPS, DASHBOARD),
+    "inventory_transactions": (DASHBOARD,),
+}
+# Wine updates touching only these columns leave the lookup lists valid
+STOCK_COLUMNS = {"current_stock", "updated_at"}
+
+_PENDING_KEY = "cache_invalidated"
+
+cache_requests_total = registry.counter(
+    "cache_requests_total", "Read cache lookups by namespace and result"
+)
+cache_invalidations_total = registry.counter(
+    "cache_invalidations_total", "Cache namespaces dropped, by origin (local commit or another process)"
+)
+
+
+class Cache:
+    """Namespaced in-memory cache; entries are dropped a namespace at a time"""
+
+    def __init__(self, ttl: float = CACHE_TTL_SECONDS):
+        self.ttl = ttl
+        self._entries: Dict[str, Dict[Hashable, Tuple[float, Any]]] = {}
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get_or_load(self, namespace: str, key: Hashable, loader: Callable[[], Any], ttl: Optional[float] = None) -> Any:
+        """Cached value for key, calling loader on a miss"""
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return loader()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(namespace, {}).get(key)
+            generation = self._generations.get(namespace, 0)
+        if entry is not None and entry[0] > now:
+            cache_requests_total.inc(namespace=namespace, result="hit")
+            return entry[1]
+
+        cache_requests_total.inc(namespace=namespace, result="miss")
+        value = loader()
+        with self._lock:
+            # An invalidation while loading means the value may predate the write
+            if self._generations.get(namespace, 0) == generation:
+                self._entries.setdefault(namespace, {})[key] = (now + ttl, value)
+        return value
+
+    def invalidate(self, namespaces: Iterable[str], origin: str = "local"):
+        with self._lock:
+            for namespace in namespaces:
+                self._entries.pop(namespace, None)
+                self._generations[namespace] = self._generations.get(namespace, 0) + 1
+                cache_invalidations_total.inc(namespace=namespace, origin=origin)
+
+    def clear(self):
+        with self._lock:
+            namespaces = list(self._entries)
+        self.invalidate(namespaces)
+
+
+cache = Cache()
+
+
+def _stale_namespaces(session: Session) -> Set[str]:
+    """Namespaces made stale by the objects of the flush in progress"""
+    namespaces = set()
+    for obj in chain(session.new, session.deleted):
+        namespaces.update(TABLE_NAMESPACES.get(obj.__tablename__, ()))
+    for obj in session.dirty:
+        if obj.__tablename__ == "wines":
+            changed = {attr.key for attr in inspect(obj).attrs if attr.history.has_changes()}
+            if changed <= STOCK_COLUMNS:
+                namespaces.add(DASHBOARD)
+                continue
+        namespaces.update(TABLE_NAMESPACES.get(obj.__tablename__, ()))
+    return namespaces
+
+
+def _bump_versions(session: Session, namespaces: Set[str]):
+    """Advance the shared version of each namespace in the current transaction"""
+    pending = session.info.setdefault(_PENDING_KEY, {})
+    new = namespaces - pending.keys()
+    if not new:
+        return
+    table = CacheVersion.__table__
+    statement = sqlite_insert(table).values([{"namespace": n, "version": 1} for n in sorted(new)])
+    rows = session.connection().execute(statement.on_conflict_do_update(
+        index_elements=[table.c.namespace],
+        set_={"version": table.c.version + 1}
+    ).returning(table.c.namespace, table.c.version))
+    pending.update(rows.all())
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _after_flush(session, flush_context):
+    namespaces = _stale_namespaces(session)
+    if namespaces:
+        _bump_versions(session, namespaces)
+
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _before_bulk_statement(orm_execute_state):
+    # insert()/update()/delete() executed directly never go through a flush
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement.table, "name", None)
+        namespaces = set(TABLE_NAMESPACES.get(table, ()))
+        if namespaces:
+            _bump_versions(orm_execute_state.session, namespaces)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _after_commit(session):
+    versions = session.info.pop(_PENDING_KEY, None)
+    if versions:
+        cache.invalidate(versions)
+        listener.seen(versions)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _after_rollback(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+class InvalidationListener:
+    """Drops namespaces whose version another process bumped"""
+
+    def __init__(self, interval: float = CACHE_POLL_INTERVAL_SECONDS):
+        self.interval = interval
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="cache-invalidation", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self._thread = None
+
+    def seen(self, versions: Dict[str, int]):
+        """Record versions this process committed (and already dropped) itself"""
+        with self._lock:
+            for namespace, version in versions.items():
+                if version > self._versions.get(namespace, 0):
+                    self._versions[namespace] = version
+
+    def _read_versions(self, connection) -> Dict[str, int]:
+        cursor = connection.cursor()
+        try:
+            cursor.execute("SELECT namespace, version FROM cache_versions")
+            return dict(cursor.fetchall())
+        finally:
+            cursor.close()
+
+    def _data_version(self, connection) -> int:
+        cursor = connection.cursor()
+        try:
+            cursor.execute("PRAGMA data_version")
+            return cursor.fetchone()[0]
+        finally:
+            cursor.close()
+
+    def _run(self):
+        connection = read_engine.raw_connection()
+        try:
+            data_version = self._data_version(connection)
+            with self._lock:
+                self._versions = self._read_versions(connection)
+            while not self._stop.wait(self.interval):
+                try:
+                    current = self._data_version(connection)
+                    if current == data_version:
+                        continue
+                    data_version = current
+                    versions = self._read_versions(connection)
+                except Exception:
+                    logger.exception("Cache invalidation poll failed")
+                    continue
+                with self._lock:
+                    changed = [n for n, v in versions.items() if v > self._versions.get(n, 0)]
+                    for namespace in changed:
+                        self._versions[namespace] = versions[namespace]
+                if changed:
+                    cache.invalidate(changed, origin="remote")
+        finally:
+            connection.close()
+
+
+listener = InvalidationListener()
@@ -0,0 +1,132 @@
+"""Change feed for clients that mirror the wine catalogue.
+
+``GET /api/wines/changes?since=<token>`` returns wines created or updated and
+the IDs of wines deleted since the token, oldest first, plus a new token.
+Without ``since`` it returns everything, so a client syncs once from scratch
+and then incrementally.
+
+Every insert, update and delete of a wine takes the next number from the
+single ``change_sequence`` row, inside the transaction that makes the change
+(see the triggers in models.py): wines keep theirs in ``change_seq``, deleted
+wines in ``wine_tombstones.seq``. SQLite runs one write transaction at a time
+and a transaction reads the counter that the previous one committed, so once
+a number is visible every smaller one is too, however long the transaction
+that took it stayed open. The token is just the position of the last change
+returned, ``(seq, wine id)``; the wine ID only orders rows that predate the
+sequence, which all have seq 0. Nothing is skipped or sent twice.
+
+Tombstones are kept ``CHANGES_RETENTION_DAYS``. Purging records the highest
+seq it removed, and a token before that gets 410: the client starts over
+without ``since``.
+"""
+
+import base64
+import binascii
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from sqlalchemy import String, or_, type_coerce, func
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import ChangeSequence, Wine, WineTombstone
+from scheduler import ScheduledTask, scheduler
+from schemas import WineChanges, WineResponse
+
+CHANGES_RETENTION_DAYS = int(os.getenv("CHANGES_RETENTION_DAYS", "30"))
+# Matches SQLite's CURRENT_TIMESTAMP, which sets deleted_at
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class InvalidToken(ValueError):
+    pass
+
+
+class ExpiredToken(ValueError):
+    pass
+
+
+def encode_token(seq: int, wine_id: int = 0) -> str:
+    raw = json.dumps({"s": seq, "i": wine_id}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_token(token: Optional[str]) -> dict:
+    if not token:
+        return {"s": 0, "i": 0}
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        # Timestamp tokens from before the change sequence carry "t" instead
+        legacy = "s" not in payload and "t" in payload
+        position = None if legacy else {"s": int(payload["s"]), "i": int(payload.get("i", 0))}
+    except (binascii.Error, ValueError, AttributeError, TypeError, KeyError) as exc:
+        raise InvalidToken(str(exc)) from exc
+    if position is None:
+        raise ExpiredToken(token)
+    return position
+
+
+def wine_changes(db: Session, token: Optional[str], limit: int) -> WineChanges:
+    """Changes after token, at most limit of them"""
+    position = decode_token(token)
+    seq, after = position["s"], position["i"]
+    if token and seq < (db.query(ChangeSequence.purged).filter(ChangeSequence.id == 1).scalar() or 0):
+        # Deletions between the token and the purge are gone
+        raise ExpiredToken(token)
+
+    wines = db.query(Wine).filter(
+        Wine.change_seq >= seq, or_(Wine.change_seq > seq, Wine.id > after)
+    ).order_by(Wine.change_seq, Wine.id).limit(limit + 1).all()
+    # Tombstones from before the sequence (seq 0) only matter to clients that
+    # synced before it, and their timestamp tokens have expired
+    tombstones = db.query(WineTombstone.seq, WineTombstone.wine_id).filter(
+        WineTombstone.seq > seq
+    ).order_by(WineTombstone.seq).limit(limit + 1).all()
+
+    # (seq, wine ID, wine or None for a deletion), oldest first
+    events: List[tuple] = sorted(
+        [(wine.change_seq, wine.id, wine) for wine in wines]
+        + [(tombstone_seq, wine_id, None) for tombstone_seq, wine_id in tombstones],
+        key=lambda event: event[:2]
+    )
+    has_more = len(events) > limit
+    events = events[:limit]
+    if not events:
+        return WineChanges(changes=[], deleted=[], token=token or encode_token(0), has_more=False)
+
+    last_seq, last_id, _ = events[-1]
+    changes = [WineResponse.model_validate(wine) for _, _, wine in events if wine is not None]
+    live = {wine.id for wine in changes}
+    return WineChanges(
+        changes=changes,
+        # A live row means the ID was reused after the deletion
+        deleted=[wine_id for _, wine_id, wine in events if wine is None and wine_id not in live],
+        token=encode_token(last_seq, last_id),
+        has_more=has_more
+    )
+
+
+def purge_tombstones() -> int:
+    """Delete tombstones older than CHANGES_RETENTION_DAYS"""
+    horizon = (datetime.now(timezone.utc) - timedelta(days=CHANGES_RETENTION_DAYS)).strftime(TIMESTAMP_FORMAT)
+    # Compare the stored text directly: binding a datetime would format it
+    # differently from CURRENT_TIMESTAMP
+    expired = type_coerce(WineTombstone.deleted_at, String) < horizon
+    db = SessionLocal()
+    try:
+        purged = db.query(func.max(WineTombstone.seq)).filter(expired).scalar()
+        if purged is None:
+            return 0
+        deleted = db.query(WineTombstone).filter(expired).delete(synchronize_session=False)
+        db.query(ChangeSequence).filter(ChangeSequence.id == 1, ChangeSequence.purged < purged).update(
+            {ChangeSequence.purged: purged}, synchronize_session=False
+        )
+        db.commit()
+        return deleted
+    finally:
+        db.close()
+
+
+scheduler.add(ScheduledTask("purge_wine_tombstones", purge_tombstones, cron="45 4 * * *", jitter=60, timeout=300))
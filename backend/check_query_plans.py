@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""Query-plan regression check for every router query.
+
+Runs each API route in-process (with representative filter combinations)
+against a copy of a generated dataset, captures every SQL statement with
+query_debug.detect_queries() and runs ``EXPLAIN QUERY PLAN`` on each SELECT.
+Fails when a statement does a full scan of a watched table that is not in
+ALLOWED_FULL_SCANS, when an API route is not exercised at all, or when a request
+fails (other than the refusals in EXPECTED_ERRORS), so adding a filter to
+get_wines or list_logs without an index shows up before it ships.
+
+Examples:
+    python check_query_plans.py
+    python check_query_plans.py --size medium --verbose
+"""
+
+import argparse
+import os
+import re
+import shutil
+import sys
+import tempfile
+from typing import Dict, List, Tuple
+
+WATCHED_TABLES = {"wines", "inventory_transactions", "operation_logs"}
+
+# (route, table, statement pattern) -> why scanning that table is expected
+ALLOWED_FULL_SCANS: Dict[Tuple[str, str, str], str] = {
+    ("GET /api/export/wines", "wines", r"^SELECT wines\."): "exports every wine",
+    ("GET /api/dashboard/summary", "wines", r"FROM wines"): "totals over all wines",
+    ("GET /api/wines", "wines", r"LIKE"): "substring search cannot use a b-tree index",
+    ("GET /api/dashboard/alerts", "wines", r"current_stock <= wines\.low_stock_threshold"): "compares two columns of every wine",
+    ("GET /api/wines/stream", "wines", r"FROM wines ORDER BY wines\.id LIMIT"): "first batch of a dump, read in rowid order",
+}
+
+# Routes that issue no SQL worth checking
+UNCHECKED_ROUTES = {
+    "GET /api/health",
+    "GET /api/events/stream",
+    "GET /api/metrics",
+    "GET /api/metrics/event-loop",
+    "GET /api/profiles",
+    "GET /api/profiles/memory",
+    "POST /api/profiles/memory/start",
+    "POST /api/profiles/memory/stop",
+    "GET /api/profiles/{name}",
+    "GET /api/backups",
+    "POST /api/backups",
+    "GET /api/backups/{name}",
+    "GET /api/maintenance",
+    "POST /api/maintenance/run",
+    "GET /api/scheduler",
+}
+
+# Requests meant to be refused, and their status; any other 4xx fails the check,
+# since a refused request never reaches the queries it is there to cover
+EXPECTED_ERRORS: Dict[Tuple[str, str], int] = {
+    ("PUT", "/api/auth/password"): 400,  # wrong current password
+    ("POST", "/api/auth/reset-password"): 400,  # invalid reset token
+}
+
+_FULL_SCAN = re.compile(r"^SCAN (\w+)(?: AS \w+)?$")
+
+
+def requests_to_run(ids: Dict[str, int]) -> List[Tuple[str, str, dict]]:
+    """(method, url, httpx kwargs) covering every route and its filters"""
+    from changes import encode_token
+
+    wine, scratch, user, transaction, log = ids["wine"], ids["scratch"], ids["user"], ids["transaction"], ids["log"]
+    since = encode_token(1, wine)
+    return [
+        ("GET", "/api/auth/me", {}),
+        ("PUT", "/api/auth/profile", {"json": {"name": "系统管理员"}}),
+        ("PUT", "/api/auth/password", {"json": {"current_password": "wrong-password", "new_password": "irrelevant1"}}),
+        ("POST", "/api/auth/forgot-password", {"json": {"email": "admin@wine.com"}}),
+        ("POST", "/api/auth/reset-password", {"json": {"token": "invalid", "new_password": "irrelevant1"}}),
+        ("POST", "/api/auth/refresh", {}),
+        ("GET", "/api/wines", {"params": {"page": 3, "page_size": 20}}),
+        ("GET", "/api/wines", {"params": {"search": "梅洛"}}),
+        ("GET", "/api/wines", {"params": {"region": "波尔多"}}),
+        ("GET", "/api/wines", {"params": {"grape_variety": "赤霞珠"}}),
+        ("GET", "/api/wines", {"params": {"supplier": "波尔多酒业公司001"}}),
+        ("GET", "/api/wines", {"params": {"storage_location": "A区-01架"}}),
+        ("GET", "/api/wines", {"params": {"vintage_year": 2015}}),
+        ("GET", "/api/wines", {"params": {"min_price": 100, "max_price": 300}}),
+        ("GET", "/api/wines", {"params": {"stock_status": "low"}}),
+        ("GET", "/api/wines", {"params": {"stock_status": "out"}}),
+        ("GET", "/api/wines", {"params": {"sort_by": "price", "sort_order": "asc"}}),
+        ("GET", "/api/wines", {"params": {"sort_by": "name"}}),
+        ("GET", "/api/wines", {"params": {"fields": "name,current_stock", "region": "波尔多"}}),
+        ("GET", "/api/wines/low-stock", {}),
+        ("GET", "/api/wines/regions", {}),
+        ("GET", "/api/wines/varieties", {}),
+        ("GET", "/api/wines/suppliers", {}),
+        ("GET", "/api/wines/locations", {}),
+        ("GET", "/api/wines/changes", {"params": {"limit": 100}}),
+        ("GET", "/api/wines/changes", {"params": {"since": since}}),
+        ("GET", "/api/wines/stream", {}),
+        ("GET", "/api/wines/stream", {"params": {"region": "波尔多", "stock_status": "low"}}),
+        ("GET", "/api/wines/stream", {"params": {"fields": "name,current_stock"}}),
+        ("GET", f"/api/wines/{wine}", {}),
+        ("GET", f"/api/wines/{wine}", {"params": {"fields": "name,current_stock"}}),
+        ("GET", "/api/wines/batch", {"params": {"ids": f"{wine},{scratch},1,2,3"}}),
+        ("GET", "/api/wines/batch", {"params": {"ids": f"{wine},{scratch}", "fields": "name"}}),
+        ("PUT", f"/api/wines/{scratch}", {"json": {"notes": "plan check"}}),
+        ("POST", "/api/wines", {"json": {"name": "计划检查", "vintage_year": 2020, "region": "检查"}}),
+        # Bulk routes get their own region: the scratch wine is still needed below
+        ("POST", "/api/wines/bulk", {"json": {"items": [{"name": "批量检查", "vintage_year": 2020, "region": "批量检查"}]}}),
+        ("PUT", "/api/wines/bulk", {"json": {"filter": {"region": "批量检查"}, "changes": {"notes": "plan check"}}}),
+        ("POST", "/api/wines/bulk-delete", {"json": {"filter": {"region": "批量检查"}}}),
+        ("GET", "/api/inventory", {"params": {"page": 2}}),
+        ("GET", "/api/inventory", {"params": {"wine_id": wine}}),
+        ("GET", "/api/inventory", {"params": {"transaction_type": "out"}}),
+        ("GET", "/api/inventory", {"params": {"performed_by": user}}),
+        ("GET", "/api/inventory", {"params": {"start_date": "2025-12-01T00:00:00", "end_date": "2025-12-08T00:00:00"}}),
+        ("GET", "/api/inventory/stream", {"params": {"wine_id": wine}}),
+        ("GET", "/api/inventory/stream", {"params": {"start_date": "2025-12-01T00:00:00", "transaction_type": "in"}}),
+        ("GET", f"/api/inventory/{transaction}", {}),
+        ("GET", f"/api/inventory/wine/{wine}", {}),
+        ("POST", "/api/inventory/in", {"json": {"wine_id": scratch, "quantity": 5}}),
+        ("POST", "/api/inventory/out", {"json": {"wine_id": scratch, "quantity": 1}}),
+        ("POST", "/api/inventory/batch", {"json": {"lines": [
+            {"wine_id": scratch, "transaction_type": "in", "quantity": 2},
+            {"wine_id": wine, "transaction_type": "in", "quantity": 1},
+        ]}}),
+        ("GET", "/api/dashboard/summary", {}),
+        ("GET", "/api/dashboard/trends", {"params": {"days": 30}}),
+        ("GET", "/api/dashboard/distribution/region", {}),
+        ("GET", "/api/dashboard/distribution/variety", {}),
+        ("GET", "/api/dashboard/alerts", {}),
+        ("GET", "/api/users", {"params": {"search": "员工", "role": "user", "is_active": True}}),
+        ("POST", "/api/users", {"json": {"email": "plan-check@wine.test", "name": "检查", "password": "password123"}}),
+        ("GET", f"/api/users/{user}", {}),
+        ("PUT", f"/api/users/{user}", {"json": {"name": "员工"}}),
+        ("PUT", f"/api/users/{user}/status", {}),
+        ("DELETE", "/api/users/{created_user}", {}),
+        ("GET", "/api/logs", {"params": {"page": 2}}),
+        ("GET", "/api/logs", {"params": {"user_id": user}}),
+        ("GET", "/api/logs", {"params": {"action_type": "stock_out"}}),
+        ("GET", "/api/logs", {"params": {"entity_type": "wine"}}),
+        ("GET", "/api/logs", {"params": {"start_date": "2025-12-01", "end_date": "2025-12-08"}}),
+        ("GET", f"/api/logs/{log}", {}),
+        ("GET", "/api/export/wines", {}),
+        ("GET", "/api/export/transactions", {"params": {"start_date": "2025-12-01", "transaction_type": "in"}}),
+        ("POST", "/api/import/wines", {"files": {"file": ("check.csv", b"name,vintage_year,region\nPlan check,2020,Check\n", "text/csv")}}),
+        ("DELETE", f"/api/wines/{scratch}", {}),
+        ("POST", "/api/auth/logout", {}),
+        ("POST", "/api/auth/login", {"json": {"email": "admin@wine.com", "password": "admin123"}}),
+    ]
+
+
+def allowed(route: str, table: str, statement: str) -> bool:
+    return any(
+        route == allowed_route and table == allowed_table and re.search(pattern, statement)
+        for allowed_route, allowed_table, pattern in ALLOWED_FULL_SCANS
+    )
+
+
+def _route_for(app, method: str, url: str) -> str:
+    """Route template that serves a request, e.g. ``GET /api/wines/{wine_id}``"""
+    from starlette.routing import Match
+
+    scope = {"type": "http", "path": url.split("?")[0], "method": method}
+    for route in app.routes:
+        if route.matches(scope)[0] == Match.FULL:
+            return f"{method} {route.path}"
+    return f"{method} {url}"
+
+
+def check(verbose: bool) -> int:
+    from fastapi.testclient import TestClient
+
+    from main import app
+    from query_debug import detect_queries
+
+    violations, exercised, statements = [], set(), 0
+    with TestClient(app) as client:
+        response = client.post("/api/auth/login", json={"email": "admin@wine.com", "password": "admin123"})
+        response.raise_for_status()
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        def first_id(url: str, **params) -> int:
+            response = client.get(url, headers=headers, params=dict(params, page_size=1))
+            response.raise_for_status()
+            return response.json()["items"][0]["id"]
+
+        ids = {
+            "wine": first_id("/api/wines", sort_by="current_stock", sort_order="desc"),
+            "user": first_id("/api/users", role="user"),
+            "transaction": first_id("/api/inventory"),
+            "log": first_id("/api/logs"),
+        }
+        response = client.post(
+            "/api/wines", headers=headers, json={"name": "计划检查", "vintage_year": 2020, "region": "检查"}
+        )
+        response.raise_for_status()
+        ids["scratch"] = response.json()["id"]
+
+        for method, url, kwargs in requests_to_run(ids):
+            if "{created_user}" in url:
+                created = client.get("/api/users", headers=headers, params={"search": "plan-check"}).json()["items"]
+                url = url.replace("{created_user}", str(created[0]["id"]) if created else "0")
+            with detect_queries() as report:
+                response = client.request(method, url, headers=headers, **kwargs)
+            expected = EXPECTED_ERRORS.get((method, url))
+            if (response.status_code != expected) if expected else (response.status_code >= 400):
+                violations.append(f"{method} {url}: HTTP {response.status_code} {response.text[:200]}")
+                continue
+            report.analyze()
+
+            route = _route_for(app, method, url)
+            exercised.add(route)
+            statements += len(report.statements)
+            for fingerprint, plan in report.full_scans:
+                for table in (m.group(1) for m in map(_FULL_SCAN.match, plan) if m):
+                    if table not in WATCHED_TABLES:
+                        continue
+                    if allowed(route, table, fingerprint):
+                        if verbose:
+                            print(f"  allowed  {route}: SCAN {table}")
+                        continue
+                    violations.append(
+                        f"{route} ({url}): full scan of {table}\n"
+                        f"    plan: {'; '.join(plan)}\n"
+                        f"    {fingerprint}"
+                    )
+            if verbose:
+                print(f"  {response.status_code} {method} {url}: {len(report.statements)} statements")
+
+    api_routes = {
+        f"{method} {route.path}"
+        for route in app.routes if route.path.startswith("/api")
+        for method in getattr(route, "methods", ()) if method != "HEAD"
+    }
+    for route in sorted(api_routes - exercised - UNCHECKED_ROUTES):
+        violations.append(f"{route}: not exercised; add it to requests_to_run() or UNCHECKED_ROUTES")
+
+    print(f"Checked {statements} distinct statements across {len(exercised)} routes")
+    if violations:
+        print(f"\n{len(violations)} problem(s):")
+        for violation in violations:
+            print(f"- {violation}")
+        return 1
+    print("No unexpected full scans")
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Fail on full table scans in router queries")
+    parser.add_argument("--size", default="small", help="generated dataset size (see bench_api.py)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    from bench_api import DATASET_SIZES, ensure_dataset
+    if args.size not in DATASET_SIZES:
+        parser.error(f"unknown size {args.size}")
+
+    workdir = tempfile.mkdtemp(prefix="query-plans-")
+    try:
+        database = os.path.join(workdir, "plans.db")
+        shutil.copyfile(ensure_dataset(args.size, args.seed), database)
+        # The engine binds at import time, so point it at the copy before importing the app
+        os.environ["DATABASE_URL"] = f"sqlite:///{database}"
+        os.environ.setdefault("SLOW_REQUEST_MS", "60000")
+        # Cached reads would skip the very queries being checked
+        os.environ.setdefault("CACHE_TTL_SECONDS", "0")
+        return check(args.verbose)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,19 +1,150 @@
-from sqlalchemy import create_engine
+import os
+from fastapi import Request
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.schema import CreateColumn
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./wine_inventory.db"
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./wine_inventory.db")
+# Sync endpoints and dependencies run on the 40-thread anyio pool; a smaller
+# connection pool lets threads waiting for a connection starve the requests
+# holding one of the threads they need to finish
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "40"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+# GET requests get read-only connections from a separate pool (see get_db)
+DB_READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", "40"))
+DB_READ_MAX_OVERFLOW = int(os.getenv("DB_READ_MAX_OVERFLOW", "10"))
+# Multi-process deployments (serve.py) set SQLITE_JOURNAL_MODE=wal so readers
+# in one worker don't block writers in another
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
 
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL,
-    connect_args={"check_same_thread": False}
+    connect_args={"check_same_thread": False},
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW
 )
 
+
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragma(dbapi_connection, connection_record):
+    # SQLite only enforces foreign keys (and ON DELETE CASCADE) when asked to
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    # Only applies to a database file that has no tables yet; maintenance.py
+    # converts existing ones and reclaims free pages with incremental_vacuum
+    cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    if SQLITE_JOURNAL_MODE:
+        cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+        if SQLITE_JOURNAL_MODE.lower() == "wal":
+            # Durable across application crashes; only an OS crash can lose the last commits
+            cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+
+# Used only by write_queue's single writer thread. pysqlite's implicit
+# transactions break SAVEPOINT, so the writer opens its own with BEGIN
+# IMMEDIATE, which also takes the write lock up front instead of failing to
+# upgrade a read transaction
+writer_engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    pool_size=1,
+    max_overflow=0
+)
+event.listen(writer_engine, "connect", _set_sqlite_pragma)
+
+
+@event.listens_for(writer_engine, "connect")
+def _disable_pysqlite_transactions(dbapi_connection, connection_record):
+    dbapi_connection.isolation_level = None
+
+
+@event.listens_for(writer_engine, "begin")
+def _begin_immediate(conn):
+    conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+def _read_only_url(url: str) -> str:
+    """The same database file opened with mode=ro"""
+    database = make_url(url).database
+    if not database or database == ":memory:" or database.startswith("file:"):
+        return url
+    return f"sqlite:///file:{os.path.abspath(database)}?mode=ro&uri=true"
+
+
+read_engine = create_engine(
+    _read_only_url(SQLALCHEMY_DATABASE_URL),
+    connect_args={"check_same_thread": False},
+    pool_size=DB_READ_POOL_SIZE,
+    max_overflow=DB_READ_MAX_OVERFLOW
+)
+
+
+@event.listens_for(read_engine, "connect")
+def _set_read_only_pragma(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    # Also covers in-memory and URI databases, which are opened without mode=ro
+    cursor.execute("PRAGMA query_only=ON")
+    cursor.close()
+
+
+# Every engine that runs request SQL, for instrumentation listeners
+all_engines = (engine, read_engine, writer_engine)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+READ_METHODS = {"GET", "HEAD"}
 
 Base = declarative_base()
 
-def get_db():
+
+def add_missing_columns():
+    """Add columns declared on models that an existing database's tables lack
+
+    SQLite only adds a NOT NULL column that has a default, so such columns
+    declare a server_default.
+    """
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            definition = CreateColumn(column).compile(dialect=engine.dialect)
+            try:
+                with engine.begin() as conn:
+                    conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {definition}")
+            except OperationalError as e:
+                # Another worker starting at the same time got there first
+                if "duplicate column" not in str(e.orig):
+                    raise
+
+
+def create_missing_indexes():
+    """Create indexes declared on models that an existing database lacks"""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
+def get_db(request: Request):
+    """Read-only session for GET/HEAD requests, read/write session otherwise"""
+    db = ReadSessionLocal() if request.method in READ_METHODS else SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def get_write_db():
+    """Read/write session for the few GET routes that also write (e.g. export audit logs)"""
     db = SessionLocal()
     try:
         yield db
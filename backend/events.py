@@ -0,0 +1,171 @@
+"""In-process broadcaster for live dashboard and alert updates.
+
+Write paths call ``publish()`` after they commit. Changes are coalesced over a
+short window, the new state is computed once, and only the parts that changed
+are fanned out to every subscribed client.
+"""
+
+import asyncio
+import json
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Set
+
+from starlette.concurrency import run_in_threadpool
+
+from database import ReadSessionLocal
+from models import Wine
+
+EVENTS_COALESCE_SECONDS = float(os.getenv("EVENTS_COALESCE_SECONDS", "0.5"))
+EVENTS_KEEPALIVE_SECONDS = float(os.getenv("EVENTS_KEEPALIVE_SECONDS", "15"))
+EVENTS_QUEUE_SIZE = 100
+
+
+def format_sse(event: str, data: dict) -> str:
+    """Format a server-sent event frame"""
+    payload = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+class EventBroadcaster:
+    """Coalesces change notifications and fans out computed events"""
+
+    def __init__(self, window: float = EVENTS_COALESCE_SECONDS):
+        self.window = window
+        self._lock = threading.Lock()
+        self._pending_wines: Set[int] = set()
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._last: Dict[str, dict] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start the coalescing loop on the running event loop"""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the coalescing loop"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        self._loop = None
+
+    def publish(self, wine_ids: Iterable[int] = ()):
+        """Record a change; safe to call from threadpool request handlers"""
+        with self._lock:
+            self._pending_wines.update(wine_ids)
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._wakeup.set)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    async def subscribe(self) -> asyncio.Queue:
+        """Register a client queue primed with the latest known state"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=EVENTS_QUEUE_SIZE)
+        if not self._last:
+            self._last = await run_in_threadpool(self._compute_state)
+        for event in ("summary", "alerts"):
+            queue.put_nowait(format_sse(event, self._last[event]))
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def is_subscribed(self, queue: asyncio.Queue) -> bool:
+        return queue in self._subscribers
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            await asyncio.sleep(self.window)
+            self._wakeup.clear()
+
+            with self._lock:
+                wine_ids = self._pending_wines
+                self._pending_wines = set()
+
+            if not self._subscribers:
+                # Nobody is listening; the next subscriber recomputes
+                self._last = {}
+                continue
+
+            try:
+                messages = await run_in_threadpool(self._compute_changes, wine_ids)
+            except Exception as e:
+                print(f"[EVENTS] Failed to compute events: {e}")
+                continue
+
+            for queue in list(self._subscribers):
+                for message in messages:
+                    try:
+                        queue.put_nowait(message)
+                    except asyncio.QueueFull:
+                        # Slow client; drop it rather than buffering forever
+                        self._subscribers.discard(queue)
+                        break
+
+    def _compute_state(self) -> Dict[str, dict]:
+        from routers.dashboard import build_summary, count_alerts
+
+        db = ReadSessionLocal()
+        try:
+            return {
+                "summary": build_summary(db).model_dump(),
+                "alerts": {"low_stock_count": count_alerts(db)},
+            }
+        finally:
+            db.close()
+
+    def _compute_stock(self, wine_ids: Set[int]) -> List[dict]:
+        db = ReadSessionLocal()
+        try:
+            rows = db.query(
+                Wine.id, Wine.current_stock, Wine.low_stock_threshold
+            ).filter(Wine.id.in_(wine_ids)).all()
+        finally:
+            db.close()
+
+        found = {r.id: r for r in rows}
+        items = []
+        for wine_id in sorted(wine_ids):
+            row = found.get(wine_id)
+            if row is None:
+                items.append({"id": wine_id, "deleted": True})
+            else:
+                items.append({
+                    "id": wine_id,
+                    "current_stock": row.current_stock,
+                    "low_stock": row.current_stock <= row.low_stock_threshold,
+                })
+        return items
+
+    def _compute_changes(self, wine_ids: Set[int]) -> List[str]:
+        messages = []
+        if wine_ids:
+            messages.append(format_sse("stock", {"wines": self._compute_stock(wine_ids)}))
+
+        state = self._compute_state()
+        for event, data in state.items():
+            if self._last.get(event) != data:
+                messages.append(format_sse(event, data))
+        self._last = state
+        return messages
+
+
+broadcaster = EventBroadcaster()
+
+
+def publish(wine_ids: Iterable[int] = ()):
+    """Notify live clients that stock or catalogue data changed"""
+    broadcaster.publish(wine_ids)
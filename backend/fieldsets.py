@@ -0,0 +1,59 @@
+"""Sparse fieldsets: ``?fields=id,name,current_stock`` on read endpoints.
+
+A request names the response fields it needs. Only the matching columns are
+selected, and rows are serialized through a model holding just those fields,
+built once per field combination and cached. ``id`` is always included.
+"""
+
+from functools import lru_cache
+from typing import List, Optional, Tuple, Type
+
+from pydantic import BaseModel, ConfigDict, create_model
+
+
+class UnknownFields(ValueError):
+    def __init__(self, fields: List[str]):
+        super().__init__(", ".join(fields))
+        self.fields = fields
+
+
+class Fieldsets:
+    """Sparse fieldsets of a response model whose fields are columns of an ORM model"""
+
+    def __init__(self, response_model: Type[BaseModel], orm_model, always: Tuple[str, ...] = ("id",)):
+        self.response_model = response_model
+        self.orm_model = orm_model
+        self.always = always
+        self.model = lru_cache(maxsize=128)(self._model)
+
+    def parse(self, fields: Optional[str]) -> Optional[Tuple[str, ...]]:
+        """Requested fields in response model order, or None for all of them"""
+        if not fields:
+            return None
+        requested = {f.strip() for f in fields.split(",") if f.strip()}
+        unknown = sorted(requested - self.response_model.model_fields.keys())
+        if unknown:
+            raise UnknownFields(unknown)
+        requested.update(self.always)
+        return tuple(f for f in self.response_model.model_fields if f in requested)
+
+    def columns(self, fields: Tuple[str, ...]) -> list:
+        return [getattr(self.orm_model, f) for f in fields]
+
+    def _model(self, fields: Tuple[str, ...]) -> Type[BaseModel]:
+        definitions = {f: (self.response_model.model_fields[f].annotation, self.response_model.model_fields[f])
+                       for f in fields}
+        return create_model(
+            f"{self.response_model.__name__}Fields",
+            __config__=ConfigDict(from_attributes=True),
+            **definitions
+        )
+
+    def list_model(self, fields: Tuple[str, ...], envelope: Type[BaseModel]) -> Type[BaseModel]:
+        """envelope (e.g. a paginated list) with its items narrowed to fields"""
+        return _narrowed_envelope(envelope, self.model(fields))
+
+
+@lru_cache(maxsize=128)
+def _narrowed_envelope(envelope: Type[BaseModel], item: Type[BaseModel]) -> Type[BaseModel]:
+    return create_model(f"{envelope.__name__}Fields", __base__=envelope, items=(List[item], ...))
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""Generate a large synthetic dataset for performance testing.
+
+Fills the database with users, wines, inventory transactions and operation
+logs at configurable volumes. Popularity of regions, suppliers, varieties,
+wines and users follows a Zipf-like skew, and activity grows over time with a
+weekday/weekend pattern, so indexes and query plans behave like they would on
+production data. Rows are written with batched executemany statements in a
+single transaction per table.
+
+The output is fully determined by ``--seed`` and ``--end-date``.
+
+Examples:
+    python generate_dataset.py --wines 1000 --transactions 50000 --logs 20000
+    python generate_dataset.py --database /tmp/big.db --reset \\
+        --wines 300000 --transactions 10000000 --logs 10000000 --seed 7
+"""
+
+import argparse
+import json
+import random
+import time
+from datetime import date, datetime, timedelta
+from itertools import accumulate
+from typing import Iterator, List, Sequence
+
+from sqlalchemy import create_engine, insert
+
+from database import SQLALCHEMY_DATABASE_URL, Base
+from models import User, Wine, InventoryTransaction, OperationLog
+from auth import get_password_hash
+
+REGIONS = [
+    "波尔多", "勃艮第", "纳帕谷", "托斯卡纳", "里奥哈", "香槟", "巴罗萨谷", "罗纳河谷",
+    "门多萨", "皮埃蒙特", "马尔堡", "宁夏贺兰山", "摩泽尔", "杜罗河谷", "卢瓦尔河谷",
+    "索诺玛", "玛格丽特河", "斯泰伦博斯", "中央山谷", "蓬莱", "阿尔萨斯", "西西里",
+]
+VARIETIES = [
+    "赤霞珠", "梅洛", "黑皮诺", "霞多丽", "西拉", "长相思", "丹魄", "桑娇维塞",
+    "马尔贝克", "雷司令", "内比奥罗", "歌海娜", "品丽珠", "蛇龙珠", "仙粉黛", "维欧尼",
+]
+NAME_PREFIXES = ["城堡", "酒庄", "庄园", "珍藏", "特选", "古堡", "山谷", "家族"]
+OUT_REASONS = ["销售出库", "门店调拨", "客户订单", "品鉴活动", "破损报废", None]
+IN_REASONS = ["采购入库", "供应商补货", "退货入库", "调拨入库", None]
+LOG_ACTIONS = [
+    ("login", 30), ("stock_out", 25), ("stock_in", 20), ("update", 10),
+    ("create", 5), ("export", 4), ("logout", 4), ("delete", 1), ("import", 1),
+]
+
+DEFAULT_PASSWORD = "password123"
+ADMIN_EMAIL = "admin@wine.com"
+
+
+def zipf_cum_weights(n: int, s: float = 1.1) -> List[float]:
+    """Cumulative Zipf weights for n ranked items"""
+    return list(accumulate(1.0 / (rank ** s) for rank in range(1, n + 1)))
+
+
+def daily_counts(rng: random.Random, total: int, end_date: date, days: int, growth: float) -> List[int]:
+    """Split total events over days with growth over time and quieter weekends"""
+    start = end_date - timedelta(days=days - 1)
+    weights = []
+    for day in range(days):
+        trend = 1.0 + growth * day / max(days - 1, 1)
+        weekend = 0.4 if (start + timedelta(days=day)).weekday() >= 5 else 1.0
+        weights.append(trend * weekend * rng.uniform(0.8, 1.2))
+    scale = total / sum(weights)
+    counts = [int(w * scale) for w in weights]
+    for i in rng.sample(range(days), total - sum(counts)):
+        counts[i] += 1
+    return counts
+
+
+def timestamps(rng: random.Random, end_date: date, days: int, counts: Sequence[int]) -> Iterator[str]:
+    """Yield sorted timestamps, busier during working hours"""
+    first_day = end_date - timedelta(days=days - 1)
+    for offset, count in enumerate(counts):
+        prefix = (first_day + timedelta(days=offset)).strftime("%Y-%m-%d ")
+        seconds = sorted(
+            int(rng.triangular(6 * 3600, 22 * 3600, 14 * 3600)) if rng.random() < 0.9
+            else rng.randrange(86400)
+            for _ in range(count)
+        )
+        for s in seconds:
+            yield f"{prefix}{s // 3600:02d}:{s % 3600 // 60:02d}:{s % 60:02d}"
+
+
+class BulkWriter:
+    """Batched executemany inserts on a raw DBAPI connection"""
+
+    def __init__(self, connection, dialect, table, columns: Sequence[str], batch_size: int):
+        self.sql = str(insert(table).compile(dialect=dialect, column_keys=list(columns)))
+        self.connection = connection
+        self.batch_size = batch_size
+        self.rows: List[tuple] = []
+        self.count = 0
+
+    def add(self, row: tuple):
+        self.rows.append(row)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            self.connection.cursor().executemany(self.sql, self.rows)
+            self.count += len(self.rows)
+            self.rows = []
+
+
+def progress(label: str, done: int, total: int, started: float):
+    if total and (done == total or done % 500000 == 0):
+        rate = done / max(time.perf_counter() - started, 1e-9)
+        print(f"  {label}: {done:,}/{total:,} ({rate:,.0f} rows/s)", flush=True)
+
+
+def generate(args):
+    rng = random.Random(args.seed)
+    url = f"sqlite:///{args.database}" if args.database else SQLALCHEMY_DATABASE_URL
+    engine = create_engine(url)
+
+    if args.reset:
+        Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+    end_date = date.fromisoformat(args.end_date) if args.end_date else date.today()
+    period_start = datetime.combine(end_date - timedelta(days=args.days - 1), datetime.min.time())
+
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        # Bulk-load settings for this connection only
+        cursor.execute("PRAGMA synchronous=OFF")
+        cursor.execute("PRAGMA cache_size=-262144")
+        cursor.execute("PRAGMA foreign_keys=OFF")
+
+        def next_id(table: str) -> int:
+            return (cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]) + 1
+
+        # Users: keep an existing admin, add warehouse staff and managers
+        started = time.perf_counter()
+        password_hash = get_password_hash(DEFAULT_PASSWORD)
+        first_user = next_id("users")
+        users = BulkWriter(raw, engine.dialect, User.__table__, ["id", "email", "password_hash", "name", "role", "is_active", "created_at", "updated_at"], args.batch_size)
+        if cursor.execute("SELECT 1 FROM users WHERE email = ?", (ADMIN_EMAIL,)).fetchone() is None:
+            stamp = period_start.strftime("%Y-%m-%d %H:%M:%S")
+            users.add((first_user, ADMIN_EMAIL, get_password_hash("admin123"), "系统管理员", "admin", 1, stamp, stamp))
+            first_user += 1
+        for i in range(args.users):
+            user_id = first_user + i
+            stamp = (period_start + timedelta(seconds=rng.randrange(args.days * 86400))).strftime("%Y-%m-%d %H:%M:%S")
+            role = "admin" if i % 20 == 0 else "user"
+            users.add((user_id, f"user{user_id}@wine.test", password_hash, f"员工{user_id:05d}", role, 1, stamp, stamp))
+        users.flush()
+        user_ids = [first_user + i for i in range(args.users)] or [1]
+        user_cum = zipf_cum_weights(len(user_ids), 0.8)
+        print(f"Users: {users.count:,} in {time.perf_counter() - started:.1f}s")
+
+        # Wines: skewed regions, varieties and suppliers
+        started = time.perf_counter()
+        first_wine = next_id("wines")
+        suppliers = [f"{rng.choice(REGIONS)}{rng.choice(['贸易', '酒业', '进口', '供应链'])}公司{i:03d}" for i in range(args.suppliers)]
+        locations = [f"{zone}区-{shelf:02d}架" for zone in "ABCDEFGH" for shelf in range(1, 21)]
+        region_cum = zipf_cum_weights(len(REGIONS))
+        variety_cum = zipf_cum_weights(len(VARIETIES))
+        supplier_cum = zipf_cum_weights(len(suppliers))
+        wines = BulkWriter(raw, engine.dialect, Wine.__table__, [
+            "id", "name", "vintage_year", "region", "grape_variety", "price", "supplier",
+            "storage_location", "current_stock", "low_stock_threshold", "notes", "created_by",
+            "created_at", "updated_at"
+        ], args.batch_size)
+        for i in range(args.wines):
+            wine_id = first_wine + i
+            region = rng.choices(REGIONS, cum_weights=region_cum)[0]
+            variety = rng.choices(VARIETIES, cum_weights=variety_cum)[0]
+            stamp = (period_start + timedelta(seconds=rng.randrange(args.days * 86400) // 4)).strftime("%Y-%m-%d %H:%M:%S")
+            wines.add((
+                wine_id,
+                f"{region}{rng.choice(NAME_PREFIXES)}{variety} {wine_id}",
+                rng.randint(1985, end_date.year - 1),
+                region,
+                variety if rng.random() < 0.95 else None,
+                round(rng.lognormvariate(5.3, 0.8), 2),
+                rng.choices(suppliers, cum_weights=supplier_cum)[0] if rng.random() < 0.9 else None,
+                rng.choice(locations),
+                0,
+                rng.choice((5, 10, 10, 12, 20, 24)),
+                f"{variety}风味，适合搭配{rng.choice(['红肉', '奶酪', '海鲜', '家禽', '甜点'])}" if rng.random() < 0.3 else None,
+                rng.choice(user_ids),
+                stamp,
+                stamp
+            ))
+            progress("wines", i + 1, args.wines, started)
+        wines.flush()
+        raw.commit()
+        wine_ids = list(range(first_wine, first_wine + args.wines))
+        print(f"Wines: {wines.count:,} in {time.perf_counter() - started:.1f}s")
+
+        # Transactions: popular wines move much more often; outs never exceed stock
+        if wine_ids and args.transactions:
+            started = time.perf_counter()
+            popularity = wine_ids[:]
+            rng.shuffle(popularity)
+            wine_cum = zipf_cum_weights(len(popularity), 1.05)
+            stock = dict.fromkeys(wine_ids, 0)
+            transactions = BulkWriter(raw, engine.dialect, InventoryTransaction.__table__, [
+                "wine_id", "transaction_type", "quantity", "reason", "performed_by", "created_at"
+            ], args.batch_size)
+            counts = daily_counts(rng, args.transactions, end_date, args.days, args.growth)
+            chunk: List[int] = []
+            for done, stamp in enumerate(timestamps(rng, end_date, args.days, counts), start=1):
+                if not chunk:
+                    chunk = rng.choices(popularity, cum_weights=wine_cum, k=10000)
+                wine_id = chunk.pop()
+                quantity = max(1, int(rng.expovariate(1 / 6)))
+                if rng.random() < 0.55 and stock[wine_id] >= quantity:
+                    stock[wine_id] -= quantity
+                    row = (wine_id, "out", quantity, rng.choice(OUT_REASONS))
+                else:
+                    quantity *= rng.choice((1, 2, 6, 12))
+                    stock[wine_id] += quantity
+                    row = (wine_id, "in", quantity, rng.choice(IN_REASONS))
+                transactions.add(row + (rng.choices(user_ids, cum_weights=user_cum)[0], stamp))
+                progress("transactions", done, args.transactions, started)
+            transactions.flush()
+            cursor.executemany(
+                "UPDATE wines SET current_stock = ? WHERE id = ?",
+                ((quantity, wine_id) for wine_id, quantity in stock.items() if quantity)
+            )
+            raw.commit()
+            print(f"Transactions: {transactions.count:,} in {time.perf_counter() - started:.1f}s")
+
+        # Operation logs: the same action mix the application records
+        if args.logs:
+            started = time.perf_counter()
+            actions = [a for a, _ in LOG_ACTIONS]
+            action_cum = list(accumulate(w for _, w in LOG_ACTIONS))
+            logs = BulkWriter(raw, engine.dialect, OperationLog.__table__, [
+                "user_id", "action_type", "entity_type", "entity_id", "details", "ip_address", "created_at"
+            ], args.batch_size)
+            counts = daily_counts(rng, args.logs, end_date, args.days, args.growth)
+            for done, stamp in enumerate(timestamps(rng, end_date, args.days, counts), start=1):
+                user_id = rng.choices(user_ids, cum_weights=user_cum)[0]
+                action = rng.choices(actions, cum_weights=action_cum)[0]
+                ip = f"10.0.{user_id % 256}.{rng.randrange(2, 255)}"
+                if action in ("login", "logout"):
+                    row = (user_id, action, "user", user_id, json.dumps({"email": f"user{user_id}@wine.test"}), ip, stamp)
+                elif action in ("export", "import"):
+                    details = {"count": rng.randrange(1, 5000), "format": "csv"} if action == "export" else {"created": rng.randrange(1, 500), "errors": 0}
+                    row = (user_id, action, "wine", None, json.dumps(details), ip, stamp)
+                else:
+                    wine_id = rng.choice(wine_ids) if wine_ids else None
+                    quantity = max(1, int(rng.expovariate(1 / 6)))
+                    details = {"quantity": quantity} if action.startswith("stock") else {"name": f"wine {wine_id}"}
+                    row = (user_id, action, "wine", wine_id, json.dumps(details, ensure_ascii=False), ip, stamp)
+                logs.add(row)
+                progress("logs", done, args.logs, started)
+            logs.flush()
+            raw.commit()
+            print(f"Operation logs: {logs.count:,} in {time.perf_counter() - started:.1f}s")
+
+        cursor.execute("ANALYZE")
+        raw.commit()
+    finally:
+        raw.close()
+        engine.dispose()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic wine inventory dataset")
+    parser.add_argument("--database", help="SQLite file to fill (default: the application database)")
+    parser.add_argument("--reset", action="store_true", help="drop and recreate all tables first")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--wines", type=int, default=10000)
+    parser.add_argument("--suppliers", type=int, default=300)
+    parser.add_argument("--transactions", type=int, default=500000)
+    parser.add_argument("--logs", type=int, default=500000)
+    parser.add_argument("--days", type=int, default=3 * 365, help="length of the simulated history")
+    parser.add_argument("--end-date", help="last day of history, YYYY-MM-DD (default: today)")
+    parser.add_argument("--growth", type=float, default=2.0, help="activity growth over the period (2.0 = 3x by the end)")
+    parser.add_argument("--batch-size", type=int, default=20000)
+    args = parser.parse_args(argv)
+
+    if args.days < 1 or args.wines < 0 or args.transactions < 0 or args.logs < 0:
+        parser.error("volumes must be non-negative and --days at least 1")
+
+    started = time.perf_counter()
+    generate(args)
+    print(f"Done in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
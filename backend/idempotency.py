@@ -0,0 +1,249 @@
+"""Idempotency-Key support for inventory and wine write endpoints.
+
+A client sends ``Idempotency-Key: <unique value>`` with a write request. The
+first request claims the key and its response is stored; a retry with the same
+key and body replays the stored response instead of applying the write again.
+
+While the first request runs, its claim holds a lease of
+``IDEMPOTENCY_LOCK_SECONDS`` and a retry gets 409. The claim is released when
+the request fails, is cancelled (client disconnect) or its response can't be
+stored; if the worker dies before it can release it, a retry takes the claim
+over once the lease runs out. The lease must outlast the slowest write, or a
+retry could run alongside it.
+"""
+
+import hashlib
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import anyio
+from fastapi import Request, status
+from fastapi.responses import JSONResponse, Response
+from sqlalchemy.exc import IntegrityError
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from auth import get_user_id_from_authorization
+from database import SessionLocal
+from models import IdempotencyKey
+from scheduler import ScheduledTask, scheduler
+
+logger = logging.getLogger("wine_inventory.idempotency")
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+IDEMPOTENCY_TTL_HOURS = int(os.getenv("IDEMPOTENCY_TTL_HOURS", "24"))
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "60"))
+IDEMPOTENCY_PURGE_INTERVAL_SECONDS = 600
+IDEMPOTENT_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+IDEMPOTENT_PATH_PREFIXES = ("/api/inventory", "/api/wines", "/api/import/wines")
+MAX_KEY_LENGTH = 255
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _delete_expired(db, now: datetime) -> int:
+    deleted = db.query(IdempotencyKey).filter(
+        IdempotencyKey.expires_at < now
+    ).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+
+def purge_expired_keys() -> int:
+    """Delete expired idempotency keys"""
+    db = SessionLocal()
+    try:
+        return _delete_expired(db, _utcnow())
+    finally:
+        db.close()
+
+
+scheduler.add(ScheduledTask(
+    "purge_idempotency_keys", purge_expired_keys, interval=IDEMPOTENCY_PURGE_INTERVAL_SECONDS, jitter=30, timeout=60
+))
+
+
+def _request_hash(method: str, path: str, body: bytes) -> str:
+    return hashlib.sha256(method.encode() + b" " + path.encode() + b"\n" + body).hexdigest()
+
+
+def _claim_key(user_id: int, key: str, method: str, path: str, request_hash: str, lease: datetime):
+    """Claim a key until lease, or return the existing record if it was already used"""
+    db = SessionLocal()
+    try:
+        now = _utcnow()
+        record = db.query(IdempotencyKey).filter(
+            IdempotencyKey.user_id == user_id,
+            IdempotencyKey.key == key
+        ).first()
+        if record is not None and record.expires_at >= now:
+            abandoned = (
+                record.status_code is None
+                and record.request_hash == request_hash
+                and (record.locked_until is None or record.locked_until < now)
+            )
+            if not abandoned:
+                db.expunge(record)
+                return record
+            # The request that claimed it died without releasing it; guarded so
+            # only one of several concurrent retries takes it over
+            taken = db.query(IdempotencyKey).filter(
+                IdempotencyKey.id == record.id,
+                IdempotencyKey.status_code.is_(None),
+                IdempotencyKey.locked_until == record.locked_until
+            ).update({"locked_until": lease}, synchronize_session=False)
+            db.commit()
+            if taken:
+                return None
+            db.refresh(record)
+            db.expunge(record)
+            return record
+        if record is not None:
+            db.delete(record)
+            db.flush()
+
+        db.add(IdempotencyKey(
+            user_id=user_id,
+            key=key,
+            method=method,
+            path=path,
+            request_hash=request_hash,
+            locked_until=lease,
+            expires_at=now + timedelta(hours=IDEMPOTENCY_TTL_HOURS)
+        ))
+        try:
+            db.commit()
+        except IntegrityError:
+            # Lost a race with a concurrent request using the same key
+            db.rollback()
+            record = db.query(IdempotencyKey).filter(
+                IdempotencyKey.user_id == user_id,
+                IdempotencyKey.key == key
+            ).first()
+            if record is not None:
+                db.expunge(record)
+            return record
+        return None
+    finally:
+        db.close()
+
+
+def _held(user_id: int, key: str, lease: datetime):
+    """Filter for a claim still held under lease (not taken over after it ran out)"""
+    return (
+        IdempotencyKey.user_id == user_id,
+        IdempotencyKey.key == key,
+        IdempotencyKey.status_code.is_(None),
+        IdempotencyKey.locked_until == lease
+    )
+
+
+def _store_response(
+    user_id: int, key: str, lease: datetime, status_code: int, body: bytes, content_type: Optional[str]
+) -> bool:
+    db = SessionLocal()
+    try:
+        stored = db.query(IdempotencyKey).filter(*_held(user_id, key, lease)).update({
+            "status_code": status_code,
+            "response_body": body.decode("utf-8"),
+            "content_type": content_type,
+            "locked_until": None
+        }, synchronize_session=False)
+        db.commit()
+        return bool(stored)
+    finally:
+        db.close()
+
+
+def _release_key(user_id: int, key: str, lease: datetime):
+    db = SessionLocal()
+    try:
+        db.query(IdempotencyKey).filter(*_held(user_id, key, lease)).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+async def _release(user_id: int, key: str, lease: datetime):
+    """Release a claim so the client can retry, even while the request is being cancelled"""
+    with anyio.CancelScope(shield=True):
+        try:
+            await run_in_threadpool(_release_key, user_id, key, lease)
+        except Exception as e:
+            # The lease runs out on its own
+            logger.warning("Could not release Idempotency-Key %r: %s", key, e)
+
+
+class IdempotencyMiddleware(BaseHTTPMiddleware):
+    """Replay stored responses for write requests retried with the same key"""
+
+    async def dispatch(self, request: Request, call_next):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if (
+            not key
+            or request.method not in IDEMPOTENT_METHODS
+            or not request.url.path.startswith(IDEMPOTENT_PATH_PREFIXES)
+        ):
+            return await call_next(request)
+
+        if len(key) > MAX_KEY_LENGTH:
+            return JSONResponse(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                content={"detail": "Idempotency-Key 过长"}
+            )
+
+        user_id = get_user_id_from_authorization(request.headers.get("Authorization"))
+        if user_id is None:
+            # Let the endpoint reject the unauthenticated request
+            return await call_next(request)
+
+        body = await request.body()
+        request_hash = _request_hash(request.method, request.url.path, body)
+
+        lease = _utcnow() + timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS)
+        record = await run_in_threadpool(
+            _claim_key, user_id, key, request.method, request.url.path, request_hash, lease
+        )
+        if record is not None:
+            if record.request_hash != request_hash:
+                return JSONResponse(
+                    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    content={"detail": "Idempotency-Key 已用于不同的请求"}
+                )
+            if record.status_code is None:
+                return JSONResponse(
+                    status_code=status.HTTP_409_CONFLICT,
+                    content={"detail": "相同 Idempotency-Key 的请求正在处理中"}
+                )
+            response = Response(
+                content=record.response_body or b"",
+                status_code=record.status_code,
+                media_type=record.content_type
+            )
+            response.headers["Idempotent-Replayed"] = "true"
+            return response
+
+        stored = False
+        try:
+            response = await call_next(request)
+            response_body = b"".join([chunk async for chunk in response.body_iterator])
+            # Server errors are not final; the claim is released so the client can retry
+            if response.status_code < 500:
+                stored = await run_in_threadpool(
+                    _store_response, user_id, key, lease, response.status_code, response_body,
+                    response.headers.get("content-type")
+                )
+        finally:
+            # Also on cancellation (a BaseException) and when storing failed
+            if not stored:
+                await _release(user_id, key, lease)
+
+        return Response(
+            content=response_body,
+            status_code=response.status_code,
+            headers=dict(response.headers)
+        )
@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+"""Concurrent load generator with weighted, persona-based workloads.
+
+Simulates many users against a running server. Each virtual user belongs to a
+persona (warehouse staff scanning stock, managers browsing dashboards, someone
+pulling exports) that picks weighted actions with think time in between; a
+scenario mixes personas. Users are added in stages (``--users 10,50,100,200``)
+and every stage reports throughput, latency percentiles and errors by kind,
+with SQLite lock errors (503 from the API) counted separately. The saturation
+point is the first stage where throughput stops growing, the p95 target is
+missed or server errors exceed ``--max-error-rate``.
+
+Examples:
+    uvicorn main:app --port 8000 &
+    python loadgen.py --scenario mixed --users 10,50,100,200 --stage-seconds 30
+    python loadgen.py --scenario stock-burst --users 20,40,80 --output bench_results/load.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import httpx
+
+ADMIN_EMAIL = "admin@wine.com"
+ADMIN_PASSWORD = "admin123"
+
+# Persona -> think time range (seconds) and weighted actions
+PERSONAS = {
+    "warehouse": {
+        "think": (0.5, 2.0),
+        "actions": {
+            "stock_out": 4, "stock_in": 3, "search_wines": 3, "list_wines": 2,
+            "wine_detail": 2, "login": 0.2,
+        },
+    },
+    "manager": {
+        "think": (2.0, 6.0),
+        "actions": {
+            "dashboard": 5, "list_wines": 2, "inventory_list": 2, "logs": 2,
+            "low_stock": 1, "login": 0.2,
+        },
+    },
+    "reporter": {
+        "think": (5.0, 15.0),
+        "actions": {"export_wines": 1, "export_transactions": 1, "dashboard": 1},
+    },
+    "scanner": {
+        "think": (0.0, 0.05),
+        "actions": {"stock_out": 1, "stock_in": 1},
+    },
+}
+
+# Scenario -> share of virtual users per persona
+SCENARIOS = {
+    "mixed": {"warehouse": 0.75, "manager": 0.2, "reporter": 0.05},
+    "warehouse-rush": {"warehouse": 0.9, "manager": 0.1},
+    "reporting": {"manager": 0.6, "reporter": 0.4},
+    "stock-burst": {"scanner": 1.0},
+}
+
+ERROR_KINDS = ("lock", "server", "client", "timeout", "connection")
+
+
+class Stats:
+    """Latencies and outcomes collected during one stage"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, Dict[str, int]] = {}
+
+    def record(self, action: str, latency: float, kind: Optional[str]):
+        self.latencies.setdefault(action, []).append(latency)
+        if kind is not None:
+            counts = self.errors.setdefault(action, {})
+            counts[kind] = counts.get(kind, 0) + 1
+
+    def summary(self, elapsed: float) -> dict:
+        actions = {}
+        all_latencies = []
+        totals = dict.fromkeys(ERROR_KINDS, 0)
+        for action, latencies in sorted(self.latencies.items()):
+            all_latencies.extend(latencies)
+            errors = self.errors.get(action, {})
+            for kind, count in errors.items():
+                totals[kind] += count
+            actions[action] = dict(percentiles(latencies), requests=len(latencies), errors=errors)
+        requests = len(all_latencies)
+        failed = totals["lock"] + totals["server"] + totals["timeout"] + totals["connection"]
+        return {
+            "requests": requests,
+            "throughput_rps": round(requests / elapsed, 2) if elapsed else 0.0,
+            "error_rate": round(failed / requests, 4) if requests else 0.0,
+            "errors": totals,
+            **percentiles(all_latencies),
+            "actions": actions,
+        }
+
+
+def percentiles(latencies: List[float]) -> dict:
+    if not latencies:
+        return {"p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0, "mean_ms": 0.0}
+    ordered = sorted(latencies)
+    pick = lambda pct: ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+    return {
+        "p50_ms": round(pick(50) * 1000, 2),
+        "p95_ms": round(pick(95) * 1000, 2),
+        "p99_ms": round(pick(99) * 1000, 2),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 2),
+    }
+
+
+def error_kind(response: httpx.Response) -> Optional[str]:
+    if response.status_code == 503:
+        return "lock"
+    if response.status_code >= 500:
+        return "server"
+    if response.status_code >= 400:
+        return "client"
+    return None
+
+
+class Workload:
+    """Shared lookup data the actions draw from"""
+
+    def __init__(self, wine_ids: List[int], terms: List[str], email: str, password: str):
+        self.wine_ids = wine_ids
+        # Popular wines get most of the traffic
+        self.weights = [1 / (rank + 1) for rank in range(len(wine_ids))]
+        self.terms = terms
+        self.email = email
+        self.password = password
+
+    def wine_id(self) -> int:
+        return random.choices(self.wine_ids, self.weights)[0]
+
+
+class LoadRun:
+    """State shared by all virtual users; stats are swapped at each stage boundary"""
+
+    def __init__(self):
+        self.stats = Stats()
+        self.in_flight = 0
+        self.stop = asyncio.Event()
+
+
+class VirtualUser:
+    def __init__(self, client: httpx.AsyncClient, workload: Workload, persona: str):
+        self.client = client
+        self.workload = workload
+        self.persona = PERSONAS[persona]
+        self.actions = list(self.persona["actions"])
+        self.weights = list(self.persona["actions"].values())
+        self.headers: Dict[str, str] = {}
+        self.ready = asyncio.Event()
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        return await self.client.request(method, url, headers=self.headers, **kwargs)
+
+    async def login(self):
+        response = await self.client.post(
+            "/api/auth/login", json={"email": self.workload.email, "password": self.workload.password}
+        )
+        if response.status_code == 200:
+            self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        return response
+
+    async def list_wines(self):
+        return await self.request("GET", "/api/wines", params={"page": random.randint(1, 5), "page_size": 20})
+
+    async def search_wines(self):
+        return await self.request("GET", "/api/wines", params={"search": random.choice(self.workload.terms), "page_size": 20})
+
+    async def wine_detail(self):
+        return await self.request("GET", f"/api/wines/{self.workload.wine_id()}")
+
+    async def low_stock(self):
+        return await self.request("GET", "/api/wines/low-stock")
+
+    async def stock_in(self):
+        payload = {"wine_id": self.workload.wine_id(), "quantity": random.randint(1, 12), "reason": "采购入库"}
+        return await self.request("POST", "/api/inventory/in", json=payload)
+
+    async def stock_out(self):
+        payload = {"wine_id": self.workload.wine_id(), "quantity": random.randint(1, 3), "reason": "销售出库"}
+        return await self.request("POST", "/api/inventory/out", json=payload)
+
+    async def inventory_list(self):
+        return await self.request("GET", "/api/inventory", params={"page": 1, "page_size": 20})
+
+    async def logs(self):
+        return await self.request("GET", "/api/logs", params={"page": 1, "page_size": 20})
+
+    async def dashboard(self):
+        # The dashboard page loads these together
+        responses = await asyncio.gather(
+            self.request("GET", "/api/dashboard/summary"),
+            self.request("GET", "/api/dashboard/trends", params={"days": 30}),
+            self.request("GET", "/api/dashboard/alerts"),
+        )
+        return max(responses, key=lambda r: r.status_code)
+
+    async def export_wines(self):
+        return await self.request("GET", "/api/export/wines")
+
+    async def export_transactions(self):
+        start = (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d")
+        return await self.request("GET", "/api/export/transactions", params={"start_date": start})
+
+    async def run(self, load: LoadRun):
+        try:
+            await self.login()
+        finally:
+            self.ready.set()
+        low, high = self.persona["think"]
+        while not load.stop.is_set():
+            action = random.choices(self.actions, self.weights)[0]
+            load.in_flight += 1
+            started = time.perf_counter()
+            try:
+                response = await getattr(self, action)()
+                kind = error_kind(response)
+            except httpx.TimeoutException:
+                kind = "timeout"
+            except httpx.TransportError:
+                kind = "connection"
+            finally:
+                load.in_flight -= 1
+            load.stats.record(action, time.perf_counter() - started, kind)
+            if high:
+                try:
+                    await asyncio.wait_for(load.stop.wait(), random.uniform(low, high))
+                except asyncio.TimeoutError:
+                    pass
+
+
+async def prepare(client: httpx.AsyncClient, email: str, password: str) -> Workload:
+    response = await client.post("/api/auth/login", json={"email": email, "password": password})
+    response.raise_for_status()
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    wine_ids = []
+    for page in range(1, 6):
+        response = await client.get(
+            "/api/wines", headers=headers,
+            params={"page": page, "page_size": 100, "sort_by": "current_stock", "sort_order": "desc"}
+        )
+        response.raise_for_status()
+        wine_ids += [wine["id"] for wine in response.json()["items"]]
+    if not wine_ids:
+        raise SystemExit("No wines on the target server; seed it first (e.g. generate_dataset.py)")
+
+    terms = []
+    for lookup in ("regions", "varieties"):
+        response = await client.get(f"/api/wines/{lookup}", headers=headers)
+        response.raise_for_status()
+        terms += [term for term in response.json() if term][:20]
+    return Workload(wine_ids, terms or ["a"], email, password)
+
+
+def assign_personas(scenario: Dict[str, float], count: int) -> List[str]:
+    """Deterministic persona for the n-th virtual user, keeping the scenario's shares at any count"""
+    assigned = {name: 0 for name in scenario}
+    personas = []
+    for n in range(1, count + 1):
+        name = max(scenario, key=lambda p: scenario[p] * n - assigned[p])
+        assigned[name] += 1
+        personas.append(name)
+    return personas
+
+
+def find_saturation(stages: List[dict], slo_p95_ms: float, max_error_rate: float) -> Optional[dict]:
+    previous = None
+    for stage in stages:
+        reasons = []
+        if stage["p95_ms"] > slo_p95_ms:
+            reasons.append(f"p95 {stage['p95_ms']:.0f} ms > {slo_p95_ms:.0f} ms")
+        if stage["in_flight"] >= stage["users"] and stage["requests"] == 0:
+            reasons.append(f"no request completed, {stage['in_flight']} stuck in flight")
+        if stage["error_rate"] > max_error_rate:
+            reasons.append(f"error rate {stage['error_rate']:.1%} > {max_error_rate:.1%}")
+        if previous is not None:
+            user_growth = stage["users"] / previous["users"] - 1
+            rps_growth = stage["throughput_rps"] / previous["throughput_rps"] - 1 if previous["throughput_rps"] else 0
+            if user_growth > 0 and rps_growth < user_growth * 0.25:
+                reasons.append(f"throughput +{rps_growth:.0%} for +{user_growth:.0%} users")
+        if reasons:
+            return {"users": stage["users"], "throughput_rps": stage["throughput_rps"], "reasons": reasons}
+        previous = stage
+    return None
+
+
+async def run(args) -> dict:
+    stages_users = [int(n) for n in args.users.split(",")]
+    limits = httpx.Limits(max_connections=max(stages_users) * 3, max_keepalive_connections=max(stages_users) * 3)
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        workload = await prepare(client, args.email, args.password)
+        personas = assign_personas(SCENARIOS[args.scenario], max(stages_users))
+
+        load = LoadRun()
+        tasks: List[asyncio.Task] = []
+        users_started: List[VirtualUser] = []
+        stages = []
+        for users in stages_users:
+            while len(tasks) < users:
+                user = VirtualUser(client, workload, personas[len(tasks)])
+                users_started.append(user)
+                tasks.append(asyncio.create_task(user.run(load)))
+            # A burst of logins (bcrypt) would otherwise dominate the stage
+            await asyncio.gather(*(user.ready.wait() for user in users_started))
+            load.stats = Stats()
+            started = time.perf_counter()
+            await asyncio.sleep(args.stage_seconds)
+            # Requests still waiting at the end of the stage point to a stalled server
+            stage = dict(users=users, in_flight=load.in_flight, **load.stats.summary(time.perf_counter() - started))
+            stages.append(stage)
+            errors = ", ".join(f"{kind} {count}" for kind, count in stage["errors"].items() if count) or "none"
+            print(
+                f"{users:>5} users  {stage['throughput_rps']:>8.1f} req/s  p50 {stage['p50_ms']:>8.1f} ms  "
+                f"p95 {stage['p95_ms']:>8.1f} ms  p99 {stage['p99_ms']:>8.1f} ms  in flight {stage['in_flight']:>4}  "
+                f"errors: {errors}",
+                flush=True
+            )
+
+        load.stop.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "url": args.url,
+            "scenario": args.scenario,
+            "mix": SCENARIOS[args.scenario],
+            "stage_seconds": args.stage_seconds,
+        },
+        "stages": stages,
+        "saturation": find_saturation(stages, args.slo_p95_ms, args.max_error_rate),
+    }
+
+
+def print_actions(stage: dict):
+    print(f"\nPer action at {stage['users']} users:")
+    for action, result in stage["actions"].items():
+        errors = ", ".join(f"{kind} {count}" for kind, count in result["errors"].items()) or "-"
+        print(
+            f"  {action:<22} {result['requests']:>7}  p50 {result['p50_ms']:>8.1f} ms  "
+            f"p95 {result['p95_ms']:>8.1f} ms  p99 {result['p99_ms']:>8.1f} ms  errors: {errors}"
+        )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Run a mixed concurrent workload against a running server")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="mixed")
+    parser.add_argument("--users", default="10,50,100,200", help="comma-separated concurrent users per stage")
+    parser.add_argument("--stage-seconds", type=float, default=30)
+    parser.add_argument("--timeout", type=float, default=30, help="per-request timeout in seconds")
+    parser.add_argument("--slo-p95-ms", type=float, default=1000, help="p95 target used to find saturation")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--email", default=os.getenv("LOADGEN_EMAIL", ADMIN_EMAIL))
+    parser.add_argument("--password", default=os.getenv("LOADGEN_PASSWORD", ADMIN_PASSWORD))
+    parser.add_argument("--seed", type=int, help="random seed for a repeatable action sequence")
+    parser.add_argument("--output", help="write the full report as JSON")
+    args = parser.parse_args(argv)
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    print(f"Scenario {args.scenario} {SCENARIOS[args.scenario]} against {args.url}")
+    report = asyncio.run(run(args))
+
+    print_actions(report["stages"][-1])
+    saturation = report["saturation"]
+    if saturation:
+        print(
+            f"\nSaturation at {saturation['users']} users ({saturation['throughput_rps']:.1f} req/s): "
+            + "; ".join(saturation["reasons"])
+        )
+    else:
+        print("\nNo saturation reached; try more users")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Report written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+"""Event-loop lag watchdog.
+
+A coroutine ticks every ``LOOP_MONITOR_INTERVAL_MS`` and records how late each
+tick fires. A separate thread watches the tick heartbeat; when the loop has
+not ticked for ``LOOP_LAG_THRESHOLD_MS`` it captures the event loop thread's
+stack, which is the stack of whatever blocking call is stalling every other
+request. Lag and stalls are exported on ``/api/metrics``; recent stall stacks
+are kept for ``/api/metrics/event-loop``.
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime
+from typing import List, Optional
+
+from metrics import registry, LATENCY_BUCKETS
+
+logger = logging.getLogger("wine_inventory.loop_monitor")
+
+LOOP_MONITOR_INTERVAL_SECONDS = float(os.getenv("LOOP_MONITOR_INTERVAL_MS", "50")) / 1000
+LOOP_LAG_THRESHOLD_SECONDS = float(os.getenv("LOOP_LAG_THRESHOLD_MS", "100")) / 1000
+MAX_STALL_REPORTS = 50
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+loop_lag = registry.histogram(
+    "event_loop_lag_seconds", "Delay between scheduled and actual event loop ticks", LATENCY_BUCKETS
+)
+loop_lag_current = registry.gauge(
+    "event_loop_lag_current_seconds", "Most recent event loop tick delay"
+)
+loop_stalls_total = registry.counter(
+    "event_loop_stalls_total", "Event loop stalls over LOOP_LAG_THRESHOLD_MS by blocking call site"
+)
+
+
+def _blocking_site(stack: List[traceback.FrameSummary]) -> str:
+    """Innermost application frame of a captured stack"""
+    for frame in reversed(stack):
+        filename = os.path.abspath(frame.filename)
+        if filename.startswith(BACKEND_DIR) and "site-packages" not in filename:
+            return f"{os.path.relpath(filename, BACKEND_DIR)}:{frame.name}"
+    return "unknown"
+
+
+class EventLoopMonitor:
+    """Measures event loop lag and captures the stack of blocking calls"""
+
+    def __init__(
+        self,
+        interval: float = LOOP_MONITOR_INTERVAL_SECONDS,
+        threshold: float = LOOP_LAG_THRESHOLD_SECONDS
+    ):
+        self.interval = interval
+        self.threshold = threshold
+        self.stalls: deque = deque(maxlen=MAX_STALL_REPORTS)
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._open_stall: Optional[dict] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """Start ticking on the running loop and start the watchdog thread"""
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._tick())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._thread:
+            self._thread.join()
+        self._task = None
+        self._thread = None
+
+    async def _tick(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self._heartbeat = now
+            loop_lag.observe(lag)
+            loop_lag_current.set(lag)
+            stall = self._open_stall
+            if stall is not None:
+                # The watchdog saw this stall while it was still going; record its full length
+                stall["stalled_ms"] = round(lag * 1000, 1)
+                self._open_stall = None
+
+    def _watch(self):
+        captured_heartbeat = None
+        while not self._stop.wait(self.interval):
+            heartbeat = self._heartbeat
+            stalled_for = time.monotonic() - heartbeat - self.interval
+            # One capture per stall: wait for the loop to tick again before re-arming
+            if stalled_for < self.threshold or heartbeat == captured_heartbeat:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            captured_heartbeat = heartbeat
+            self._record_stall(traceback.extract_stack(frame), stalled_for)
+
+    def _record_stall(self, stack: List[traceback.FrameSummary], stalled_for: float):
+        site = _blocking_site(stack)
+        loop_stalls_total.inc(site=site)
+        formatted = "".join(traceback.format_list(stack))
+        stall = {
+            "detected_at": datetime.now(),
+            "stalled_ms": round(stalled_for * 1000, 1),
+            "site": site,
+            "stack": formatted
+        }
+        self.stalls.append(stall)
+        self._open_stall = stall
+        logger.warning(
+            "Event loop blocked for %.0f ms at %s\n%s", stalled_for * 1000, site, formatted
+        )
+
+    def recent_stalls(self) -> List[dict]:
+        return list(reversed(self.stalls))
+
+
+monitor = EventLoopMonitor()
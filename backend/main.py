@@ -1,8 +1,12 @@
-from fastapi import FastAPI
+import os
+
+from fastapi import FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
+from sqlalchemy.exc import OperationalError
 
-from database import engine, Base
+from database import engine, Base, add_missing_columns, create_missing_indexes
 from routers import (
     auth_router,
     wines_router,
@@ -10,20 +14,58 @@ from routers import (
     dashboard_router,
     users_router,
     logs_router,
-    export_import_router
+    export_import_router,
+    events_router,
+    metrics_router,
+    profiles_router,
+    backups_router,
+    maintenance_router,
+    scheduler_router
 )
 from seed import seed_admin_user
+from events import broadcaster
+from cache import listener as cache_listener
+from scheduler import scheduler
+from write_queue import WRITE_QUEUE, writer
+from loop_monitor import monitor as loop_monitor
+from idempotency import IdempotencyMiddleware
+from metrics import MetricsMiddleware, db_lock_errors_total, route_label
+from query_debug import QUERY_DEBUG, QueryDebugMiddleware
+from profiling import ProfilingMiddleware
+import memory_profiling
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     try:
-        # Create tables on startup
-        Base.metadata.create_all(bind=engine)
-        print("✓ Database tables created")
-        # Seed admin user
-        seed_admin_user()
-        print("✓ Admin user seeded")
+        # serve.py's master has already done this once for all its workers
+        if os.getenv("SERVE_DATABASE_PREPARED") != "1":
+            # Create tables on startup
+            Base.metadata.create_all(bind=engine)
+            add_missing_columns()
+            create_missing_indexes()
+            print("✓ Database tables created")
+            # Seed admin user
+            seed_admin_user()
+            print("✓ Admin user seeded")
+        # Funnel write endpoints through one group-committing writer
+        if WRITE_QUEUE:
+            writer.start()
+        # Drop cached reads made stale by writes in other worker processes
+        cache_listener.start()
+        # Start live event broadcaster
+        broadcaster.start()
+        # Watch for sync work blocking the event loop
+        loop_monitor.start()
+        # Periodic tasks (maintenance, purges, backups); one worker runs each slot
+        scheduler.start()
+        if memory_profiling.MEMORY_PROFILING:
+            memory_profiling.start()
         yield
+        await scheduler.stop()
+        await loop_monitor.stop()
+        await broadcaster.stop()
+        cache_listener.stop()
+        writer.stop()
     except Exception as e:
         print(f"✗ Lifespan error: {e}")
         import traceback
@@ -37,6 +79,22 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Idempotency-Key replay for write endpoints (added first so CORS wraps replayed responses)
+app.add_middleware(IdempotencyMiddleware)
+
+# Per-request latency and SQL instrumentation, exposed at /api/metrics
+app.add_middleware(MetricsMiddleware)
+
+# Development-only N+1 / slow query / full scan detector (QUERY_DEBUG=1)
+if QUERY_DEBUG:
+    app.add_middleware(QueryDebugMiddleware)
+
+# Admin-requested (X-Profile: 1) and 1-in-N sampled request profiling
+app.add_middleware(ProfilingMiddleware)
+
+# tracemalloc per-request peak memory (MEMORY_PROFILING=1 or POST /api/profiles/memory/start)
+app.add_middleware(memory_profiling.MemoryProfilingMiddleware)
+
 # CORS configuration - Must be added before other middlewares
 app.add_middleware(
     CORSMiddleware,
@@ -48,6 +106,18 @@ app.add_middleware(
     max_age=600,
 )
 
+@app.exception_handler(OperationalError)
+async def database_locked_handler(request: Request, exc: OperationalError):
+    """Turn SQLite write-lock timeouts into a retryable 503 instead of a bare 500"""
+    if "database is locked" not in str(exc.orig):
+        raise exc
+    db_lock_errors_total.inc(method=request.method, route=route_label(request))
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "数据库繁忙，请稍后重试"},
+        headers={"Retry-After": "1"}
+    )
+
 # Include routers
 app.include_router(auth_router, prefix="/api/auth", tags=["Authentication"])
 app.include_router(wines_router, prefix="/api/wines", tags=["Wines"])
@@ -56,6 +126,12 @@ app.include_router(dashboard_router, prefix="/api/dashboard", tags=["Dashboard"]
 app.include_router(users_router, prefix="/api/users", tags=["Users"])
 app.include_router(logs_router, prefix="/api/logs", tags=["Logs"])
 app.include_router(export_import_router, prefix="/api", tags=["Export/Import"])
+app.include_router(events_router, prefix="/api/events", tags=["Events"])
+app.include_router(metrics_router, prefix="/api/metrics", tags=["Metrics"])
+app.include_router(profiles_router, prefix="/api/profiles", tags=["Profiles"])
+app.include_router(backups_router, prefix="/api/backups", tags=["Backups"])
+app.include_router(maintenance_router, prefix="/api/maintenance", tags=["Maintenance"])
+app.include_router(scheduler_router, prefix="/api/scheduler", tags=["Scheduler"])
 
 @app.get("/api/health")
 def health_check():
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""Storage maintenance: integrity check, planner statistics, incremental vacuum.
+
+Bulk imports and log purges leave free pages in the file and the planner's
+statistics out of date. A maintenance run does, in order and each within its
+own time budget (``MAINTENANCE_TASK_BUDGET_SECONDS``, enforced with a SQLite
+progress handler that interrupts the statement):
+
+* ``quick_check``: ``PRAGMA quick_check``; problems are logged and recorded.
+* ``analyze``: ``ANALYZE`` limited to ``MAINTENANCE_ANALYSIS_LIMIT`` rows per
+  index, so it costs the same on any database size, then ``PRAGMA optimize``.
+* ``incremental_vacuum``: returns free pages to the OS in steps of
+  ``MAINTENANCE_VACUUM_STEP_PAGES``. Needs ``auto_vacuum=INCREMENTAL``, which
+  new databases get (see database.py); existing ones are converted once,
+  offline, with ``python maintenance.py --convert``.
+
+Runs are scheduled (see scheduler.py) every ``MAINTENANCE_INTERVAL_HOURS``
+(0 disables the schedule) and wait for low traffic: the first worker that
+served at most ``MAINTENANCE_IDLE_RPS`` requests per second between two
+checks, ``MAINTENANCE_CHECK_SECONDS`` apart, runs it. Each run is recorded in
+``maintenance_runs``, and a run is refused while another is in progress.
+Admins see the last runs and current size/fragmentation figures at
+``/api/maintenance`` and can start a run there.
+
+Examples:
+    python maintenance.py
+    python maintenance.py --convert
+"""
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, List, Optional
+
+from sqlalchemy import and_, exists, insert, literal, select
+
+from database import SQLALCHEMY_DATABASE_URL, SessionLocal, engine, read_engine
+from metrics import registry, requests_total
+from models import MaintenanceRun
+from scheduler import ScheduledTask, scheduler
+
+logger = logging.getLogger("wine_inventory.maintenance")
+
+MAINTENANCE_INTERVAL_HOURS = float(os.getenv("MAINTENANCE_INTERVAL_HOURS", "24"))
+MAINTENANCE_CHECK_SECONDS = float(os.getenv("MAINTENANCE_CHECK_SECONDS", "60"))
+MAINTENANCE_IDLE_RPS = float(os.getenv("MAINTENANCE_IDLE_RPS", "1"))
+MAINTENANCE_TASK_BUDGET_SECONDS = float(os.getenv("MAINTENANCE_TASK_BUDGET_SECONDS", "30"))
+MAINTENANCE_ANALYSIS_LIMIT = int(os.getenv("MAINTENANCE_ANALYSIS_LIMIT", "1000"))
+MAINTENANCE_VACUUM_STEP_PAGES = int(os.getenv("MAINTENANCE_VACUUM_STEP_PAGES", "128"))
+# VM instructions between budget checks
+PROGRESS_STEPS = 10000
+AUTO_VACUUM_MODES = {0: "none", 1: "full", 2: "incremental"}
+MAINTENANCE_RUN_HISTORY = 10
+
+maintenance_task_duration = registry.histogram(
+    "maintenance_task_seconds", "Duration of storage maintenance tasks",
+    (0.01, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+)
+maintenance_tasks_total = registry.counter(
+    "maintenance_tasks_total", "Storage maintenance tasks by task and status"
+)
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _quick_check(connection: sqlite3.Connection, deadline: float) -> dict:
+    problems = [row[0] for row in connection.execute("PRAGMA quick_check(100)")]
+    if problems == ["ok"]:
+        return {}
+    logger.error("quick_check found %d problem(s): %s", len(problems), problems[:5])
+    return {"status": "failed", "problems": problems}
+
+
+def _analyze(connection: sqlite3.Connection, deadline: float) -> dict:
+    connection.execute(f"PRAGMA analysis_limit={MAINTENANCE_ANALYSIS_LIMIT}")
+    connection.execute("ANALYZE")
+    connection.execute("PRAGMA optimize")
+    return {"analysis_limit": MAINTENANCE_ANALYSIS_LIMIT}
+
+
+def _freelist_count(connection: sqlite3.Connection) -> int:
+    return connection.execute("PRAGMA freelist_count").fetchone()[0]
+
+
+def _incremental_vacuum(connection: sqlite3.Connection, deadline: float) -> dict:
+    mode = connection.execute("PRAGMA auto_vacuum").fetchone()[0]
+    free = _freelist_count(connection)
+    if AUTO_VACUUM_MODES.get(mode) != "incremental":
+        return {"status": "skipped", "auto_vacuum": AUTO_VACUUM_MODES.get(mode, mode), "freelist_pages": free}
+    released = 0
+    while free and time.monotonic() < deadline:
+        # Each step is its own short write transaction, so writers get in between steps
+        connection.execute(f"PRAGMA incremental_vacuum({MAINTENANCE_VACUUM_STEP_PAGES})").fetchall()
+        remaining = _freelist_count(connection)
+        released += free - remaining
+        free = remaining
+    return {"status": "timeout" if free else "ok", "released_pages": released, "freelist_pages": free}
+
+
+TASKS = (
+    ("quick_check", _quick_check),
+    ("analyze", _analyze),
+    ("incremental_vacuum", _incremental_vacuum),
+)
+
+
+def _run_task(connection: sqlite3.Connection, name: str, task: Callable, budget: float) -> dict:
+    started = time.monotonic()
+    deadline = started + budget
+    connection.set_progress_handler(lambda: time.monotonic() > deadline, PROGRESS_STEPS)
+    result = {"task": name, "status": "ok"}
+    try:
+        result.update(task(connection, deadline))
+    except sqlite3.OperationalError as exc:
+        result["status"] = "timeout" if time.monotonic() > deadline else "failed"
+        result["error"] = str(exc)
+    finally:
+        connection.set_progress_handler(None, 0)
+    elapsed = time.monotonic() - started
+    result["duration_ms"] = round(elapsed * 1000, 1)
+    maintenance_task_duration.observe(elapsed, task=name)
+    maintenance_tasks_total.inc(task=name, status=result["status"])
+    return result
+
+
+def _claim(trigger: str) -> Optional[int]:
+    """Record a new run unless another one is still going; None when it is"""
+    now = _utcnow()
+    stale = timedelta(seconds=MAINTENANCE_TASK_BUDGET_SECONDS * len(TASKS) * 2)
+    blocking = and_(MaintenanceRun.status == "running", MaintenanceRun.started_at > now - stale)
+    # One statement, so two workers can't both see no run and both insert
+    statement = insert(MaintenanceRun).from_select(
+        ["started_at", "status", "trigger"],
+        select(literal(now), literal("running"), literal(trigger)).where(
+            ~exists().where(blocking)
+        )
+    ).returning(MaintenanceRun.id)
+    db = SessionLocal()
+    try:
+        run_id = db.execute(statement).scalar()
+        db.commit()
+        return run_id
+    finally:
+        db.close()
+
+
+def run_maintenance(trigger: str = "manual", budget: float = MAINTENANCE_TASK_BUDGET_SECONDS) -> Optional[dict]:
+    """Run every maintenance task and record the results; None if another run is in progress"""
+    run_id = _claim(trigger)
+    if run_id is None:
+        return None
+    logger.info("Storage maintenance run %d started (%s)", run_id, trigger)
+    before = storage_stats()
+    results: List[dict] = []
+    connection = engine.raw_connection()
+    try:
+        for name, task in TASKS:
+            results.append(_run_task(connection.dbapi_connection, name, task, budget))
+    finally:
+        connection.close()
+    after = storage_stats()
+    statuses = {result["status"] for result in results}
+    status = "failed" if "failed" in statuses else "timeout" if "timeout" in statuses else "ok"
+
+    db = SessionLocal()
+    try:
+        run = db.get(MaintenanceRun, run_id)
+        run.finished_at = _utcnow()
+        run.status = status
+        run.results = json.dumps({"tasks": results, "before": before, "after": after}, ensure_ascii=False)
+        db.commit()
+        logger.info("Storage maintenance run %d finished: %s", run_id, status)
+        return _run_to_dict(run)
+    finally:
+        db.close()
+
+
+def storage_stats() -> dict:
+    """Current database size and fragmentation"""
+    connection = read_engine.raw_connection()
+    try:
+        cursor = connection.dbapi_connection
+        page_size = cursor.execute("PRAGMA page_size").fetchone()[0]
+        page_count = cursor.execute("PRAGMA page_count").fetchone()[0]
+        freelist = _freelist_count(cursor)
+        auto_vacuum = cursor.execute("PRAGMA auto_vacuum").fetchone()[0]
+        journal_mode = cursor.execute("PRAGMA journal_mode").fetchone()[0]
+        analyzed = cursor.execute(
+            "SELECT count(*) FROM sqlite_master WHERE name = 'sqlite_stat1'"
+        ).fetchone()[0] > 0
+    finally:
+        connection.close()
+    stats = {
+        "page_size": page_size,
+        "page_count": page_count,
+        "size_bytes": page_size * page_count,
+        "freelist_pages": freelist,
+        "free_bytes": page_size * freelist,
+        "fragmentation": round(freelist / page_count, 4) if page_count else 0.0,
+        "auto_vacuum": AUTO_VACUUM_MODES.get(auto_vacuum, auto_vacuum),
+        "journal_mode": journal_mode,
+        "analyzed": analyzed,
+    }
+    database = engine.url.database
+    if database and database != ":memory:" and os.path.exists(f"{database}-wal"):
+        stats["wal_bytes"] = os.path.getsize(f"{database}-wal")
+    return stats
+
+
+def _run_to_dict(run: MaintenanceRun) -> dict:
+    return {
+        "id": run.id,
+        "started_at": run.started_at,
+        "finished_at": run.finished_at,
+        "status": run.status,
+        "trigger": run.trigger,
+        **(json.loads(run.results) if run.results else {})
+    }
+
+
+def recent_runs(db, limit: int = MAINTENANCE_RUN_HISTORY) -> List[dict]:
+    """Latest maintenance runs, newest first"""
+    runs = db.query(MaintenanceRun).order_by(MaintenanceRun.started_at.desc()).limit(limit).all()
+    return [_run_to_dict(run) for run in runs]
+
+
+_last_sample = (time.monotonic(), requests_total.total())
+
+
+def quiet() -> bool:
+    """Whether this worker served at most MAINTENANCE_IDLE_RPS requests per second since the last call"""
+    global _last_sample
+    now, served = time.monotonic(), requests_total.total()
+    (then, before), _last_sample = _last_sample, (now, served)
+    return (served - before) / max(now - then, 1e-3) <= MAINTENANCE_IDLE_RPS
+
+
+if MAINTENANCE_INTERVAL_HOURS > 0:
+    scheduler.add(ScheduledTask(
+        "storage_maintenance",
+        lambda: run_maintenance("schedule"),
+        interval=MAINTENANCE_INTERVAL_HOURS * 3600,
+        jitter=60,
+        timeout=MAINTENANCE_TASK_BUDGET_SECONDS * len(TASKS) + 60,
+        condition=quiet,
+        retry=MAINTENANCE_CHECK_SECONDS
+    ))
+
+
+def convert_to_incremental_vacuum():
+    """Switch an existing database to auto_vacuum=INCREMENTAL (rewrites the file; run offline)"""
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.dbapi_connection
+        cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        cursor.execute("VACUUM")
+    finally:
+        connection.close()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Run storage maintenance on the database")
+    parser.add_argument("--convert", action="store_true",
+                        help="switch to auto_vacuum=INCREMENTAL with a full VACUUM first (stop the server)")
+    parser.add_argument("--budget", type=float, default=MAINTENANCE_TASK_BUDGET_SECONDS, help="seconds per task")
+    args = parser.parse_args(argv)
+
+    print(f"Database: {SQLALCHEMY_DATABASE_URL}")
+    MaintenanceRun.__table__.create(bind=engine, checkfirst=True)
+    if args.convert:
+        started = time.monotonic()
+        convert_to_incremental_vacuum()
+        print(f"Converted to auto_vacuum=INCREMENTAL in {time.monotonic() - started:.1f}s")
+    run = run_maintenance("manual", args.budget)
+    if run is None:
+        print("Another maintenance run is in progress")
+        return 1
+    for task in run["tasks"]:
+        extra = {k: v for k, v in task.items() if k not in ("task", "status", "duration_ms")}
+        print(f"  {task['task']:<20} {task['status']:<8} {task['duration_ms']:>9.1f} ms  {extra or ''}")
+    before, after = run["before"], run["after"]
+    print(
+        f"Size {before['size_bytes'] / 1048576:.1f} -> {after['size_bytes'] / 1048576:.1f} MiB, "
+        f"fragmentation {before['fragmentation']:.1%} -> {after['fragmentation']:.1%}"
+    )
+    return 0 if run["status"] == "ok" else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,219 @@
+"""tracemalloc-based per-request memory profiling.
+
+When enabled (``MEMORY_PROFILING=1`` at startup or ``POST
+/api/profiles/memory/start`` at runtime) every request records its peak traced
+allocation and the number of ORM objects loaded into its session identity map.
+Results are aggregated per route and per router module, exported on
+``/api/metrics`` and summarized with the current top allocation sites at
+``GET /api/profiles/memory``.
+
+tracemalloc is process-wide, so a request's peak includes allocations made by
+requests running concurrently with it.
+"""
+
+import os
+import threading
+import tracemalloc
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from fastapi import Request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from metrics import registry, route_label
+
+MEMORY_PROFILING = os.getenv("MEMORY_PROFILING", "").lower() in ("1", "true", "yes")
+MEMORY_TRACE_FRAMES = int(os.getenv("MEMORY_TRACE_FRAMES", "10"))
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+MEMORY_BUCKETS = tuple(mb * 1024 * 1024 for mb in (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000))
+
+request_memory_peak = registry.histogram(
+    "http_request_memory_peak_bytes", "Peak traced allocation during a request", MEMORY_BUCKETS
+)
+request_orm_objects = registry.histogram(
+    "http_request_orm_objects", "ORM objects loaded into the session per request",
+    (10, 100, 1000, 10000, 100000, 1000000)
+)
+
+
+class MemoryStats:
+    """Memory activity recorded for one request"""
+
+    __slots__ = ("orm_objects",)
+
+    def __init__(self):
+        self.orm_objects: Dict[str, int] = {}
+
+
+class RouteMemory:
+    """Aggregated memory stats for one route"""
+
+    __slots__ = ("router", "count", "max_peak_bytes", "total_peak_bytes", "max_orm_objects", "orm_objects")
+
+    def __init__(self, router: str):
+        self.router = router
+        self.count = 0
+        self.max_peak_bytes = 0
+        self.total_peak_bytes = 0
+        self.max_orm_objects = 0
+        self.orm_objects: Dict[str, int] = {}
+
+    def to_dict(self) -> dict:
+        return {
+            "router": self.router,
+            "requests": self.count,
+            "max_peak_bytes": self.max_peak_bytes,
+            "avg_peak_bytes": self.total_peak_bytes // self.count if self.count else 0,
+            "max_orm_objects": self.max_orm_objects,
+            "max_orm_objects_by_class": self.orm_objects
+        }
+
+
+current_memory_stats: ContextVar[Optional[MemoryStats]] = ContextVar("current_memory_stats", default=None)
+_routes: Dict[str, RouteMemory] = {}
+_lock = threading.Lock()
+
+
+def is_enabled() -> bool:
+    return tracemalloc.is_tracing()
+
+
+def start(nframes: int = MEMORY_TRACE_FRAMES):
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(nframes)
+
+
+def stop():
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def reset():
+    with _lock:
+        _routes.clear()
+
+
+# On the Session class, so reads (ReadSessionLocal) and the write queue's
+# sessions are counted as well as SessionLocal's
+@event.listens_for(Session, "loaded_as_persistent")
+def _on_loaded(session, instance):
+    stats = current_memory_stats.get()
+    if stats is not None:
+        name = type(instance).__name__
+        stats.orm_objects[name] = stats.orm_objects.get(name, 0) + 1
+
+
+def _router_label(request: Request) -> str:
+    route = request.scope.get("route")
+    endpoint = getattr(route, "endpoint", None)
+    return getattr(endpoint, "__module__", None) or "unmatched"
+
+
+def _record(request: Request, peak: int, stats: MemoryStats):
+    path = route_label(request)
+    router = _router_label(request)
+    orm_total = sum(stats.orm_objects.values())
+    request_memory_peak.observe(peak, method=request.method, route=path, router=router)
+    request_orm_objects.observe(orm_total, method=request.method, route=path, router=router)
+
+    key = f"{request.method} {path}"
+    with _lock:
+        entry = _routes.get(key)
+        if entry is None:
+            entry = _routes[key] = RouteMemory(router)
+        entry.count += 1
+        entry.total_peak_bytes += peak
+        entry.max_peak_bytes = max(entry.max_peak_bytes, peak)
+        if orm_total > entry.max_orm_objects:
+            entry.max_orm_objects = orm_total
+            entry.orm_objects = dict(stats.orm_objects)
+
+
+def _app_site(traceback: tracemalloc.Traceback) -> Optional[str]:
+    """Innermost application frame of an allocation traceback"""
+    for frame in reversed(traceback):
+        if frame.filename.startswith(BACKEND_DIR) and "site-packages" not in frame.filename:
+            return f"{os.path.relpath(frame.filename, BACKEND_DIR)}:{frame.lineno}"
+    return None
+
+
+def summary(top: int = 20) -> dict:
+    """Per-route and per-router memory stats plus the current top allocation sites"""
+    with _lock:
+        routes = {route: entry.to_dict() for route, entry in _routes.items()}
+
+    routers: Dict[str, dict] = {}
+    for entry in routes.values():
+        router = routers.setdefault(entry["router"], {"requests": 0, "max_peak_bytes": 0})
+        router["requests"] += entry["requests"]
+        router["max_peak_bytes"] = max(router["max_peak_bytes"], entry["max_peak_bytes"])
+
+    result = {
+        "enabled": is_enabled(),
+        "routes": dict(sorted(routes.items(), key=lambda kv: -kv[1]["max_peak_bytes"])),
+        "routers": routers,
+        "top_sites": [],
+        "top_app_sites": []
+    }
+    if is_enabled():
+        current, peak = tracemalloc.get_traced_memory()
+        result["traced_current_bytes"] = current
+        result["traced_peak_bytes"] = peak
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        result["top_sites"] = [
+            {
+                "site": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                "size_bytes": stat.size,
+                "count": stat.count
+            }
+            for stat in snapshot.statistics("lineno")[:top]
+        ]
+
+        # Attribute library allocations to the application line that caused them
+        app_sites: Dict[str, list] = {}
+        for stat in snapshot.statistics("traceback"):
+            site = _app_site(stat.traceback)
+            if site is not None:
+                totals = app_sites.setdefault(site, [0, 0])
+                totals[0] += stat.size
+                totals[1] += stat.count
+        result["top_app_sites"] = [
+            {"site": site, "size_bytes": size, "count": count}
+            for site, (size, count) in sorted(app_sites.items(), key=lambda kv: -kv[1][0])[:top]
+        ]
+    return result
+
+
+class MemoryProfilingMiddleware:
+    """Record peak allocation and ORM object counts while tracemalloc is on
+
+    Plain ASGI rather than BaseHTTPMiddleware, so while tracing is off (the
+    usual case) requests pass straight through to the app.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not tracemalloc.is_tracing():
+            await self.app(scope, receive, send)
+            return
+
+        stats = MemoryStats()
+        token = current_memory_stats.set(stats)
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_memory_stats.reset(token)
+        if tracemalloc.is_tracing():
+            peak = max(0, tracemalloc.get_traced_memory()[1] - baseline)
+            _record(Request(scope), peak, stats)
@@ -0,0 +1,266 @@
+"""Per-request latency and SQL instrumentation with Prometheus text output.
+
+The middleware opens a ``RequestStats`` for every request; SQLAlchemy cursor
+events add each statement's duration to it. When the request finishes the
+totals are folded into process-wide histograms and counters, which
+``render_metrics()`` exposes in the Prometheus text format.
+"""
+
+import bisect
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from fastapi import Request
+from sqlalchemy import event
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from database import all_engines
+
+logger = logging.getLogger("wine_inventory.metrics")
+
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "500"))
+MAX_RECORDED_STATEMENTS = 200
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Sequence[Tuple[str, str]] = ()) -> str:
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join(
+        '{}="{}"'.format(k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in pairs
+    )
+    return "{" + body + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def total(self) -> float:
+        """Sum over all label sets"""
+        with self._lock:
+            return sum(self._values.values())
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(k)} {_format_value(v)}" for k, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float]):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[LabelKey, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            # [bucket counts..., +Inf count, sum]
+            data = self._values.get(key)
+            if data is None:
+                data = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            data[bisect.bisect_left(self.buckets, value)] += 1
+            data[-1] += value
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        lines = []
+        for key, data in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), data[:-1]):
+                cumulative += count
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(key, [('le', _format_value(bound))])} {cumulative}"
+                )
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(data[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Holds every metric exposed on /api/metrics"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self._register(Counter(name, help_text))
+
+    def gauge(self, name: str, help_text: str) -> Gauge:
+        return self._register(Gauge(name, help_text))
+
+    def histogram(self, name: str, help_text: str, buckets: Sequence[float]) -> Histogram:
+        return self._register(Histogram(name, help_text, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+request_duration = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", LATENCY_BUCKETS
+)
+requests_total = registry.counter(
+    "http_requests_total", "HTTP requests by route and status code"
+)
+request_db_queries = registry.histogram(
+    "http_request_db_queries", "SQL statements issued per request", QUERY_COUNT_BUCKETS
+)
+request_db_seconds = registry.histogram(
+    "http_request_db_seconds", "Time spent in SQL per request", LATENCY_BUCKETS
+)
+slow_requests_total = registry.counter(
+    "http_slow_requests_total", "Requests slower than SLOW_REQUEST_MS"
+)
+db_lock_errors_total = registry.counter(
+    "db_lock_errors_total", "Requests that failed with SQLite 'database is locked'"
+)
+
+
+class RequestStats:
+    """SQL activity recorded for one request"""
+
+    __slots__ = ("query_count", "db_seconds", "statements")
+
+    def __init__(self):
+        self.query_count = 0
+        self.db_seconds = 0.0
+        self.statements: List[Tuple[float, str]] = []
+
+
+current_request_stats: ContextVar[Optional[RequestStats]] = ContextVar(
+    "current_request_stats", default=None
+)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info["query_start_time"] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop("query_start_time", None)
+    stats = current_request_stats.get()
+    if stats is None or started is None:
+        return
+    elapsed = time.perf_counter() - started
+    stats.query_count += 1
+    stats.db_seconds += elapsed
+    if len(stats.statements) < MAX_RECORDED_STATEMENTS:
+        stats.statements.append((elapsed, statement))
+
+
+for _engine in all_engines:
+    event.listen(_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def route_label(request: Request) -> str:
+    """Route template for a request, so path parameters don't explode label cardinality"""
+    route = request.scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware(BaseHTTPMiddleware):
+    """Record latency and SQL usage for every request"""
+
+    async def dispatch(self, request: Request, call_next):
+        stats = RequestStats()
+        token = current_request_stats.set(stats)
+        started = time.perf_counter()
+        status_code = 500
+        try:
+            response = await call_next(request)
+            status_code = response.status_code
+            return response
+        finally:
+            elapsed = time.perf_counter() - started
+            current_request_stats.reset(token)
+            record_request(request, status_code, elapsed, stats)
+
+
+def record_request(request: Request, status_code: int, elapsed: float, stats: RequestStats):
+    route = route_label(request)
+    method = request.method
+    request_duration.observe(elapsed, method=method, route=route)
+    requests_total.inc(method=method, route=route, status=status_code)
+    request_db_queries.observe(stats.query_count, method=method, route=route)
+    request_db_seconds.observe(stats.db_seconds, method=method, route=route)
+
+    if elapsed * 1000 >= SLOW_REQUEST_MS:
+        slow_requests_total.inc(method=method, route=route)
+        statements = "\n".join(
+            f"  [{duration * 1000:.1f} ms] {statement}" for duration, statement in stats.statements
+        )
+        logger.warning(
+            "Slow request %s %s -> %s took %.1f ms (%d queries, %.1f ms in DB)\n%s",
+            method, request.url.path, status_code, elapsed * 1000,
+            stats.query_count, stats.db_seconds * 1000, statements
+        )
+
+
+def render_metrics() -> str:
+    return registry.render()
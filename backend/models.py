@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, Text, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, Text, ForeignKey, Index, UniqueConstraint, DDL, event
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -26,36 +26,50 @@ class Wine(Base):
     __tablename__ = "wines"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    name = Column(String, nullable=False)
-    vintage_year = Column(Integer, nullable=False)
-    region = Column(String, nullable=False)
-    grape_variety = Column(String)
-    price = Column(Float)
-    supplier = Column(String)
-    storage_location = Column(String)
-    current_stock = Column(Integer, default=0)
+    # Indexed columns back the list filters and sort options of GET /api/wines
+    name = Column(String, nullable=False, index=True)
+    vintage_year = Column(Integer, nullable=False, index=True)
+    region = Column(String, nullable=False, index=True)
+    grape_variety = Column(String, index=True)
+    price = Column(Float, index=True)
+    supplier = Column(String, index=True)
+    storage_location = Column(String, index=True)
+    current_stock = Column(Integer, default=0, index=True)
     low_stock_threshold = Column(Integer, default=10)
     notes = Column(Text)
     image_url = Column(String)
-    created_by = Column(Integer, ForeignKey("users.id"))
-    created_at = Column(DateTime, server_default=func.now())
+    created_by = Column(Integer, ForeignKey("users.id"), index=True)
+    created_at = Column(DateTime, server_default=func.now(), index=True)
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+    # Position in the change feed (GET /api/wines/changes), set by the triggers below
+    change_seq = Column(Integer, nullable=False, server_default="0", index=True)
 
     # Relationships
     creator = relationship("User", back_populates="wines")
-    transactions = relationship("InventoryTransaction", back_populates="wine", cascade="all, delete-orphan")
+    # History rows are removed by the database (ON DELETE CASCADE), not loaded and deleted one by one
+    transactions = relationship(
+        "InventoryTransaction",
+        back_populates="wine",
+        cascade="all, delete-orphan",
+        passive_deletes=True
+    )
 
 
 class InventoryTransaction(Base):
     __tablename__ = "inventory_transactions"
+    # Filtered lists are ordered newest first, so filters lead and created_at follows
+    __table_args__ = (
+        Index("ix_inventory_transactions_type_created_at", "transaction_type", "created_at"),
+        Index("ix_inventory_transactions_performed_by_created_at", "performed_by", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    wine_id = Column(Integer, ForeignKey("wines.id", ondelete="CASCADE"), nullable=False)
+    wine_id = Column(Integer, ForeignKey("wines.id", ondelete="CASCADE"), nullable=False, index=True)
     transaction_type = Column(String, nullable=False)  # 'in' or 'out'
     quantity = Column(Integer, nullable=False)
     reason = Column(Text)
     performed_by = Column(Integer, ForeignKey("users.id"))
-    created_at = Column(DateTime, server_default=func.now())
+    created_at = Column(DateTime, server_default=func.now(), index=True)
 
     # Relationships
     wine = relationship("Wine", back_populates="transactions")
@@ -64,6 +78,11 @@ class InventoryTransaction(Base):
 
 class OperationLog(Base):
     __tablename__ = "operation_logs"
+    __table_args__ = (
+        Index("ix_operation_logs_user_id_created_at", "user_id", "created_at"),
+        Index("ix_operation_logs_action_type_created_at", "action_type", "created_at"),
+        Index("ix_operation_logs_entity_type_created_at", "entity_type", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -72,7 +91,113 @@ class OperationLog(Base):
     entity_id = Column(Integer)
     details = Column(Text)  # JSON format
     ip_address = Column(String)
-    created_at = Column(DateTime, server_default=func.now())
+    created_at = Column(DateTime, server_default=func.now(), index=True)
 
     # Relationships
     user = relationship("User", back_populates="logs")
+
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (
+        UniqueConstraint("user_id", "key", name="uq_idempotency_keys_user_key"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, nullable=False)
+    key = Column(String, nullable=False)
+    method = Column(String, nullable=False)
+    path = Column(String, nullable=False)
+    request_hash = Column(String, nullable=False)
+    status_code = Column(Integer)  # NULL while the original request is in flight
+    # In-flight lease: a claim left behind by a crash can be taken over after it
+    locked_until = Column(DateTime)
+    response_body = Column(Text)
+    content_type = Column(String)
+    created_at = Column(DateTime, server_default=func.now())
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+# One row per cache namespace, bumped by every write that makes it stale (see cache.py)
+class CacheVersion(Base):
+    __tablename__ = "cache_versions"
+
+    namespace = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+# One row per storage maintenance run (see maintenance.py)
+class MaintenanceRun(Base):
+    __tablename__ = "maintenance_runs"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    started_at = Column(DateTime, nullable=False, index=True)
+    finished_at = Column(DateTime)
+    status = Column(String, nullable=False)  # running, ok, timeout, failed
+    trigger = Column(String, nullable=False)  # schedule or manual
+    results = Column(Text)  # JSON format
+
+
+# One row per scheduled task slot; the unique constraint lets one worker claim it (see scheduler.py)
+class TaskRun(Base):
+    __tablename__ = "task_runs"
+    __table_args__ = (
+        UniqueConstraint("task", "scheduled_for", name="uq_task_runs_task_slot"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    task = Column(String, nullable=False)
+    scheduled_for = Column(DateTime, nullable=False, index=True)
+    started_at = Column(DateTime, nullable=False)
+    finished_at = Column(DateTime)
+    status = Column(String, nullable=False)  # running, ok, failed, timeout
+    duration_ms = Column(Float)
+    error = Column(Text)
+    worker = Column(Integer)  # process id
+
+
+# One row per deleted wine, so change feed clients learn about deletions (see changes.py)
+class WineTombstone(Base):
+    __tablename__ = "wine_tombstones"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    wine_id = Column(Integer, nullable=False)
+    deleted_at = Column(DateTime, nullable=False, server_default=func.now(), index=True)
+    seq = Column(Integer, nullable=False, server_default="0", index=True)
+
+
+# The change feed's counter (a single row): ``seq`` is bumped by every wine
+# insert, update and delete inside the writing transaction; ``purged`` is the
+# highest tombstone seq removed by purge_tombstones
+class ChangeSequence(Base):
+    __tablename__ = "change_sequence"
+
+    id = Column(Integer, primary_key=True)
+    seq = Column(Integer, nullable=False, server_default="0")
+    purged = Column(Integer, nullable=False, server_default="0")
+
+
+_NEXT_CHANGE_SEQ = "UPDATE change_sequence SET seq = seq + 1 WHERE id = 1; "
+_CURRENT_CHANGE_SEQ = "(SELECT seq FROM change_sequence WHERE id = 1)"
+
+# Triggers catch every write path (ORM, bulk statements, scripts); created after
+# every create_all, so existing databases get them on the next start
+for _ddl in (
+    "INSERT OR IGNORE INTO change_sequence (id, seq, purged) VALUES (1, 0, 0)",
+    # Replaced by wines_change_delete, which also stamps the sequence
+    "DROP TRIGGER IF EXISTS wines_tombstone",
+    "CREATE TRIGGER IF NOT EXISTS wines_change_insert AFTER INSERT ON wines BEGIN "
+    + _NEXT_CHANGE_SEQ
+    + f"UPDATE wines SET change_seq = {_CURRENT_CHANGE_SEQ} WHERE id = NEW.id; END",
+    # The WHEN clause keeps the trigger's own UPDATE from firing it again
+    # should recursive_triggers ever be switched on
+    "CREATE TRIGGER IF NOT EXISTS wines_change_update AFTER UPDATE ON wines "
+    "WHEN NEW.change_seq = OLD.change_seq BEGIN "
+    + _NEXT_CHANGE_SEQ
+    + f"UPDATE wines SET change_seq = {_CURRENT_CHANGE_SEQ} WHERE id = NEW.id; END",
+    "CREATE TRIGGER IF NOT EXISTS wines_change_delete AFTER DELETE ON wines BEGIN "
+    + _NEXT_CHANGE_SEQ
+    + "INSERT INTO wine_tombstones (wine_id, deleted_at, seq) "
+    f"VALUES (OLD.id, CURRENT_TIMESTAMP, {_CURRENT_CHANGE_SEQ}); END",
+):
+    event.listen(Base.metadata, "after_create", DDL(_ddl))
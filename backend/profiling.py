@@ -0,0 +1,197 @@
+"""On-demand sampling profiler for individual requests.
+
+An admin adds ``X-Profile: 1`` (or ``?profile=1``) to any request; with
+``PROFILE_SAMPLE_RATE=N`` one in N requests is also profiled automatically.
+While the request runs, a background thread samples the Python stacks of the
+event loop and worker threads and the result is written as collapsed stacks
+(``frame;frame;frame count`` lines) that flamegraph.pl and speedscope read
+directly. Profiles are listed and downloaded through ``/api/profiles``.
+
+Samples cover every busy thread, so concurrent requests show up in the same
+profile; profile on a quiet instance for a clean picture.
+"""
+
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import Request
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from auth import get_user_id_from_authorization
+from database import ReadSessionLocal
+from models import User
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_DIR = os.path.abspath(os.getenv("PROFILE_DIR", "profiles"))
+PROFILE_SAMPLE_RATE = int(os.getenv("PROFILE_SAMPLE_RATE", "0"))  # 0 disables automatic sampling
+PROFILE_INTERVAL_SECONDS = float(os.getenv("PROFILE_INTERVAL_MS", "2")) / 1000
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+PROFILE_SUFFIX = ".collapsed"
+
+# Innermost frames of threads that are parked rather than doing work
+_IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+_UNSAFE_CHARS = re.compile(r"[^A-Za-z0-9_-]+")
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class StackSampler:
+    """Samples the stacks of all busy threads at a fixed interval"""
+
+    def __init__(self, interval: float = PROFILE_INTERVAL_SECONDS):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.samples += 1
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in _IDLE_FRAMES:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(labels))] += 1
+
+
+def _is_admin(user_id: Optional[int]) -> bool:
+    if user_id is None:
+        return False
+    db = ReadSessionLocal()
+    try:
+        user = db.query(User).filter(User.id == user_id).first()
+        return user is not None and user.is_active and user.role == "admin"
+    finally:
+        db.close()
+
+
+def save_profile(request: Request, stacks: Counter, elapsed: float) -> str:
+    """Write collapsed stacks to PROFILE_DIR and prune old profiles"""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path_part = _UNSAFE_CHARS.sub("_", request.url.path).strip("_")[:80]
+    name = (
+        f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{request.method}_{path_part}"
+        f"_{int(elapsed * 1000)}ms{PROFILE_SUFFIX}"
+    )
+    with open(os.path.join(PROFILE_DIR, name), "w", encoding="utf-8") as f:
+        for stack, count in stacks.most_common():
+            f.write(f"{stack} {count}\n")
+
+    for old in list_profiles()[PROFILE_KEEP:]:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, old["name"]))
+        except OSError:
+            pass
+    return name
+
+
+def list_profiles() -> List[dict]:
+    """Stored profiles, newest first"""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for entry in os.scandir(PROFILE_DIR):
+        if entry.is_file() and entry.name.endswith(PROFILE_SUFFIX):
+            stat = entry.stat()
+            profiles.append({
+                "name": entry.name,
+                "size": stat.st_size,
+                "created_at": datetime.fromtimestamp(stat.st_mtime)
+            })
+    profiles.sort(key=lambda p: p["name"], reverse=True)
+    return profiles
+
+
+def profile_path(name: str) -> Optional[str]:
+    """Resolve a profile name to its file, refusing anything outside PROFILE_DIR"""
+    if os.path.basename(name) != name or not name.endswith(PROFILE_SUFFIX):
+        return None
+    path = os.path.join(PROFILE_DIR, name)
+    return path if os.path.isfile(path) else None
+
+
+class ProfilingMiddleware:
+    """Profile admin-flagged requests and a 1-in-N sample of all requests
+
+    Plain ASGI rather than BaseHTTPMiddleware, so the requests that are not
+    profiled (nearly all of them) pass straight through to the app.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request = Request(scope)
+        requested = (
+            request.headers.get(PROFILE_HEADER) == "1"
+            or request.query_params.get("profile") == "1"
+        )
+        if requested:
+            user_id = get_user_id_from_authorization(request.headers.get("Authorization"))
+            requested = await run_in_threadpool(_is_admin, user_id)
+        sampled = PROFILE_SAMPLE_RATE > 0 and random.randrange(PROFILE_SAMPLE_RATE) == 0
+
+        if not (requested or sampled):
+            await self.app(scope, receive, send)
+            return
+
+        sampler = StackSampler()
+        started = time.perf_counter()
+        stopped = False
+
+        async def send_profiled(message: Message):
+            nonlocal stopped
+            # The profile covers the request up to its response headers
+            if message["type"] == "http.response.start" and not stopped:
+                stopped = True
+                stacks = sampler.stop()
+                elapsed = time.perf_counter() - started
+                name = await run_in_threadpool(save_profile, request, stacks, elapsed)
+                if requested:
+                    MutableHeaders(scope=message).append("X-Profile-Id", name)
+            await send(message)
+
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_profiled)
+        finally:
+            if not stopped:
+                sampler.stop()
@@ -0,0 +1,234 @@
+"""Development-mode detector for N+1 queries, slow statements and full scans.
+
+Every SQL statement is reduced to a fingerprint (its shape without literal
+values). A fingerprint that repeats more than ``N_PLUS_ONE_THRESHOLD`` times in
+one request is reported with the application call sites that issued it, and
+each distinct SELECT is run through ``EXPLAIN QUERY PLAN`` to find full table
+scans.
+
+Enable it for the server with ``QUERY_DEBUG=1``, or wrap code in
+``detect_queries()`` from a test and call ``raise_for_problems()``::
+
+    with detect_queries() as report:
+        client.get("/api/inventory", headers=headers)
+    report.raise_for_problems()
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import Request
+from sqlalchemy import event
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from database import all_engines, engine
+
+logger = logging.getLogger("wine_inventory.query_debug")
+
+QUERY_DEBUG = os.getenv("QUERY_DEBUG", "").lower() in ("1", "true", "yes")
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "5"))
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+_IGNORED_FILES = {os.path.abspath(__file__), os.path.join(BACKEND_DIR, "metrics.py")}
+
+_IN_LIST = re.compile(r"IN \((?:\?, )*\?\)|IN \(__\[POSTCOMPILE_\w+\]\)")
+_WHITESPACE = re.compile(r"\s+")
+_FULL_SCAN = re.compile(r"^SCAN (\w+)(?: AS \w+)?$")
+
+
+class QueryProblemError(AssertionError):
+    """Raised by ``QueryReport.raise_for_problems()`` in tests"""
+
+
+def fingerprint(statement: str) -> str:
+    """Normalize a statement so queries differing only in values compare equal"""
+    normalized = _WHITESPACE.sub(" ", statement).strip()
+    return _IN_LIST.sub("IN (?...)", normalized)
+
+
+def _call_site() -> Optional[str]:
+    """Innermost application frame that led to the current statement"""
+    for frame in reversed(traceback.extract_stack()):
+        filename = os.path.abspath(frame.filename)
+        if (
+            filename.startswith(BACKEND_DIR)
+            and filename not in _IGNORED_FILES
+            and "site-packages" not in filename
+        ):
+            return f"{os.path.relpath(filename, BACKEND_DIR)}:{frame.lineno} in {frame.name}"
+    return None
+
+
+class StatementStats:
+    __slots__ = ("fingerprint", "statement", "parameters", "count", "total_seconds", "max_seconds", "call_sites")
+
+    def __init__(self, fingerprint: str, statement: str, parameters):
+        self.fingerprint = fingerprint
+        self.statement = statement
+        self.parameters = parameters
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.call_sites: Dict[str, int] = {}
+
+
+class QueryReport:
+    """Statements recorded for one request or one ``detect_queries()`` block"""
+
+    def __init__(self, threshold: int = N_PLUS_ONE_THRESHOLD, slow_ms: float = SLOW_QUERY_MS):
+        self.threshold = threshold
+        self.slow_ms = slow_ms
+        self.statements: Dict[str, StatementStats] = {}
+        self.full_scans: List[Tuple[str, List[str]]] = []
+        self._lock = threading.Lock()
+        self._analyzed = False
+
+    @property
+    def query_count(self) -> int:
+        return sum(s.count for s in self.statements.values())
+
+    def record(self, statement: str, parameters, elapsed: float, executemany: bool):
+        key = fingerprint(statement)
+        site = _call_site() or "<unknown>"
+        with self._lock:
+            stats = self.statements.get(key)
+            if stats is None:
+                stats = self.statements[key] = StatementStats(
+                    key, statement, None if executemany else parameters
+                )
+            stats.count += 1
+            stats.total_seconds += elapsed
+            stats.max_seconds = max(stats.max_seconds, elapsed)
+            stats.call_sites[site] = stats.call_sites.get(site, 0) + 1
+
+    def repeated(self) -> List[StatementStats]:
+        """Statement shapes issued more often than the N+1 threshold"""
+        return sorted(
+            (s for s in self.statements.values() if s.count > self.threshold),
+            key=lambda s: -s.count
+        )
+
+    def slow(self) -> List[StatementStats]:
+        return [s for s in self.statements.values() if s.max_seconds * 1000 >= self.slow_ms]
+
+    def analyze(self):
+        """Run EXPLAIN QUERY PLAN for each distinct SELECT and collect full scans"""
+        if self._analyzed:
+            return
+        self._analyzed = True
+        # A raw DBAPI cursor keeps these statements out of the recorded stats
+        connection = engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            for stats in list(self.statements.values()):
+                if not stats.statement.lstrip().upper().startswith(("SELECT", "WITH")):
+                    continue
+                try:
+                    cursor.execute("EXPLAIN QUERY PLAN " + stats.statement, stats.parameters or ())
+                except Exception as e:
+                    logger.debug("EXPLAIN failed for %s: %s", stats.fingerprint, e)
+                    continue
+                plan = [row[3] for row in cursor.fetchall()]
+                tables = [m.group(1) for m in map(_FULL_SCAN.match, plan) if m]
+                if tables:
+                    self.full_scans.append((stats.fingerprint, plan))
+            cursor.close()
+        finally:
+            connection.close()
+
+    def problems(self) -> List[str]:
+        self.analyze()
+        problems = []
+        for stats in self.repeated():
+            sites = ", ".join(f"{site} (x{count})" for site, count in stats.call_sites.items())
+            problems.append(
+                f"N+1: statement repeated {stats.count} times (threshold {self.threshold}) at {sites}\n"
+                f"    {stats.fingerprint}"
+            )
+        for stats in self.slow():
+            problems.append(
+                f"Slow query: {stats.max_seconds * 1000:.1f} ms (threshold {self.slow_ms:.0f} ms)\n"
+                f"    {stats.fingerprint}"
+            )
+        for statement, plan in self.full_scans:
+            problems.append(
+                f"Full table scan: {'; '.join(plan)}\n"
+                f"    {statement}"
+            )
+        return problems
+
+    def raise_for_problems(self):
+        problems = self.problems()
+        if problems:
+            raise QueryProblemError("\n".join(problems))
+
+
+current_report: ContextVar[Optional[QueryReport]] = ContextVar("current_query_report", default=None)
+# Reports opened by detect_queries() see statements from every thread, since
+# test clients run the app in a different thread than the test body
+_global_reports: List[QueryReport] = []
+_global_lock = threading.Lock()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info["query_debug_start_time"] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop("query_debug_start_time", None)
+    report = current_report.get()
+    if (report is None and not _global_reports) or started is None:
+        return
+    elapsed = time.perf_counter() - started
+    if report is not None:
+        report.record(statement, parameters, elapsed, executemany)
+    for global_report in list(_global_reports):
+        if global_report is not report:
+            global_report.record(statement, parameters, elapsed, executemany)
+
+
+for _engine in all_engines:
+    event.listen(_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+@contextmanager
+def detect_queries(threshold: int = N_PLUS_ONE_THRESHOLD, slow_ms: float = SLOW_QUERY_MS):
+    """Record every statement issued inside the block"""
+    report = QueryReport(threshold, slow_ms)
+    with _global_lock:
+        _global_reports.append(report)
+    try:
+        yield report
+    finally:
+        with _global_lock:
+            _global_reports.remove(report)
+
+
+class QueryDebugMiddleware(BaseHTTPMiddleware):
+    """Log N+1 patterns, slow statements and full scans for every request"""
+
+    async def dispatch(self, request: Request, call_next):
+        report = QueryReport()
+        token = current_report.set(report)
+        try:
+            response = await call_next(request)
+        finally:
+            current_report.reset(token)
+
+        problems = await run_in_threadpool(report.problems)
+        if problems:
+            logger.warning(
+                "Query problems in %s %s (%d queries):\n%s",
+                request.method, request.url.path, report.query_count, "\n".join(problems)
+            )
+        return response
@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+"""Replay real traffic recorded in the operation log.
+
+``capture`` turns a window of ``operation_logs`` into a timed request trace
+(JSON lines): logins, logouts, stock in/out and batches, wine create / update /
+delete and bulk changes, exports and imports, each at its recorded offset.
+Users become opaque aliases; ``--anonymize`` also replaces free text (reasons,
+wine names, notes, bulk filters) with placeholders so a trace can leave the
+building.
+
+``run`` fires the trace at a test instance open-loop, at recorded speed or
+accelerated with ``--speed``, and reports throughput, latency and errors per
+action plus how far the replayer fell behind schedule. Every alias logs in
+with the ``--email``/``--password`` account, so the target needs only that.
+
+Replay against a copy of the source database so wine IDs line up; wines
+created during the trace are mapped to the IDs the target assigns them.
+Reads are not audited, so the trace carries the write, login and export shape
+of real traffic; combine with loadgen.py for read-heavy mixes.
+
+Examples:
+    python replay.py capture --database wine_inventory.db --start 2025-12-01 --end 2025-12-02 \\
+        --anonymize --output traces/dec01.jsonl
+    python replay.py run traces/dec01.jsonl --url http://127.0.0.1:8000 --speed 20
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+from database import SQLALCHEMY_DATABASE_URL
+from loadgen import ADMIN_EMAIL, ADMIN_PASSWORD, Stats, error_kind
+from models import OperationLog
+
+TRACE_VERSION = 1
+# Replaced with placeholders under --anonymize: wine fields and bulk filter keys
+FREE_TEXT_FIELDS = ("name", "notes", "supplier")
+FREE_TEXT_FILTERS = ("search", "supplier", "storage_location")
+
+
+def _alias(user_id: Optional[int], salt: str) -> str:
+    digest = hashlib.sha256(f"{salt}:{user_id}".encode()).hexdigest()
+    return f"u{digest[:10]}"
+
+
+def _text(value, anonymize: bool, placeholder: str):
+    if value is None or not anonymize:
+        return value
+    return placeholder
+
+
+def _anonymize_fields(values: dict, anonymize: bool, fields) -> dict:
+    values = dict(values)
+    if anonymize:
+        for field in fields:
+            if field in values:
+                values[field] = f"回放{field}"
+    return values
+
+
+def log_to_request(log: OperationLog, anonymize: bool) -> Optional[dict]:
+    """Request that produced an audit entry, or None when it can't be rebuilt
+
+    User administration and bulk creates (whose entries keep only IDs) are not
+    replayed.
+    """
+    try:
+        details = json.loads(log.details) if log.details else {}
+    except ValueError:
+        details = {}
+    action = log.action_type
+
+    if action == "login":
+        return {"method": "POST", "path": "/api/auth/login"}
+    if action == "logout":
+        return {"method": "POST", "path": "/api/auth/logout"}
+    if action in ("stock_in", "stock_out") and log.entity_id:
+        return {
+            "method": "POST",
+            "path": "/api/inventory/in" if action == "stock_in" else "/api/inventory/out",
+            "json": {
+                "quantity": details.get("quantity", 1),
+                "reason": _text(details.get("reason"), anonymize, "回放"),
+            },
+            "wine": log.entity_id,
+        }
+    if action == "stock_batch":
+        lines = []
+        for entry in details.get("wines", []):
+            delta = entry.get("new_stock", 0) - entry.get("old_stock", 0)
+            if delta:
+                lines.append({
+                    "wine": entry["wine_id"],
+                    "transaction_type": "in" if delta > 0 else "out",
+                    "quantity": abs(delta),
+                })
+        return {"method": "POST", "path": "/api/inventory/batch", "lines": lines} if lines else None
+    if log.entity_type == "wine" and action == "create":
+        return {
+            "method": "POST",
+            "path": "/api/wines",
+            "json": {
+                "name": _text(details.get("name"), anonymize, f"回放红酒 {log.entity_id}") or f"回放红酒 {log.entity_id}",
+                "vintage_year": details.get("vintage_year") or 2020,
+                "region": "回放",
+            },
+            "creates": log.entity_id,
+        }
+    if log.entity_type == "wine" and action == "update" and log.entity_id:
+        changes = _anonymize_fields(details.get("new") or {}, anonymize, FREE_TEXT_FIELDS)
+        return {"method": "PUT", "path": "/api/wines/{wine}", "json": changes, "wine": log.entity_id}
+    if log.entity_type == "wine" and action == "delete" and log.entity_id:
+        return {"method": "DELETE", "path": "/api/wines/{wine}", "wine": log.entity_id}
+    if action == "bulk_update" and details.get("filter"):
+        changes = _anonymize_fields(details.get("new") or {}, anonymize, FREE_TEXT_FIELDS)
+        bulk_filter = _anonymize_fields(details["filter"], anonymize, FREE_TEXT_FILTERS)
+        return {"method": "PUT", "path": "/api/wines/bulk", "json": {"filter": bulk_filter, "changes": changes}}
+    if action == "bulk_delete" and details.get("ids"):
+        return {"method": "POST", "path": "/api/wines/bulk-delete", "json": {"filter": {"ids": details["ids"]}}}
+    if action == "export":
+        path = "/api/export/transactions" if log.entity_type == "transaction" else "/api/export/wines"
+        return {"method": "GET", "path": path, "params": {"format": details.get("format", "csv")}}
+    if action == "import":
+        return {"method": "POST", "path": "/api/import/wines", "csv_rows": max(1, details.get("created", 1))}
+    return None
+
+
+def capture(args) -> int:
+    url = f"sqlite:///{args.database}" if args.database else SQLALCHEMY_DATABASE_URL
+    engine = create_engine(url)
+    end = datetime.fromisoformat(args.end) if args.end else None
+    start = datetime.fromisoformat(args.start) if args.start else None
+    if start is None:
+        with Session(engine) as db:
+            latest = db.scalar(select(OperationLog.created_at).order_by(OperationLog.created_at.desc()).limit(1))
+        if latest is None:
+            raise SystemExit("The operation log is empty")
+        end = end or latest + timedelta(seconds=1)
+        start = end - timedelta(hours=args.hours)
+    end = end or start + timedelta(hours=args.hours)
+
+    query = (
+        select(OperationLog)
+        .where(OperationLog.created_at >= start, OperationLog.created_at < end)
+        .order_by(OperationLog.created_at, OperationLog.id)
+    )
+    salt = args.salt or os.urandom(8).hex()
+    events, skipped = [], {}
+    with Session(engine) as db:
+        for log in db.scalars(query.execution_options(yield_per=10000)):
+            request = log_to_request(log, args.anonymize)
+            if request is None:
+                skipped[log.action_type] = skipped.get(log.action_type, 0) + 1
+                continue
+            request["t"] = round((log.created_at - start).total_seconds(), 3)
+            request["user"] = _alias(log.user_id, salt)
+            request["action"] = log.action_type
+            events.append(request)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        header = {
+            "trace": TRACE_VERSION,
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "duration": (end - start).total_seconds(),
+            "events": len(events),
+            "users": len({e["user"] for e in events}),
+            "anonymized": args.anonymize,
+            "skipped": skipped,
+        }
+        f.write(json.dumps(header, ensure_ascii=False) + "\n")
+        for event in events:
+            f.write(json.dumps(event, ensure_ascii=False) + "\n")
+
+    print(f"Captured {len(events):,} requests from {start} to {end} ({header['users']} users) -> {args.output}")
+    if skipped:
+        print(f"Skipped: {', '.join(f'{action} {count}' for action, count in sorted(skipped.items()))}")
+    return 0
+
+
+def read_trace(path: str) -> Tuple[dict, List[dict]]:
+    with open(path, encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        if header.get("trace") != TRACE_VERSION:
+            raise SystemExit(f"{path} is not a version {TRACE_VERSION} trace")
+        return header, [json.loads(line) for line in f if line.strip()]
+
+
+def _import_csv(rows: int) -> bytes:
+    lines = ["name,vintage_year,region,current_stock"]
+    lines += [f"回放导入 {i},2020,回放,6" for i in range(rows)]
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+class Replayer:
+    """Fires trace events on schedule and keeps per-alias sessions"""
+
+    def __init__(self, client: httpx.AsyncClient, email: str, password: str, max_in_flight: int):
+        self.client = client
+        self.email = email
+        self.password = password
+        self.tokens: Dict[str, str] = {}
+        self.wine_ids: Dict[int, int] = {}
+        self.stats = Stats()
+        self.slots = asyncio.Semaphore(max_in_flight)
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.lags: List[float] = []
+
+    def wine(self, trace_id: int) -> int:
+        return self.wine_ids.get(trace_id, trace_id)
+
+    async def login(self, user: str) -> httpx.Response:
+        response = await self.client.post("/api/auth/login", json={"email": self.email, "password": self.password})
+        if response.status_code == 200:
+            self.tokens[user] = response.json()["access_token"]
+        return response
+
+    async def send(self, event: dict) -> httpx.Response:
+        if event["action"] == "login":
+            return await self.login(event["user"])
+        if event["user"] not in self.tokens:
+            # Sessions that started before the window
+            await self.login(event["user"])
+        headers = {"Authorization": f"Bearer {self.tokens.get(event['user'], '')}"}
+
+        path = event["path"]
+        if "wine" in event:
+            path = path.replace("{wine}", str(self.wine(event["wine"])))
+        body = event.get("json")
+        if "wine" in event and event["path"].startswith("/api/inventory/"):
+            body = dict(body, wine_id=self.wine(event["wine"]))
+        if "lines" in event:
+            body = {"lines": [
+                {"wine_id": self.wine(line["wine"]), "transaction_type": line["transaction_type"], "quantity": line["quantity"]}
+                for line in event["lines"]
+            ]}
+        files = None
+        if "csv_rows" in event:
+            files = {"file": ("replay.csv", _import_csv(event["csv_rows"]), "text/csv")}
+
+        response = await self.client.request(
+            event["method"], path, headers=headers, json=body, params=event.get("params"), files=files
+        )
+        if "creates" in event and response.status_code == 201:
+            self.wine_ids[event["creates"]] = response.json()["id"]
+        if event["action"] == "logout":
+            self.tokens.pop(event["user"], None)
+        return response
+
+    async def fire(self, event: dict, scheduled: float):
+        async with self.slots:
+            self.lags.append(max(0.0, time.perf_counter() - scheduled))
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            started = time.perf_counter()
+            try:
+                kind = error_kind(await self.send(event))
+            except httpx.TimeoutException:
+                kind = "timeout"
+            except httpx.TransportError:
+                kind = "connection"
+            finally:
+                self.in_flight -= 1
+            self.stats.record(event["action"], time.perf_counter() - started, kind)
+
+
+async def replay(args, events: List[dict]) -> dict:
+    limits = httpx.Limits(max_connections=args.max_in_flight, max_keepalive_connections=args.max_in_flight)
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        replayer = Replayer(client, args.email, args.password, args.max_in_flight)
+        tasks = []
+        started = time.perf_counter()
+        offset = events[0]["t"] if events else 0.0
+        for event in events:
+            scheduled = started + (event["t"] - offset) / args.speed if args.speed else started
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(replayer.fire(event, scheduled)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+    lags = sorted(replayer.lags)
+    return {
+        "elapsed_seconds": round(elapsed, 2),
+        "peak_in_flight": replayer.peak_in_flight,
+        "schedule_lag_p95_ms": round(lags[int(0.95 * (len(lags) - 1))] * 1000, 1) if lags else 0.0,
+        "schedule_lag_max_ms": round(lags[-1] * 1000, 1) if lags else 0.0,
+        **replayer.stats.summary(elapsed),
+    }
+
+
+def run(args) -> int:
+    header, events = read_trace(args.trace)
+    if args.limit:
+        events = events[:args.limit]
+    if not events:
+        raise SystemExit("The trace has no events")
+    span = events[-1]["t"] - events[0]["t"]
+    print(
+        f"Replaying {len(events):,} requests spanning {span:,.0f}s "
+        f"at {'max speed' if not args.speed else f'{args.speed:g}x'} against {args.url}"
+    )
+    result = asyncio.run(replay(args, events))
+    result["trace"] = {"path": args.trace, "start": header["start"], "end": header["end"], "speed": args.speed}
+
+    print(
+        f"{result['requests']:,} requests in {result['elapsed_seconds']:.1f}s ({result['throughput_rps']:.1f} req/s)  "
+        f"p50 {result['p50_ms']:.1f} ms  p95 {result['p95_ms']:.1f} ms  p99 {result['p99_ms']:.1f} ms  "
+        f"peak in flight {result['peak_in_flight']}"
+    )
+    errors = ", ".join(f"{kind} {count}" for kind, count in result["errors"].items() if count) or "none"
+    print(f"Errors: {errors}   schedule lag p95 {result['schedule_lag_p95_ms']:.0f} ms, max {result['schedule_lag_max_ms']:.0f} ms")
+    for action, stats in result["actions"].items():
+        action_errors = ", ".join(f"{kind} {count}" for kind, count in stats["errors"].items()) or "-"
+        print(
+            f"  {action:<16} {stats['requests']:>7}  p50 {stats['p50_ms']:>8.1f} ms  "
+            f"p95 {stats['p95_ms']:>8.1f} ms  errors: {action_errors}"
+        )
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"Report written to {args.output}")
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Capture and replay traffic from the operation log")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    capture_parser = commands.add_parser("capture", help="turn an operation log window into a request trace")
+    capture_parser.add_argument("--database", help="SQLite file to read (default: the application database)")
+    capture_parser.add_argument("--start", help="window start, ISO date/time (default: --hours before the last entry)")
+    capture_parser.add_argument("--end", help="window end, ISO date/time (exclusive)")
+    capture_parser.add_argument("--hours", type=float, default=1, help="window length when --start or --end is missing")
+    capture_parser.add_argument("--anonymize", action="store_true", help="replace reasons, names and notes with placeholders")
+    capture_parser.add_argument("--salt", help="salt for user aliases (default: random per capture)")
+    capture_parser.add_argument("--output", required=True)
+
+    run_parser = commands.add_parser("run", help="replay a trace against a running server")
+    run_parser.add_argument("trace")
+    run_parser.add_argument("--url", default="http://127.0.0.1:8000")
+    run_parser.add_argument("--speed", type=float, default=1.0, help="time compression factor; 0 replays as fast as possible")
+    run_parser.add_argument("--max-in-flight", type=int, default=200, help="cap on concurrent requests")
+    run_parser.add_argument("--timeout", type=float, default=30)
+    run_parser.add_argument("--limit", type=int, help="replay only the first N events")
+    run_parser.add_argument("--email", default=os.getenv("LOADGEN_EMAIL", ADMIN_EMAIL))
+    run_parser.add_argument("--password", default=os.getenv("LOADGEN_PASSWORD", ADMIN_PASSWORD))
+    run_parser.add_argument("--output", help="write the report as JSON")
+
+    args = parser.parse_args(argv)
+    if args.command == "capture":
+        return capture(args)
+    if args.speed < 0:
+        parser.error("--speed must be >= 0")
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,6 +5,12 @@ from .dashboard import router as dashboard_router
 from .users import router as users_router
 from .logs import router as logs_router
 from .export_import import router as export_import_router
+from .events import router as events_router
+from .metrics import router as metrics_router
+from .profiles import router as profiles_router
+from .backups import router as backups_router
+from .maintenance import router as maintenance_router
+from .scheduler import router as scheduler_router
 
 __all__ = [
     "auth_router",
@@ -13,5 +19,11 @@ __all__ = [
     "dashboard_router",
     "users_router",
     "logs_router",
-    "export_import_router"
+    "export_import_router",
+    "events_router",
+    "metrics_router",
+    "profiles_router",
+    "backups_router",
+    "maintenance_router",
+    "scheduler_router"
 ]
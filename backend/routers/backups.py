@@ -0,0 +1,44 @@
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.responses import FileResponse
+
+from models import User
+from auth import get_current_admin_user
+from backup import BACKUP_PAGES_PER_STEP, BACKUP_STEP_SLEEP_SECONDS, backup_path, create_backup, list_backups
+
+router = APIRouter()
+
+
+@router.get("")
+def get_backups(
+    current_user: User = Depends(get_current_admin_user)
+):
+    """List stored backups, newest first (admin only)"""
+    return list_backups()
+
+
+@router.post("", status_code=status.HTTP_201_CREATED)
+def post_backup(
+    compress: bool = False,
+    pages: int = Query(default=BACKUP_PAGES_PER_STEP, ge=1, le=100000),
+    sleep_ms: float = Query(default=BACKUP_STEP_SLEEP_SECONDS * 1000, ge=0, le=1000),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Write an online snapshot of the database without blocking writers (admin only)"""
+    result = create_backup(compress=compress, pages=pages, sleep=sleep_ms / 1000)
+    result.pop("path")
+    return result
+
+
+@router.get("/{name}")
+def download_backup(
+    name: str,
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Download a stored backup (admin only)"""
+    path = backup_path(name)
+    if path is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="备份不存在"
+        )
+    return FileResponse(path, media_type="application/octet-stream", filename=name)
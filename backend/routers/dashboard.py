@@ -1,29 +1,27 @@
 from fastapi import APIRouter, Depends, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, cast, Integer
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import List, Optional
 
 from database import get_db
 from models import Wine, InventoryTransaction, User
 from schemas import DashboardSummary, StockTrend, StockDistribution
 from auth import get_current_user
+from cache import cache, DASHBOARD
 
 router = APIRouter()
 
 
-@router.get("/summary", response_model=DashboardSummary)
-def get_dashboard_summary(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    """Get dashboard summary statistics"""
+def build_summary(db: Session) -> DashboardSummary:
+    """Compute dashboard summary statistics"""
     total_wines = db.query(func.count(Wine.id)).scalar() or 0
     total_stock = db.query(func.sum(Wine.current_stock)).scalar() or 0
 
     # Calculate total value (price * stock for each wine)
-    wines = db.query(Wine).all()
-    total_value = sum((w.price or 0) * w.current_stock for w in wines)
+    total_value = db.query(
+        func.sum(func.coalesce(Wine.price, 0) * Wine.current_stock)
+    ).scalar() or 0
 
     # Count low stock wines (current_stock <= low_stock_threshold and > 0)
     low_stock_count = db.query(func.count(Wine.id)).filter(
@@ -45,45 +43,63 @@ def get_dashboard_summary(
     )
 
 
-@router.get("/trends")
-def get_stock_trends(
-    days: int = Query(default=7, ge=1, le=365),
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    """Get stock in/out trends over time"""
+def build_trends(db: Session, days: int) -> List[StockTrend]:
+    """Compute daily stock in/out totals for the last days"""
     end_date = datetime.now()
     start_date = end_date - timedelta(days=days)
 
+    # Day i covers [start_date + i days, start_date + i + 1 days); one grouped
+    # query for the whole range instead of two per day
+    day = cast(
+        func.julianday(InventoryTransaction.created_at) - func.julianday(start_date), Integer
+    ).label("day")
+    totals = dict(
+        ((d, transaction_type), quantity)
+        for d, transaction_type, quantity in db.query(
+            day, InventoryTransaction.transaction_type, func.sum(InventoryTransaction.quantity)
+        ).filter(
+            InventoryTransaction.created_at >= start_date,
+            InventoryTransaction.created_at < start_date + timedelta(days=days + 1)
+        ).group_by(day, InventoryTransaction.transaction_type)
+    )
+
     trends = []
-    current_date = start_date
+    for i in range(days + 1):
+        current_date = start_date + timedelta(days=i)
+        trends.append(StockTrend(
+            date=current_date.strftime("%Y-%m-%d"),
+            stock_in=totals.get((i, "in"), 0),
+            stock_out=totals.get((i, "out"), 0)
+        ))
 
-    while current_date <= end_date:
-        next_date = current_date + timedelta(days=1)
+    return trends
 
-        # Get stock in for this day
-        stock_in = db.query(func.sum(InventoryTransaction.quantity)).filter(
-            InventoryTransaction.transaction_type == "in",
-            InventoryTransaction.created_at >= current_date,
-            InventoryTransaction.created_at < next_date
-        ).scalar() or 0
 
-        # Get stock out for this day
-        stock_out = db.query(func.sum(InventoryTransaction.quantity)).filter(
-            InventoryTransaction.transaction_type == "out",
-            InventoryTransaction.created_at >= current_date,
-            InventoryTransaction.created_at < next_date
-        ).scalar() or 0
+def count_alerts(db: Session) -> int:
+    """Count wines at or below their low stock threshold"""
+    return db.query(func.count(Wine.id)).filter(
+        Wine.current_stock <= Wine.low_stock_threshold
+    ).scalar() or 0
+
 
-        trends.append(StockTrend(
-            date=current_date.strftime("%Y-%m-%d"),
-            stock_in=stock_in,
-            stock_out=stock_out
-        ))
+@router.get("/summary", response_model=DashboardSummary)
+def get_dashboard_summary(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get dashboard summary statistics"""
+    return cache.get_or_load(DASHBOARD, "summary", lambda: build_summary(db))
 
-        current_date = next_date
 
-    return trends
+@router.get("/trends")
+def get_stock_trends(
+    days: int = Query(default=7, ge=1, le=365),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get stock in/out trends over time"""
+    # Day buckets follow the clock, so trends also expire on their own
+    return cache.get_or_load(DASHBOARD, ("trends", days), lambda: build_trends(db, days), ttl=60)
 
 
 @router.get("/distribution/region")
@@ -92,15 +108,17 @@ def get_distribution_by_region(
     db: Session = Depends(get_db)
 ):
     """Get stock distribution by region"""
-    results = db.query(
-        Wine.region,
-        func.sum(Wine.current_stock).label("total_stock")
-    ).group_by(Wine.region).all()
+    def load():
+        results = db.query(
+            Wine.region,
+            func.sum(Wine.current_stock).label("total_stock")
+        ).group_by(Wine.region).all()
+        return [
+            StockDistribution(name=r.region or "未知", value=r.total_stock or 0)
+            for r in results
+        ]
 
-    return [
-        StockDistribution(name=r.region or "未知", value=r.total_stock or 0)
-        for r in results
-    ]
+    return cache.get_or_load(DASHBOARD, "distribution_region", load)
 
 
 @router.get("/distribution/variety")
@@ -109,15 +127,17 @@ def get_distribution_by_variety(
     db: Session = Depends(get_db)
 ):
     """Get stock distribution by grape variety"""
-    results = db.query(
-        Wine.grape_variety,
-        func.sum(Wine.current_stock).label("total_stock")
-    ).group_by(Wine.grape_variety).all()
+    def load():
+        results = db.query(
+            Wine.grape_variety,
+            func.sum(Wine.current_stock).label("total_stock")
+        ).group_by(Wine.grape_variety).all()
+        return [
+            StockDistribution(name=r.grape_variety or "未知", value=r.total_stock or 0)
+            for r in results
+        ]
 
-    return [
-        StockDistribution(name=r.grape_variety or "未知", value=r.total_stock or 0)
-        for r in results
-    ]
+    return cache.get_or_load(DASHBOARD, "distribution_variety", load)
 
 
 @router.get("/alerts")
@@ -126,8 +146,4 @@ def get_alerts_count(
     db: Session = Depends(get_db)
 ):
     """Get count of low stock alerts"""
-    low_stock_count = db.query(func.count(Wine.id)).filter(
-        Wine.current_stock <= Wine.low_stock_threshold
-    ).scalar() or 0
-
-    return {"low_stock_count": low_stock_count}
+    return {"low_stock_count": cache.get_or_load(DASHBOARD, "alerts", lambda: count_alerts(db))}
@@ -0,0 +1,39 @@
+import asyncio
+
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import StreamingResponse
+
+from models import User
+from auth import get_current_user
+from events import broadcaster, EVENTS_KEEPALIVE_SECONDS
+
+router = APIRouter()
+
+
+@router.get("/stream")
+async def stream_events(
+    request: Request,
+    current_user: User = Depends(get_current_user)
+):
+    """Stream live summary, alert and stock events (Server-Sent Events)"""
+    queue = await broadcaster.subscribe()
+
+    async def event_generator():
+        try:
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=EVENTS_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected() or not broadcaster.is_subscribed(queue):
+                        break
+                    yield ": keepalive\n\n"
+                    continue
+                yield message
+        finally:
+            broadcaster.unsubscribe(queue)
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -1,5 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Query
 from fastapi.responses import StreamingResponse
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 from typing import Optional
 import csv
@@ -7,10 +8,12 @@ import io
 import json
 from datetime import datetime
 
-from database import get_db
+from database import get_db, get_write_db
 from models import User, Wine, InventoryTransaction, OperationLog
 from schemas import WineCreate
 from auth import get_current_user, get_password_hash
+from events import publish
+from write_queue import run_write
 
 router = APIRouter()
 
@@ -21,7 +24,7 @@ def export_wines(
     region: Optional[str] = None,
     grape_variety: Optional[str] = None,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_write_db)
 ):
     """Export wines to CSV or Excel format"""
     query = db.query(Wine)
@@ -87,10 +90,22 @@ def export_transactions(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_write_db)
 ):
     """Export inventory transactions to CSV"""
-    query = db.query(InventoryTransaction)
+    # Names are joined in: loading them per row was two queries per transaction
+    query = db.query(
+        InventoryTransaction.id,
+        InventoryTransaction.wine_id,
+        InventoryTransaction.transaction_type,
+        InventoryTransaction.quantity,
+        InventoryTransaction.reason,
+        InventoryTransaction.created_at,
+        Wine.name.label("wine_name"),
+        User.name.label("performer_name")
+    ).outerjoin(Wine, Wine.id == InventoryTransaction.wine_id).outerjoin(
+        User, User.id == InventoryTransaction.performed_by
+    )
 
     if transaction_type:
         query = query.filter(InventoryTransaction.transaction_type == transaction_type)
@@ -125,11 +140,11 @@ def export_transactions(
         writer.writerow([
             t.id,
             t.wine_id,
-            t.wine.name if t.wine else "",
+            t.wine_name or "",
             "入库" if t.transaction_type == "in" else "出库",
             t.quantity,
             t.reason or "",
-            t.performer.name if t.performer else "",
+            t.performer_name or "",
             t.created_at.strftime("%Y-%m-%d %H:%M:%S") if t.created_at else ""
         ])
 
@@ -154,6 +169,20 @@ def export_transactions(
     )
 
 
+def _import_wines(db: Session, rows: list, error_count: int, user_id: int):
+    """Insert the parsed CSV rows (write_queue operation)"""
+    db.execute(insert(Wine), rows)
+
+    # Log the import in the same transaction
+    log = OperationLog(
+        user_id=user_id,
+        action_type="import",
+        entity_type="wine",
+        details=json.dumps({"created": len(rows), "errors": error_count})
+    )
+    db.add(log)
+
+
 @router.post("/import/wines")
 async def import_wines(
     file: UploadFile = File(...),
@@ -182,7 +211,8 @@ async def import_wines(
 
     reader = csv.DictReader(io.StringIO(decoded))
 
-    created_count = 0
+    user_id = current_user.id
+    rows = []
     errors = []
 
     for row_num, row in enumerate(reader, start=2):
@@ -203,7 +233,7 @@ async def import_wines(
                 errors.append(f"第{row_num}行: 名称、年份和产区为必填项")
                 continue
 
-            wine = Wine(
+            rows.append(dict(
                 name=name,
                 vintage_year=int(vintage_year),
                 region=region,
@@ -214,28 +244,18 @@ async def import_wines(
                 current_stock=int(current_stock) if current_stock else 0,
                 low_stock_threshold=int(low_stock_threshold) if low_stock_threshold else 10,
                 notes=notes if notes else None,
-                created_by=current_user.id
-            )
-            db.add(wine)
-            created_count += 1
+                created_by=user_id
+            ))
 
         except ValueError as e:
             errors.append(f"第{row_num}行: 数据格式错误 - {str(e)}")
         except Exception as e:
             errors.append(f"第{row_num}行: {str(e)}")
 
+    created_count = len(rows)
     if created_count > 0:
-        db.commit()
-
-        # Log the import
-        log = OperationLog(
-            user_id=current_user.id,
-            action_type="import",
-            entity_type="wine",
-            details=json.dumps({"created": created_count, "errors": len(errors)})
-        )
-        db.add(log)
-        db.commit()
+        await run_write(db, lambda session: _import_wines(session, rows, len(errors), user_id))
+        publish()
 
     return {
         "message": f"成功导入 {created_count} 条红酒记录",
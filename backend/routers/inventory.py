@@ -1,34 +1,36 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import or_
-from typing import Optional, List
+from sqlalchemy import or_, insert, update, case
+from typing import Optional, List, Tuple
 from datetime import datetime
 import json
 
 from database import get_db
 from models import Wine, InventoryTransaction, OperationLog, User
-from schemas import TransactionCreate, TransactionResponse, TransactionListResponse
+from schemas import (
+    TransactionCreate,
+    TransactionResponse,
+    TransactionListResponse,
+    BatchTransactionCreate,
+    BatchTransactionResponse
+)
 from auth import get_current_user
+from events import publish
+from write_queue import run_write
+from streaming import ndjson_response
 
 router = APIRouter()
 
 
-@router.get("", response_model=TransactionListResponse)
-def get_transactions(
-    page: int = Query(1, ge=1),
-    page_size: int = Query(10, ge=1, le=100),
+def _filter_transactions(
+    query,
     wine_id: Optional[int] = None,
     transaction_type: Optional[str] = None,
     performed_by: Optional[int] = None,
     start_date: Optional[datetime] = None,
-    end_date: Optional[datetime] = None,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    end_date: Optional[datetime] = None
 ):
-    """Get paginated list of inventory transactions"""
-    query = db.query(InventoryTransaction)
-
-    # Apply filters
+    """Apply the transaction list filters to a query"""
     if wine_id:
         query = query.filter(InventoryTransaction.wine_id == wine_id)
     if transaction_type:
@@ -39,34 +41,53 @@ def get_transactions(
         query = query.filter(InventoryTransaction.created_at >= start_date)
     if end_date:
         query = query.filter(InventoryTransaction.created_at <= end_date)
+    return query
+
+
+def _transaction_rows(db: Session):
+    """Transaction columns with the wine and performer names joined in: no ORM objects per row"""
+    return db.query(
+        InventoryTransaction.id,
+        InventoryTransaction.wine_id,
+        InventoryTransaction.transaction_type,
+        InventoryTransaction.quantity,
+        InventoryTransaction.reason,
+        InventoryTransaction.performed_by,
+        InventoryTransaction.created_at,
+        Wine.name.label("wine_name"),
+        User.name.label("performer_name")
+    ).outerjoin(Wine, Wine.id == InventoryTransaction.wine_id).outerjoin(
+        User, User.id == InventoryTransaction.performed_by
+    )
+
+
+@router.get("", response_model=TransactionListResponse)
+def get_transactions(
+    page: int = Query(1, ge=1),
+    page_size: int = Query(10, ge=1, le=100),
+    wine_id: Optional[int] = None,
+    transaction_type: Optional[str] = None,
+    performed_by: Optional[int] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get paginated list of inventory transactions"""
+    query = _filter_transactions(
+        db.query(InventoryTransaction), wine_id, transaction_type, performed_by, start_date, end_date
+    )
 
     # Get total count
     total = query.count()
 
-    # Apply sorting and pagination
-    query = query.order_by(InventoryTransaction.created_at.desc())
-    offset = (page - 1) * page_size
-    transactions = query.offset(offset).limit(page_size).all()
+    # Apply sorting and pagination; names come from the same query
+    rows = _filter_transactions(
+        _transaction_rows(db), wine_id, transaction_type, performed_by, start_date, end_date
+    ).order_by(InventoryTransaction.created_at.desc()).offset((page - 1) * page_size).limit(page_size).all()
 
     total_pages = (total + page_size - 1) // page_size
-
-    # Build response with wine and performer names
-    items = []
-    for t in transactions:
-        wine = db.query(Wine).filter(Wine.id == t.wine_id).first()
-        performer = db.query(User).filter(User.id == t.performed_by).first() if t.performed_by else None
-
-        items.append(TransactionResponse(
-            id=t.id,
-            wine_id=t.wine_id,
-            transaction_type=t.transaction_type,
-            quantity=t.quantity,
-            reason=t.reason,
-            performed_by=t.performed_by,
-            created_at=t.created_at,
-            wine_name=wine.name if wine else None,
-            performer_name=performer.name if performer else None
-        ))
+    items = [TransactionResponse(**row._mapping) for row in rows]
 
     return TransactionListResponse(
         items=items,
@@ -77,19 +98,52 @@ def get_transactions(
     )
 
 
-@router.post("/in", response_model=TransactionResponse, status_code=status.HTTP_201_CREATED)
-def stock_in(
-    transaction_data: TransactionCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+@router.get("/stream")
+def stream_transactions(
+    wine_id: Optional[int] = None,
+    transaction_type: Optional[str] = None,
+    performed_by: Optional[int] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    current_user: User = Depends(get_current_user)
 ):
-    """Record stock in transaction"""
-    wine = db.query(Wine).filter(Wine.id == transaction_data.wine_id).first()
-    if not wine:
+    """Stream every matching transaction as NDJSON, in ID order"""
+    def build(db: Session):
+        query = _transaction_rows(db)
+        return _filter_transactions(query, wine_id, transaction_type, performed_by, start_date, end_date)
+
+    def serialize(row) -> str:
+        return TransactionResponse(**row._mapping).model_dump_json()
+
+    return ndjson_response("transactions", build, InventoryTransaction.id, serialize)
+
+
+def _move_stock(db: Session, wine_id: int, delta: int) -> Tuple[str, int]:
+    """Add delta to a wine's stock in SQL, refusing to go below zero; returns (name, new stock)"""
+    row = db.execute(
+        update(Wine)
+        .where(Wine.id == wine_id, Wine.current_stock >= -delta)
+        .values(current_stock=Wine.current_stock + delta)
+        .returning(Wine.name, Wine.current_stock),
+        execution_options={"synchronize_session": False}
+    ).first()
+    if row is None:
+        current_stock = db.query(Wine.current_stock).filter(Wine.id == wine_id).scalar()
+        if current_stock is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="红酒不存在"
+            )
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="红酒不存在"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"库存不足，当前库存: {current_stock}"
         )
+    return row.name, row.current_stock
+
+
+def _stock_in(db: Session, transaction_data: TransactionCreate, user_id: int, user_name: str) -> TransactionResponse:
+    """Record stock in transaction (write_queue operation)"""
+    wine_name, new_stock = _move_stock(db, transaction_data.wine_id, transaction_data.quantity)
 
     # Create transaction
     transaction = InventoryTransaction(
@@ -97,33 +151,27 @@ def stock_in(
         transaction_type="in",
         quantity=transaction_data.quantity,
         reason=transaction_data.reason,
-        performed_by=current_user.id
+        performed_by=user_id
     )
     db.add(transaction)
 
-    # Update wine stock
-    old_stock = wine.current_stock
-    wine.current_stock += transaction_data.quantity
-
-    db.commit()
-    db.refresh(transaction)
-
-    # Log the action
+    # Log the action in the same transaction
     log = OperationLog(
-        user_id=current_user.id,
+        user_id=user_id,
         action_type="stock_in",
         entity_type="wine",
-        entity_id=wine.id,
+        entity_id=transaction_data.wine_id,
         details=json.dumps({
-            "wine_name": wine.name,
+            "wine_name": wine_name,
             "quantity": transaction_data.quantity,
-            "old_stock": old_stock,
-            "new_stock": wine.current_stock,
+            "old_stock": new_stock - transaction_data.quantity,
+            "new_stock": new_stock,
             "reason": transaction_data.reason
         })
     )
     db.add(log)
-    db.commit()
+    # INSERT ... RETURNING already loaded the id and created_at
+    db.flush()
 
     return TransactionResponse(
         id=transaction.id,
@@ -133,31 +181,27 @@ def stock_in(
         reason=transaction.reason,
         performed_by=transaction.performed_by,
         created_at=transaction.created_at,
-        wine_name=wine.name,
-        performer_name=current_user.name
+        wine_name=wine_name,
+        performer_name=user_name
     )
 
 
-@router.post("/out", response_model=TransactionResponse, status_code=status.HTTP_201_CREATED)
-def stock_out(
+@router.post("/in", response_model=TransactionResponse, status_code=status.HTTP_201_CREATED)
+async def stock_in(
     transaction_data: TransactionCreate,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Record stock out transaction"""
-    wine = db.query(Wine).filter(Wine.id == transaction_data.wine_id).first()
-    if not wine:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="红酒不存在"
-        )
+    """Record stock in transaction"""
+    user_id, user_name = current_user.id, current_user.name
+    result = await run_write(db, lambda session: _stock_in(session, transaction_data, user_id, user_name))
+    publish([result.wine_id])
+    return result
 
-    # Check if enough stock
-    if wine.current_stock < transaction_data.quantity:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"库存不足，当前库存: {wine.current_stock}"
-        )
+
+def _stock_out(db: Session, transaction_data: TransactionCreate, user_id: int, user_name: str) -> TransactionResponse:
+    """Record stock out transaction (write_queue operation)"""
+    wine_name, new_stock = _move_stock(db, transaction_data.wine_id, -transaction_data.quantity)
 
     # Create transaction
     transaction = InventoryTransaction(
@@ -165,33 +209,27 @@ def stock_out(
         transaction_type="out",
         quantity=transaction_data.quantity,
         reason=transaction_data.reason,
-        performed_by=current_user.id
+        performed_by=user_id
     )
     db.add(transaction)
 
-    # Update wine stock
-    old_stock = wine.current_stock
-    wine.current_stock -= transaction_data.quantity
-
-    db.commit()
-    db.refresh(transaction)
-
-    # Log the action
+    # Log the action in the same transaction
     log = OperationLog(
-        user_id=current_user.id,
+        user_id=user_id,
         action_type="stock_out",
         entity_type="wine",
-        entity_id=wine.id,
+        entity_id=transaction_data.wine_id,
         details=json.dumps({
-            "wine_name": wine.name,
+            "wine_name": wine_name,
             "quantity": transaction_data.quantity,
-            "old_stock": old_stock,
-            "new_stock": wine.current_stock,
+            "old_stock": new_stock + transaction_data.quantity,
+            "new_stock": new_stock,
             "reason": transaction_data.reason
         })
     )
     db.add(log)
-    db.commit()
+    # INSERT ... RETURNING already loaded the id and created_at
+    db.flush()
 
     return TransactionResponse(
         id=transaction.id,
@@ -201,11 +239,163 @@ def stock_out(
         reason=transaction.reason,
         performed_by=transaction.performed_by,
         created_at=transaction.created_at,
-        wine_name=wine.name,
-        performer_name=current_user.name
+        wine_name=wine_name,
+        performer_name=user_name
     )
 
 
+@router.post("/out", response_model=TransactionResponse, status_code=status.HTTP_201_CREATED)
+async def stock_out(
+    transaction_data: TransactionCreate,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Record stock out transaction"""
+    user_id, user_name = current_user.id, current_user.name
+    result = await run_write(db, lambda session: _stock_out(session, transaction_data, user_id, user_name))
+    publish([result.wine_id])
+    return result
+
+
+def _raise_batch_error(db: Session, batch_data: BatchTransactionCreate, old_stock: dict):
+    """Explain why the guarded batch update skipped some wines; the caller's transaction is rolled back"""
+    wine_ids = {line.wine_id for line in batch_data.lines}
+    # Wines the update skipped still hold their stock from before the batch
+    stock = dict(db.query(Wine.id, Wine.current_stock).filter(Wine.id.in_(wine_ids - old_stock.keys())).all())
+    missing = sorted(wine_ids - old_stock.keys() - stock.keys())
+    if missing:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"红酒不存在: {', '.join(str(i) for i in missing)}"
+        )
+
+    stock.update(old_stock)
+    for index, line in enumerate(batch_data.lines):
+        if line.transaction_type == "in":
+            stock[line.wine_id] += line.quantity
+        elif stock[line.wine_id] < line.quantity:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"第{index + 1}行库存不足，红酒ID {line.wine_id} 当前库存: {stock[line.wine_id]}"
+            )
+        else:
+            stock[line.wine_id] -= line.quantity
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="库存不足"
+    )
+
+
+def _batch_stock_movement(
+    db: Session,
+    batch_data: BatchTransactionCreate,
+    user_id: int,
+    user_name: str
+) -> BatchTransactionResponse:
+    """Apply many stock in/out lines atomically (write_queue operation)"""
+    # Net change per wine, and the stock each wine needs up front so that
+    # replaying the lines in order never takes it below zero
+    deltas, required = {}, {}
+    for line in batch_data.lines:
+        change = line.quantity if line.transaction_type == "in" else -line.quantity
+        deltas[line.wine_id] = deltas.get(line.wine_id, 0) + change
+        required[line.wine_id] = max(required.get(line.wine_id, 0), -deltas[line.wine_id])
+
+    # Check and apply in one statement: it runs under the write lock, so a
+    # concurrent batch can't spend the same stock between a check and the update
+    updated = db.execute(
+        update(Wine)
+        .where(
+            Wine.id.in_(deltas.keys()),
+            Wine.current_stock >= case(required, value=Wine.id, else_=0)
+        )
+        .values(current_stock=Wine.current_stock + case(deltas, value=Wine.id, else_=0))
+        .returning(Wine.id, Wine.name, Wine.current_stock),
+        execution_options={"synchronize_session": False}
+    ).all()
+    if len(updated) != len(deltas):
+        _raise_batch_error(db, batch_data, {row.id: row.current_stock - deltas[row.id] for row in updated})
+
+    names = {row.id: row.name for row in updated}
+    new_stock = {row.id: row.current_stock for row in updated}
+
+    # Insert all ledger rows with one statement
+    transactions = db.scalars(
+        insert(InventoryTransaction).returning(InventoryTransaction),
+        [
+            {
+                "wine_id": line.wine_id,
+                "transaction_type": line.transaction_type,
+                "quantity": line.quantity,
+                "reason": line.reason,
+                "performed_by": user_id
+            }
+            for line in batch_data.lines
+        ]
+    ).all()
+
+    total_in = sum(l.quantity for l in batch_data.lines if l.transaction_type == "in")
+    total_out = sum(l.quantity for l in batch_data.lines if l.transaction_type == "out")
+
+    # Build the response from the returned rows, usable after the session closes
+    items = [
+        TransactionResponse(
+            id=t.id,
+            wine_id=t.wine_id,
+            transaction_type=t.transaction_type,
+            quantity=t.quantity,
+            reason=t.reason,
+            performed_by=t.performed_by,
+            created_at=t.created_at,
+            wine_name=names[t.wine_id],
+            performer_name=user_name
+        )
+        for t in transactions
+    ]
+
+    # Log one summarized entry for the whole batch
+    log = OperationLog(
+        user_id=user_id,
+        action_type="stock_batch",
+        entity_type="wine",
+        details=json.dumps({
+            "lines": len(batch_data.lines),
+            "total_in": total_in,
+            "total_out": total_out,
+            "wines": [
+                {
+                    "wine_id": wine_id,
+                    "wine_name": names[wine_id],
+                    "old_stock": new_stock[wine_id] - delta,
+                    "new_stock": new_stock[wine_id]
+                }
+                for wine_id, delta in deltas.items()
+            ]
+        })
+    )
+    db.add(log)
+
+    return BatchTransactionResponse(
+        items=items,
+        count=len(items),
+        total_in=total_in,
+        total_out=total_out
+    )
+
+
+@router.post("/batch", response_model=BatchTransactionResponse, status_code=status.HTTP_201_CREATED)
+async def batch_stock_movement(
+    batch_data: BatchTransactionCreate,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Apply many stock in/out lines atomically in a single transaction"""
+    user_id, user_name = current_user.id, current_user.name
+    result = await run_write(db, lambda session: _batch_stock_movement(session, batch_data, user_id, user_name))
+    publish({item.wine_id for item in result.items})
+    return result
+
+
 @router.get("/{transaction_id}", response_model=TransactionResponse)
 def get_transaction(
     transaction_id: int,
@@ -213,27 +403,14 @@ def get_transaction(
     db: Session = Depends(get_db)
 ):
     """Get a single transaction by ID"""
-    transaction = db.query(InventoryTransaction).filter(InventoryTransaction.id == transaction_id).first()
-    if not transaction:
+    row = _transaction_rows(db).filter(InventoryTransaction.id == transaction_id).first()
+    if not row:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="交易记录不存在"
         )
 
-    wine = db.query(Wine).filter(Wine.id == transaction.wine_id).first()
-    performer = db.query(User).filter(User.id == transaction.performed_by).first() if transaction.performed_by else None
-
-    return TransactionResponse(
-        id=transaction.id,
-        wine_id=transaction.wine_id,
-        transaction_type=transaction.transaction_type,
-        quantity=transaction.quantity,
-        reason=transaction.reason,
-        performed_by=transaction.performed_by,
-        created_at=transaction.created_at,
-        wine_name=wine.name if wine else None,
-        performer_name=performer.name if performer else None
-    )
+    return TransactionResponse(**row._mapping)
 
 
 @router.get("/wine/{wine_id}", response_model=List[TransactionResponse])
@@ -243,30 +420,14 @@ def get_wine_transactions(
     db: Session = Depends(get_db)
 ):
     """Get all transactions for a specific wine"""
-    wine = db.query(Wine).filter(Wine.id == wine_id).first()
-    if not wine:
+    if db.query(Wine.id).filter(Wine.id == wine_id).first() is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="红酒不存在"
         )
 
-    transactions = db.query(InventoryTransaction).filter(
+    rows = _transaction_rows(db).filter(
         InventoryTransaction.wine_id == wine_id
     ).order_by(InventoryTransaction.created_at.desc()).all()
 
-    items = []
-    for t in transactions:
-        performer = db.query(User).filter(User.id == t.performed_by).first() if t.performed_by else None
-        items.append(TransactionResponse(
-            id=t.id,
-            wine_id=t.wine_id,
-            transaction_type=t.transaction_type,
-            quantity=t.quantity,
-            reason=t.reason,
-            performed_by=t.performed_by,
-            created_at=t.created_at,
-            wine_name=wine.name,
-            performer_name=performer.name if performer else None
-        ))
-
-    return items
+    return [TransactionResponse(**row._mapping) for row in rows]
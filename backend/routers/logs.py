@@ -1,5 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
 from typing import Optional
 from datetime import datetime
 
@@ -55,7 +55,10 @@ def list_logs(
     total = query.count()
     total_pages = (total + page_size - 1) // page_size
 
-    logs = query.order_by(OperationLog.created_at.desc()).offset((page - 1) * page_size).limit(page_size).all()
+    # The user is joined into the page query rather than lazy-loaded per log
+    logs = query.options(joinedload(OperationLog.user)).order_by(
+        OperationLog.created_at.desc()
+    ).offset((page - 1) * page_size).limit(page_size).all()
 
     # Add user names to logs
     items = []
@@ -89,7 +92,7 @@ def get_log(
     db: Session = Depends(get_db)
 ):
     """Get a single log entry"""
-    log = db.query(OperationLog).filter(OperationLog.id == log_id).first()
+    log = db.query(OperationLog).options(joinedload(OperationLog.user)).filter(OperationLog.id == log_id).first()
 
     if not log:
         raise HTTPException(
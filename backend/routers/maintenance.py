@@ -0,0 +1,37 @@
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from sqlalchemy.orm import Session
+
+from database import get_db
+from models import User
+from auth import get_current_admin_user
+from maintenance import MAINTENANCE_RUN_HISTORY, MAINTENANCE_TASK_BUDGET_SECONDS, recent_runs, run_maintenance, storage_stats
+
+router = APIRouter()
+
+
+@router.get("")
+def get_maintenance(
+    limit: int = Query(default=MAINTENANCE_RUN_HISTORY, ge=1, le=100),
+    current_user: User = Depends(get_current_admin_user),
+    db: Session = Depends(get_db)
+):
+    """Database size and fragmentation plus the latest maintenance runs (admin only)"""
+    return {
+        "storage": storage_stats(),
+        "runs": recent_runs(db, limit)
+    }
+
+
+@router.post("/run")
+def post_maintenance_run(
+    budget_seconds: float = Query(default=MAINTENANCE_TASK_BUDGET_SECONDS, gt=0, le=600),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Run integrity check, ANALYZE and incremental vacuum now (admin only)"""
+    run = run_maintenance("manual", budget=budget_seconds)
+    if run is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="存储维护正在进行中"
+        )
+    return run
@@ -0,0 +1,26 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+
+from models import User
+from auth import get_current_admin_user
+from metrics import render_metrics
+from loop_monitor import monitor
+
+router = APIRouter()
+
+
+@router.get("", response_class=PlainTextResponse)
+def get_metrics():
+    """Expose request latency and SQL metrics in Prometheus text format"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@router.get("/event-loop")
+def get_event_loop_stalls(
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Recent event loop stalls with the blocking stack (admin only)"""
+    return {
+        "threshold_ms": monitor.threshold * 1000,
+        "stalls": monitor.recent_stalls()
+    }
@@ -0,0 +1,61 @@
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.responses import FileResponse
+
+from models import User
+from auth import get_current_admin_user
+from profiling import list_profiles, profile_path
+import memory_profiling
+
+router = APIRouter()
+
+
+@router.get("")
+def get_profiles(
+    current_user: User = Depends(get_current_admin_user)
+):
+    """List stored request profiles, newest first (admin only)"""
+    return list_profiles()
+
+
+@router.get("/memory")
+def get_memory_profile(
+    top: int = Query(default=20, ge=1, le=200),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Peak allocation per route and router, ORM object counts and top allocation sites (admin only)"""
+    return memory_profiling.summary(top)
+
+
+@router.post("/memory/start")
+def start_memory_profiling(
+    nframes: int = Query(default=memory_profiling.MEMORY_TRACE_FRAMES, ge=1, le=100),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Start tracemalloc-based per-request memory profiling (admin only)"""
+    memory_profiling.start(nframes)
+    return {"enabled": True}
+
+
+@router.post("/memory/stop")
+def stop_memory_profiling(
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Stop memory profiling and clear collected stats (admin only)"""
+    memory_profiling.stop()
+    memory_profiling.reset()
+    return {"enabled": False}
+
+
+@router.get("/{name}")
+def download_profile(
+    name: str,
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Download a profile as collapsed stacks for flamegraph tools (admin only)"""
+    path = profile_path(name)
+    if path is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="性能分析记录不存在"
+        )
+    return FileResponse(path, media_type="text/plain", filename=name)
@@ -0,0 +1,39 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+
+from database import get_db
+from models import User
+from auth import get_current_admin_user
+from scheduler import recent_runs, scheduler
+
+router = APIRouter()
+
+
+@router.get("")
+def get_scheduler(
+    task: Optional[str] = None,
+    limit: int = Query(default=50, ge=1, le=500),
+    current_user: User = Depends(get_current_admin_user),
+    db: Session = Depends(get_db)
+):
+    """Registered periodic tasks and their latest runs across all workers (admin only)"""
+    runs = recent_runs(db, task, limit)
+    return {
+        "tasks": [t.describe() for t in scheduler.tasks.values()],
+        "runs": [
+            {
+                "id": run.id,
+                "task": run.task,
+                "scheduled_for": run.scheduled_for,
+                "started_at": run.started_at,
+                "finished_at": run.finished_at,
+                "status": run.status,
+                "duration_ms": run.duration_ms,
+                "error": run.error,
+                "worker": run.worker
+            }
+            for run in runs
+        ]
+    }
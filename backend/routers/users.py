@@ -1,5 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from typing import Optional
 import json
 
@@ -7,6 +8,7 @@ from database import get_db
 from models import User, OperationLog
 from schemas import UserCreate, UserUpdate, UserResponse
 from auth import get_current_user, get_current_admin_user, get_password_hash
+from write_queue import run_write
 
 router = APIRouter()
 
@@ -50,13 +52,8 @@ def list_users(
     }
 
 
-@router.post("", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-def create_user(
-    user_data: UserCreate,
-    current_user: User = Depends(get_current_admin_user),
-    db: Session = Depends(get_db)
-):
-    """Create a new user (admin only)"""
+def _create_user(db: Session, user_data: UserCreate, password_hash: str, admin_id: int) -> UserResponse:
+    """Create a user (write_queue operation)"""
     # Check if email already exists
     existing = db.query(User).filter(User.email == user_data.email).first()
     if existing:
@@ -68,26 +65,39 @@ def create_user(
     # Create user
     user = User(
         email=user_data.email,
-        password_hash=get_password_hash(user_data.password),
+        password_hash=password_hash,
         name=user_data.name,
         role=user_data.role
     )
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    db.flush()
 
-    # Log the action
+    # Log the action in the same transaction
     log = OperationLog(
-        user_id=current_user.id,
+        user_id=admin_id,
         action_type="create",
         entity_type="user",
         entity_id=user.id,
         details=json.dumps({"email": user.email, "name": user.name, "role": user.role})
     )
     db.add(log)
-    db.commit()
+    db.flush()
+    db.refresh(user)
 
-    return user
+    return UserResponse.model_validate(user)
+
+
+@router.post("", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
+async def create_user(
+    user_data: UserCreate,
+    current_user: User = Depends(get_current_admin_user),
+    db: Session = Depends(get_db)
+):
+    """Create a new user (admin only)"""
+    admin_id = current_user.id
+    # Hash outside the write: bcrypt is slow and would hold up the writer
+    password_hash = await run_in_threadpool(get_password_hash, user_data.password)
+    return await run_write(db, lambda session: _create_user(session, user_data, password_hash, admin_id))
 
 
 @router.get("/{user_id}", response_model=UserResponse)
@@ -114,21 +124,8 @@ def get_user(
     return user
 
 
-@router.put("/{user_id}", response_model=UserResponse)
-def update_user(
-    user_id: int,
-    user_data: UserUpdate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    """Update a user"""
-    # Users can only update themselves unless they're admin
-    if current_user.role != "admin" and current_user.id != user_id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="无权修改此用户信息"
-        )
-
+def _update_user(db: Session, user_id: int, user_data: UserUpdate, is_admin: bool, actor_id: int) -> UserResponse:
+    """Update a user (write_queue operation)"""
     user = db.query(User).filter(User.id == user_id).first()
     if not user:
         raise HTTPException(
@@ -136,13 +133,6 @@ def update_user(
             detail="用户不存在"
         )
 
-    # Only admin can change role
-    if user_data.role and current_user.role != "admin":
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="只有管理员可以修改用户角色"
-        )
-
     # Check email uniqueness
     if user_data.email and user_data.email != user.email:
         existing = db.query(User).filter(User.email == user_data.email).first()
@@ -159,42 +149,55 @@ def update_user(
         user.email = user_data.email
     if user_data.name:
         user.name = user_data.name
-    if user_data.role and current_user.role == "admin":
+    if user_data.role and is_admin:
         user.role = user_data.role
-    if user_data.is_active is not None and current_user.role == "admin":
+    if user_data.is_active is not None and is_admin:
         user.is_active = user_data.is_active
 
-    db.commit()
-    db.refresh(user)
-
-    # Log the action
+    # Log the action in the same transaction
     new_data = {"email": user.email, "name": user.name, "role": user.role}
     log = OperationLog(
-        user_id=current_user.id,
+        user_id=actor_id,
         action_type="update",
         entity_type="user",
         entity_id=user.id,
         details=json.dumps({"old": old_data, "new": new_data})
     )
     db.add(log)
-    db.commit()
+    db.flush()
+    db.refresh(user)
 
-    return user
+    return UserResponse.model_validate(user)
 
 
-@router.delete("/{user_id}")
-def delete_user(
+@router.put("/{user_id}", response_model=UserResponse)
+async def update_user(
     user_id: int,
-    current_user: User = Depends(get_current_admin_user),
+    user_data: UserUpdate,
+    current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Delete a user (admin only)"""
-    if current_user.id == user_id:
+    """Update a user"""
+    # Users can only update themselves unless they're admin
+    if current_user.role != "admin" and current_user.id != user_id:
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="不能删除自己的账户"
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="无权修改此用户信息"
         )
 
+    # Only admin can change role
+    if user_data.role and current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="只有管理员可以修改用户角色"
+        )
+
+    actor_id, is_admin = current_user.id, current_user.role == "admin"
+    return await run_write(db, lambda session: _update_user(session, user_id, user_data, is_admin, actor_id))
+
+
+def _delete_user(db: Session, user_id: int, admin_id: int):
+    """Delete a user (write_queue operation)"""
     user = db.query(User).filter(User.id == user_id).first()
     if not user:
         raise HTTPException(
@@ -204,7 +207,7 @@ def delete_user(
 
     # Log before deletion
     log = OperationLog(
-        user_id=current_user.id,
+        user_id=admin_id,
         action_type="delete",
         entity_type="user",
         entity_id=user.id,
@@ -213,24 +216,30 @@ def delete_user(
     db.add(log)
 
     db.delete(user)
-    db.commit()
-
-    return {"message": "用户已删除"}
+    db.flush()
 
 
-@router.put("/{user_id}/status")
-def toggle_user_status(
+@router.delete("/{user_id}")
+async def delete_user(
     user_id: int,
     current_user: User = Depends(get_current_admin_user),
     db: Session = Depends(get_db)
 ):
-    """Toggle user active status (admin only)"""
+    """Delete a user (admin only)"""
     if current_user.id == user_id:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="不能禁用自己的账户"
+            detail="不能删除自己的账户"
         )
 
+    admin_id = current_user.id
+    await run_write(db, lambda session: _delete_user(session, user_id, admin_id))
+
+    return {"message": "用户已删除"}
+
+
+def _toggle_user_status(db: Session, user_id: int, admin_id: int) -> bool:
+    """Flip a user's active flag (write_queue operation); returns the new value"""
     user = db.query(User).filter(User.id == user_id).first()
     if not user:
         raise HTTPException(
@@ -239,19 +248,36 @@ def toggle_user_status(
         )
 
     user.is_active = not user.is_active
-    db.commit()
-    db.refresh(user)
 
-    # Log the action
+    # Log the action in the same transaction
     log = OperationLog(
-        user_id=current_user.id,
+        user_id=admin_id,
         action_type="status_change",
         entity_type="user",
         entity_id=user.id,
         details=json.dumps({"email": user.email, "is_active": user.is_active})
     )
     db.add(log)
-    db.commit()
+    db.flush()
+
+    return user.is_active
+
+
+@router.put("/{user_id}/status")
+async def toggle_user_status(
+    user_id: int,
+    current_user: User = Depends(get_current_admin_user),
+    db: Session = Depends(get_db)
+):
+    """Toggle user active status (admin only)"""
+    if current_user.id == user_id:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="不能禁用自己的账户"
+        )
+
+    admin_id = current_user.id
+    is_active = await run_write(db, lambda session: _toggle_user_status(session, user_id, admin_id))
 
-    status_text = "启用" if user.is_active else "禁用"
-    return {"message": f"用户已{status_text}", "is_active": user.is_active}
+    status_text = "启用" if is_active else "禁用"
+    return {"message": f"用户已{status_text}", "is_active": is_active}
@@ -1,21 +1,78 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, Response, status, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import or_, func
+from sqlalchemy import or_, insert, update, delete
 from typing import Optional, List
 import json
 
 from database import get_db
 from models import Wine, OperationLog, User
-from schemas import WineCreate, WineUpdate, WineResponse, WineListResponse
+from schemas import (
+    WineCreate,
+    WineUpdate,
+    WineResponse,
+    WineListResponse,
+    WineChanges,
+    WineBulkFilter,
+    WineBulkCreate,
+    WineBulkUpdate,
+    WineBulkDelete,
+    WineBulkResult
+)
 from auth import get_current_user
+from events import publish
+from cache import cache, WINE_LOOKUPS
+from write_queue import run_write
+from changes import wine_changes, InvalidToken, ExpiredToken
+from streaming import ndjson_response
+from fieldsets import Fieldsets, UnknownFields
 
 router = APIRouter()
 
+wine_fields = Fieldsets(WineResponse, Wine)
+WINE_BATCH_MAX_IDS = 1000
 
-@router.get("", response_model=WineListResponse)
-def get_wines(
-    page: int = Query(1, ge=1),
-    page_size: int = Query(10, ge=1, le=100),
+
+def _parse_fields(fields: Optional[str]):
+    """Requested wine fields, or None for the full WineResponse"""
+    try:
+        return wine_fields.parse(fields)
+    except UnknownFields as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"未知字段: {exc}"
+        )
+
+
+def _select_wines(db: Session, fieldset):
+    """Query for whole wines, or only the columns of a fieldset"""
+    return db.query(*wine_fields.columns(fieldset)) if fieldset else db.query(Wine)
+
+
+def _json(body: str) -> Response:
+    # Returned as is, so FastAPI doesn't validate it against the full response_model
+    return Response(body, media_type="application/json")
+
+
+def _bulk_criteria(bulk_filter: WineBulkFilter) -> list:
+    """Build WHERE clauses for a bulk operation; refuse an empty selection"""
+    criteria = []
+    if bulk_filter.ids is not None:
+        criteria.append(Wine.id.in_(bulk_filter.ids))
+    for field in ("region", "grape_variety", "supplier", "storage_location", "vintage_year"):
+        value = getattr(bulk_filter, field)
+        if value is not None:
+            criteria.append(getattr(Wine, field) == value)
+
+    if not criteria:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="批量操作必须指定ID列表或筛选条件"
+        )
+    return criteria
+
+
+def _filter_wines(
+    query,
     search: Optional[str] = None,
     region: Optional[str] = None,
     grape_variety: Optional[str] = None,
@@ -24,15 +81,9 @@ def get_wines(
     vintage_year: Optional[int] = None,
     min_price: Optional[float] = None,
     max_price: Optional[float] = None,
-    stock_status: Optional[str] = None,  # 'normal', 'low', 'out'
-    sort_by: Optional[str] = "created_at",
-    sort_order: Optional[str] = "desc",
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    stock_status: Optional[str] = None
 ):
-    """Get paginated list of wines with filters"""
-    query = db.query(Wine)
-
+    """Apply the wine list filters to a query"""
     # Apply search filter
     if search:
         query = query.filter(
@@ -68,6 +119,35 @@ def get_wines(
     elif stock_status == "normal":
         query = query.filter(Wine.current_stock > Wine.low_stock_threshold)
 
+    return query
+
+
+@router.get("", response_model=WineListResponse)
+def get_wines(
+    page: int = Query(1, ge=1),
+    page_size: int = Query(10, ge=1, le=100),
+    search: Optional[str] = None,
+    region: Optional[str] = None,
+    grape_variety: Optional[str] = None,
+    supplier: Optional[str] = None,
+    storage_location: Optional[str] = None,
+    vintage_year: Optional[int] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    stock_status: Optional[str] = None,  # 'normal', 'low', 'out'
+    sort_by: Optional[str] = "created_at",
+    sort_order: Optional[str] = "desc",
+    fields: Optional[str] = None,  # e.g. 'id,name,current_stock'
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get paginated list of wines with filters"""
+    fieldset = _parse_fields(fields)
+    query = _filter_wines(
+        _select_wines(db, fieldset), search, region, grape_variety, supplier, storage_location,
+        vintage_year, min_price, max_price, stock_status
+    )
+
     # Get total count
     total = query.count()
 
@@ -84,6 +164,16 @@ def get_wines(
 
     total_pages = (total + page_size - 1) // page_size
 
+    if fieldset:
+        item = wine_fields.model(fieldset)
+        return _json(wine_fields.list_model(fieldset, WineListResponse)(
+            items=[item.model_validate(w) for w in wines],
+            total=total,
+            page=page,
+            page_size=page_size,
+            total_pages=total_pages
+        ).model_dump_json())
+
     return WineListResponse(
         items=[WineResponse.model_validate(w) for w in wines],
         total=total,
@@ -93,33 +183,40 @@ def get_wines(
     )
 
 
-@router.post("", response_model=WineResponse, status_code=status.HTTP_201_CREATED)
-def create_wine(
-    wine_data: WineCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    """Create a new wine"""
+def _create_wine(db: Session, wine_data: WineCreate, user_id: int) -> WineResponse:
+    """Create a new wine (write_queue operation)"""
     wine = Wine(
         **wine_data.model_dump(),
-        created_by=current_user.id
+        created_by=user_id
     )
     db.add(wine)
-    db.commit()
+    db.flush()
     db.refresh(wine)
 
-    # Log the action
+    # Log the action in the same transaction
     log = OperationLog(
-        user_id=current_user.id,
+        user_id=user_id,
         action_type="create",
         entity_type="wine",
         entity_id=wine.id,
         details=json.dumps({"name": wine.name, "vintage_year": wine.vintage_year})
     )
     db.add(log)
-    db.commit()
 
-    return wine
+    return WineResponse.model_validate(wine)
+
+
+@router.post("", response_model=WineResponse, status_code=status.HTTP_201_CREATED)
+async def create_wine(
+    wine_data: WineCreate,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Create a new wine"""
+    user_id = current_user.id
+    result = await run_write(db, lambda session: _create_wine(session, wine_data, user_id))
+    publish([result.id])
+    return result
 
 
 @router.get("/low-stock", response_model=List[WineResponse])
@@ -141,8 +238,11 @@ def get_regions(
     db: Session = Depends(get_db)
 ):
     """Get distinct regions"""
-    regions = db.query(Wine.region).distinct().filter(Wine.region.isnot(None)).all()
-    return [r[0] for r in regions if r[0]]
+    def load():
+        regions = db.query(Wine.region).distinct().filter(Wine.region.isnot(None)).all()
+        return [r[0] for r in regions if r[0]]
+
+    return cache.get_or_load(WINE_LOOKUPS, "regions", load)
 
 
 @router.get("/varieties")
@@ -151,8 +251,11 @@ def get_varieties(
     db: Session = Depends(get_db)
 ):
     """Get distinct grape varieties"""
-    varieties = db.query(Wine.grape_variety).distinct().filter(Wine.grape_variety.isnot(None)).all()
-    return [v[0] for v in varieties if v[0]]
+    def load():
+        varieties = db.query(Wine.grape_variety).distinct().filter(Wine.grape_variety.isnot(None)).all()
+        return [v[0] for v in varieties if v[0]]
+
+    return cache.get_or_load(WINE_LOOKUPS, "varieties", load)
 
 
 @router.get("/suppliers")
@@ -161,8 +264,11 @@ def get_suppliers(
     db: Session = Depends(get_db)
 ):
     """Get distinct suppliers"""
-    suppliers = db.query(Wine.supplier).distinct().filter(Wine.supplier.isnot(None)).all()
-    return [s[0] for s in suppliers if s[0]]
+    def load():
+        suppliers = db.query(Wine.supplier).distinct().filter(Wine.supplier.isnot(None)).all()
+        return [s[0] for s in suppliers if s[0]]
+
+    return cache.get_or_load(WINE_LOOKUPS, "suppliers", load)
 
 
 @router.get("/locations")
@@ -171,34 +277,238 @@ def get_locations(
     db: Session = Depends(get_db)
 ):
     """Get distinct storage locations"""
-    locations = db.query(Wine.storage_location).distinct().filter(Wine.storage_location.isnot(None)).all()
-    return [l[0] for l in locations if l[0]]
+    def load():
+        locations = db.query(Wine.storage_location).distinct().filter(Wine.storage_location.isnot(None)).all()
+        return [l[0] for l in locations if l[0]]
+
+    return cache.get_or_load(WINE_LOOKUPS, "locations", load)
+
+
+@router.get("/changes", response_model=WineChanges)
+def get_wine_changes(
+    since: Optional[str] = None,
+    limit: int = Query(500, ge=1, le=1000),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get wines changed and deleted since a sync token"""
+    try:
+        return wine_changes(db, since, limit)
+    except ExpiredToken:
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="同步令牌已过期，请重新全量同步"
+        )
+    except InvalidToken:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="无效的同步令牌"
+        )
+
+
+@router.get("/stream")
+def stream_wines(
+    search: Optional[str] = None,
+    region: Optional[str] = None,
+    grape_variety: Optional[str] = None,
+    supplier: Optional[str] = None,
+    storage_location: Optional[str] = None,
+    vintage_year: Optional[int] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    stock_status: Optional[str] = None,
+    fields: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Stream every matching wine as NDJSON, in ID order"""
+    fieldset = _parse_fields(fields)
+    model = wine_fields.model(fieldset) if fieldset else WineResponse
+
+    def build(db: Session):
+        return _filter_wines(
+            _select_wines(db, fieldset), search, region, grape_variety, supplier, storage_location,
+            vintage_year, min_price, max_price, stock_status
+        )
+
+    return ndjson_response("wines", build, Wine.id, lambda w: model.model_validate(w).model_dump_json())
+
+
+@router.get("/batch", response_model=List[WineResponse])
+def get_wines_batch(
+    ids: str = Query(..., description="Comma-separated wine IDs"),
+    fields: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get many wines by ID in one query, in the order requested; unknown IDs are left out"""
+    try:
+        wanted = list(dict.fromkeys(int(i) for i in ids.split(",") if i.strip()))
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="ID列表格式无效"
+        )
+    if not 1 <= len(wanted) <= WINE_BATCH_MAX_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"ID数量必须在1到{WINE_BATCH_MAX_IDS}之间"
+        )
+
+    fieldset = _parse_fields(fields)
+    rows = _select_wines(db, fieldset).filter(Wine.id.in_(wanted)).all()
+    by_id = {row.id: row for row in rows}
+    found = [by_id[i] for i in wanted if i in by_id]
+
+    if fieldset:
+        item = wine_fields.model(fieldset)
+        return _json("[" + ",".join(item.model_validate(w).model_dump_json() for w in found) + "]")
+    return found
+
+
+def _bulk_create_wines(db: Session, bulk_data: WineBulkCreate, user_id: int) -> WineBulkResult:
+    """Create many wines (write_queue operation)"""
+    ids = db.scalars(
+        insert(Wine).returning(Wine.id),
+        [{**item.model_dump(), "created_by": user_id} for item in bulk_data.items]
+    ).all()
+
+    # Log one consolidated entry
+    log = OperationLog(
+        user_id=user_id,
+        action_type="bulk_create",
+        entity_type="wine",
+        details=json.dumps({"count": len(ids), "ids": ids})
+    )
+    db.add(log)
+
+    return WineBulkResult(affected=len(ids), ids=ids)
+
+
+@router.post("/bulk", response_model=WineBulkResult, status_code=status.HTTP_201_CREATED)
+async def bulk_create_wines(
+    bulk_data: WineBulkCreate,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Create many wines in a single transaction"""
+    user_id = current_user.id
+    result = await run_write(db, lambda session: _bulk_create_wines(session, bulk_data, user_id))
+    publish(result.ids)
+    return result
+
+
+def _bulk_update_wines(
+    db: Session,
+    bulk_data: WineBulkUpdate,
+    criteria: list,
+    update_data: dict,
+    user_id: int
+) -> WineBulkResult:
+    """Update matching wines (write_queue operation)"""
+    ids = db.scalars(
+        update(Wine).where(*criteria).values(**update_data).returning(Wine.id),
+        execution_options={"synchronize_session": False}
+    ).all()
+
+    # Log one consolidated entry
+    log = OperationLog(
+        user_id=user_id,
+        action_type="bulk_update",
+        entity_type="wine",
+        details=json.dumps({
+            "filter": bulk_data.filter.model_dump(exclude_none=True),
+            "new": update_data,
+            "count": len(ids)
+        })
+    )
+    db.add(log)
+
+    return WineBulkResult(affected=len(ids), ids=ids)
+
+
+@router.put("/bulk", response_model=WineBulkResult)
+async def bulk_update_wines(
+    bulk_data: WineBulkUpdate,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Update the same fields on all wines matching an ID list or filter"""
+    criteria = _bulk_criteria(bulk_data.filter)
+    update_data = bulk_data.changes.model_dump(exclude_unset=True)
+    if not update_data:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="没有需要更新的字段"
+        )
+
+    user_id = current_user.id
+    result = await run_write(
+        db, lambda session: _bulk_update_wines(session, bulk_data, criteria, update_data, user_id)
+    )
+    publish(result.ids)
+    return result
+
+
+def _bulk_delete_wines(db: Session, bulk_data: WineBulkDelete, criteria: list, user_id: int) -> WineBulkResult:
+    """Delete matching wines (write_queue operation)"""
+    # Transactions go with their wines via ON DELETE CASCADE
+    ids = db.scalars(
+        delete(Wine).where(*criteria).returning(Wine.id),
+        execution_options={"synchronize_session": False}
+    ).all()
+
+    # Log one consolidated entry
+    log = OperationLog(
+        user_id=user_id,
+        action_type="bulk_delete",
+        entity_type="wine",
+        details=json.dumps({
+            "filter": bulk_data.filter.model_dump(exclude_none=True),
+            "count": len(ids),
+            "ids": ids
+        })
+    )
+    db.add(log)
+
+    return WineBulkResult(affected=len(ids), ids=ids)
+
+
+@router.post("/bulk-delete", response_model=WineBulkResult)
+async def bulk_delete_wines(
+    bulk_data: WineBulkDelete,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Delete all wines matching an ID list or filter, with their transactions"""
+    criteria = _bulk_criteria(bulk_data.filter)
+    user_id = current_user.id
+    result = await run_write(db, lambda session: _bulk_delete_wines(session, bulk_data, criteria, user_id))
+    publish(result.ids)
+    return result
 
 
 @router.get("/{wine_id}", response_model=WineResponse)
 def get_wine(
     wine_id: int,
+    fields: Optional[str] = None,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Get a single wine by ID"""
-    wine = db.query(Wine).filter(Wine.id == wine_id).first()
+    fieldset = _parse_fields(fields)
+    wine = _select_wines(db, fieldset).filter(Wine.id == wine_id).first()
     if not wine:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="红酒不存在"
         )
+    if fieldset:
+        return _json(wine_fields.model(fieldset).model_validate(wine).model_dump_json())
     return wine
 
 
-@router.put("/{wine_id}", response_model=WineResponse)
-def update_wine(
-    wine_id: int,
-    wine_data: WineUpdate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    """Update a wine"""
+def _update_wine(db: Session, wine_id: int, wine_data: WineUpdate, user_id: int) -> WineResponse:
+    """Update a wine (write_queue operation)"""
     wine = db.query(Wine).filter(Wine.id == wine_id).first()
     if not wine:
         raise HTTPException(
@@ -220,12 +530,9 @@ def update_wine(
     for field, value in update_data.items():
         setattr(wine, field, value)
 
-    db.commit()
-    db.refresh(wine)
-
-    # Log the action
+    # Log the action in the same transaction
     log = OperationLog(
-        user_id=current_user.id,
+        user_id=user_id,
         action_type="update",
         entity_type="wine",
         entity_id=wine.id,
@@ -235,18 +542,28 @@ def update_wine(
         })
     )
     db.add(log)
-    db.commit()
+    db.flush()
+    db.refresh(wine)
 
-    return wine
+    return WineResponse.model_validate(wine)
 
 
-@router.delete("/{wine_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_wine(
+@router.put("/{wine_id}", response_model=WineResponse)
+async def update_wine(
     wine_id: int,
+    wine_data: WineUpdate,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Delete a wine"""
+    """Update a wine"""
+    user_id = current_user.id
+    result = await run_write(db, lambda session: _update_wine(session, wine_id, wine_data, user_id))
+    publish([wine_id])
+    return result
+
+
+def _delete_wine(db: Session, wine_id: int, user_id: int):
+    """Delete a wine (write_queue operation)"""
     wine = db.query(Wine).filter(Wine.id == wine_id).first()
     if not wine:
         raise HTTPException(
@@ -256,18 +573,29 @@ def delete_wine(
 
     wine_name = wine.name
 
+    # Transactions are removed by ON DELETE CASCADE without being loaded
     db.delete(wine)
-    db.commit()
 
-    # Log the action
+    # Log the action in the same transaction
     log = OperationLog(
-        user_id=current_user.id,
+        user_id=user_id,
         action_type="delete",
         entity_type="wine",
         entity_id=wine_id,
         details=json.dumps({"name": wine_name})
     )
     db.add(log)
-    db.commit()
+
+
+@router.delete("/{wine_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_wine(
+    wine_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Delete a wine"""
+    user_id = current_user.id
+    await run_write(db, lambda session: _delete_wine(session, wine_id, user_id))
+    publish([wine_id])
 
     return None  # 204 No Content response
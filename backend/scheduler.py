@@ -0,0 +1,323 @@
+"""In-process periodic task scheduler, started from the app lifespan.
+
+Modules register tasks at import time with ``scheduler.add(ScheduledTask(...))``.
+A task runs every ``interval`` seconds (aligned to the epoch, so every worker
+agrees on the slots) or on a five-field ``cron`` expression in local time
+(``minute hour day month weekday``; ``*``, ``a-b``, ``a,b`` and ``/step``).
+Each slot starts after a random delay of up to ``jitter`` seconds. A task with
+a ``condition`` only starts while the condition holds; it is asked again every
+``retry`` seconds until the next slot comes around.
+
+Every worker process runs the scheduler, but a slot is claimed by inserting
+its ``task_runs`` row (unique per task and slot), so exactly one worker runs
+it. The row records the outcome and duration. Tasks run on a small thread pool
+of their own. A run that exceeds ``timeout`` is recorded as ``timeout``; its
+thread can't be killed, so the task isn't started again until it returns.
+``SCHEDULER_ENABLED=0`` turns the scheduler off for a process.
+"""
+
+import asyncio
+import logging
+import os
+import random
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Set
+
+from sqlalchemy.exc import IntegrityError
+
+from database import SessionLocal
+from metrics import registry
+from models import TaskRun
+
+logger = logging.getLogger("wine_inventory.scheduler")
+
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "1").lower() in ("1", "true", "yes")
+SCHEDULER_THREADS = int(os.getenv("SCHEDULER_THREADS", "2"))
+TASK_RUN_RETENTION_DAYS = int(os.getenv("TASK_RUN_RETENTION_DAYS", "14"))
+# Upper bound on how long a finished run waits to be rescheduled
+MAX_TICK_SECONDS = 1
+
+scheduled_task_duration = registry.histogram(
+    "scheduled_task_seconds", "Duration of scheduled task runs by task and status",
+    (0.01, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+)
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class CronExpression:
+    """Five-field cron expression evaluated in local time"""
+
+    FIELDS = (("minute", 0, 59), ("hour", 0, 23), ("day", 1, 31), ("month", 1, 12), ("weekday", 0, 6))
+
+    def __init__(self, expression: str):
+        parts = expression.split()
+        if len(parts) != len(self.FIELDS):
+            raise ValueError(f"cron expression needs {len(self.FIELDS)} fields: {expression!r}")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, self.weekdays = (
+            self._parse(part, low, high) for part, (_, low, high) in zip(parts, self.FIELDS)
+        )
+        # As in cron, a restricted day and weekday match when either does
+        self._any_day = parts[2] == "*"
+        self._any_weekday = parts[4] == "*"
+
+    @staticmethod
+    def _parse(field: str, low: int, high: int) -> Set[int]:
+        values = set()
+        for part in field.split(","):
+            body, _, step = part.partition("/")
+            if body == "*":
+                start, end = low, high
+            elif "-" in body:
+                start, end = (int(v) for v in body.split("-", 1))
+            else:
+                start = int(body)
+                end = high if step else start
+            # Weekday 7 is Sunday too
+            top = 7 if high == 6 else high
+            if not low <= start <= end <= top:
+                raise ValueError(f"cron field out of range: {field!r}")
+            values.update(v % 7 if high == 6 else v for v in range(start, end + 1, int(step) if step else 1))
+        return values
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day = moment.day in self.days
+        weekday = (moment.isoweekday() % 7) in self.weekdays
+        if self._any_day or self._any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, moment: datetime) -> datetime:
+        """First matching minute strictly after moment"""
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + timedelta(days=366 * 5)
+        while candidate < limit:
+            if candidate.month not in self.months:
+                year, month = divmod(candidate.month, 12)
+                candidate = candidate.replace(year=candidate.year + year, month=month + 1, day=1, hour=0, minute=0)
+            elif not self._day_matches(candidate):
+                candidate = (candidate + timedelta(days=1)).replace(hour=0, minute=0)
+            elif candidate.hour not in self.hours:
+                candidate = (candidate + timedelta(hours=1)).replace(minute=0)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        raise ValueError(f"cron expression never matches: {self.expression!r}")
+
+
+class ScheduledTask:
+    """A callable and when to run it"""
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable[[], object],
+        interval: Optional[float] = None,
+        cron: Optional[str] = None,
+        jitter: float = 0,
+        timeout: float = 300,
+        condition: Optional[Callable[[], bool]] = None,
+        retry: float = 60
+    ):
+        if (interval is None) == (cron is None):
+            raise ValueError(f"task {name} needs exactly one of interval and cron")
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.cron = CronExpression(cron) if cron else None
+        self.jitter = jitter
+        self.timeout = timeout
+        self.condition = condition
+        self.retry = retry
+        self.running = False
+        self.slot: Optional[datetime] = None
+        self.due_at = 0.0  # time.time() of the next attempt
+
+    @property
+    def schedule(self) -> str:
+        return f"cron {self.cron.expression}" if self.cron else f"every {self.interval:g}s"
+
+    def next_slot(self, after: float) -> float:
+        if self.cron:
+            return self.cron.next_after(datetime.fromtimestamp(after)).timestamp()
+        return (after // self.interval + 1) * self.interval
+
+    def advance(self, now: float):
+        """Move to the first slot after now"""
+        slot = self.next_slot(now)
+        self.slot = datetime.fromtimestamp(slot, timezone.utc).replace(tzinfo=None)
+        # Never jitter a run past the middle of its slot
+        jitter = min(self.jitter, (self.next_slot(slot) - slot) / 2)
+        self.due_at = slot + random.uniform(0, jitter)
+
+    def describe(self) -> dict:
+        return {
+            "name": self.name,
+            "schedule": self.schedule,
+            "timeout_seconds": self.timeout,
+            "jitter_seconds": self.jitter,
+            "next_slot": self.slot,
+            "running": self.running
+        }
+
+
+def _claim(task: ScheduledTask, slot: datetime) -> Optional[int]:
+    """Insert the slot's run row; None if another worker already has"""
+    db = SessionLocal()
+    try:
+        run = TaskRun(task=task.name, scheduled_for=slot, started_at=_utcnow(), status="running", worker=os.getpid())
+        db.add(run)
+        db.commit()
+        return run.id
+    except IntegrityError:
+        db.rollback()
+        return None
+    finally:
+        db.close()
+
+
+def _finish(run_id: int, status: str, elapsed: float, error: Optional[str]):
+    db = SessionLocal()
+    try:
+        run = db.get(TaskRun, run_id)
+        run.finished_at = _utcnow()
+        run.status = status
+        run.duration_ms = round(elapsed * 1000, 1)
+        run.error = error
+        db.commit()
+    finally:
+        db.close()
+
+
+class Scheduler:
+    """Runs registered tasks on their schedules, one worker per slot"""
+
+    def __init__(self, threads: int = SCHEDULER_THREADS):
+        self.threads = threads
+        self.tasks: Dict[str, ScheduledTask] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._task: Optional[asyncio.Task] = None
+        self._runs: Set[asyncio.Task] = set()
+
+    def add(self, task: ScheduledTask):
+        self.tasks[task.name] = task
+
+    def start(self):
+        """Start the scheduling loop on the running event loop"""
+        if not SCHEDULER_ENABLED:
+            return
+        self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="scheduler")
+        now = time.time()
+        for task in self.tasks.values():
+            task.advance(now)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop scheduling; runs in progress are left to finish on their threads"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        for run in list(self._runs):
+            run.cancel()
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+
+    async def _run(self):
+        while True:
+            now = time.time()
+            for task in self.tasks.values():
+                if not task.running and task.due_at <= now:
+                    self._start(task, now)
+            pending = [task.due_at for task in self.tasks.values() if not task.running]
+            wait = min(pending, default=now + MAX_TICK_SECONDS) - time.time()
+            await asyncio.sleep(min(max(wait, 0.05), MAX_TICK_SECONDS))
+
+    def _start(self, task: ScheduledTask, now: float):
+        if now >= task.next_slot(task.slot.replace(tzinfo=timezone.utc).timestamp()):
+            # The slot passed without a run (condition never held, or the loop was busy)
+            task.advance(now)
+            if task.due_at > now:
+                return
+        task.running = True
+        run = asyncio.create_task(self._execute(task, task.slot))
+        self._runs.add(run)
+        run.add_done_callback(self._runs.discard)
+
+    async def _execute(self, task: ScheduledTask, slot: datetime):
+        loop = asyncio.get_running_loop()
+        try:
+            if task.condition is not None and not await loop.run_in_executor(self._executor, task.condition):
+                task.due_at = time.time() + task.retry
+                task.running = False
+                return
+            run_id = await loop.run_in_executor(self._executor, _claim, task, slot)
+        except Exception:
+            logger.exception("Could not start scheduled task %s", task.name)
+            task.due_at = time.time() + task.retry
+            task.running = False
+            return
+        task.advance(time.time())
+        if run_id is None:
+            task.running = False
+            return
+
+        started = time.monotonic()
+        future = loop.run_in_executor(self._executor, task.func)
+        status, error = "ok", None
+        try:
+            await asyncio.wait_for(asyncio.shield(future), task.timeout)
+        except asyncio.TimeoutError:
+            status, error = "timeout", f"still running after {task.timeout:g}s"
+            logger.warning("Scheduled task %s timed out after %gs", task.name, task.timeout)
+        except Exception as exc:
+            status, error = "failed", "".join(traceback.format_exception_only(type(exc), exc)).strip()
+            logger.exception("Scheduled task %s failed", task.name)
+        elapsed = time.monotonic() - started
+        scheduled_task_duration.observe(elapsed, task=task.name, status=status)
+        if status == "timeout":
+            future.add_done_callback(lambda _: setattr(task, "running", False))
+        else:
+            task.running = False
+        try:
+            await loop.run_in_executor(self._executor, _finish, run_id, status, elapsed, error)
+        except Exception:
+            logger.exception("Could not record scheduled task %s", task.name)
+
+
+scheduler = Scheduler()
+
+
+def recent_runs(db, task: Optional[str] = None, limit: int = 50) -> List[TaskRun]:
+    """Latest recorded runs, newest first"""
+    query = db.query(TaskRun)
+    if task:
+        query = query.filter(TaskRun.task == task)
+    return query.order_by(TaskRun.scheduled_for.desc(), TaskRun.id.desc()).limit(limit).all()
+
+
+def purge_task_runs() -> int:
+    """Delete run records older than TASK_RUN_RETENTION_DAYS"""
+    db = SessionLocal()
+    try:
+        deleted = db.query(TaskRun).filter(
+            TaskRun.scheduled_for < _utcnow() - timedelta(days=TASK_RUN_RETENTION_DAYS)
+        ).delete(synchronize_session=False)
+        db.commit()
+        return deleted
+    finally:
+        db.close()
+
+
+scheduler.add(ScheduledTask("purge_task_runs", purge_task_runs, cron="15 4 * * *", jitter=60, timeout=120))
@@ -113,6 +113,40 @@ class WineListResponse(BaseModel):
     total_pages: int
 
 
+class WineChanges(BaseModel):
+    changes: List[WineResponse]
+    deleted: List[int]
+    token: str
+    has_more: bool
+
+
+class WineBulkFilter(BaseModel):
+    ids: Optional[List[int]] = Field(None, max_length=10000)
+    region: Optional[str] = None
+    grape_variety: Optional[str] = None
+    supplier: Optional[str] = None
+    storage_location: Optional[str] = None
+    vintage_year: Optional[int] = None
+
+
+class WineBulkCreate(BaseModel):
+    items: List[WineCreate] = Field(..., min_length=1, max_length=1000)
+
+
+class WineBulkUpdate(BaseModel):
+    filter: WineBulkFilter
+    changes: WineUpdate
+
+
+class WineBulkDelete(BaseModel):
+    filter: WineBulkFilter
+
+
+class WineBulkResult(BaseModel):
+    affected: int
+    ids: List[int]
+
+
 # Inventory transaction schemas
 class TransactionBase(BaseModel):
     wine_id: int
@@ -147,6 +181,21 @@ class TransactionListResponse(BaseModel):
     total_pages: int
 
 
+class BatchTransactionLine(TransactionBase):
+    transaction_type: str = Field(..., pattern="^(in|out)$")
+
+
+class BatchTransactionCreate(BaseModel):
+    lines: List[BatchTransactionLine] = Field(..., min_length=1, max_length=1000)
+
+
+class BatchTransactionResponse(BaseModel):
+    items: List[TransactionResponse]
+    count: int
+    total_in: int
+    total_out: int
+
+
 # Dashboard schemas
 class DashboardSummary(BaseModel):
     total_wines: int
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""Production launcher: pre-forked uvicorn workers on one shared socket.
+
+The master binds the listening socket, imports the app and prepares the
+database (tables, indexes, admin user, WAL journal) once, then forks
+``--workers`` processes that serve from the preloaded app and skip that work
+in their startup. Workers exit after
+``--max-requests`` (plus jitter, so they don't all recycle together) and are
+replaced immediately.
+
+Signals to the master:
+    SIGTERM / SIGINT  graceful shutdown (in-flight requests finish)
+    SIGHUP            zero-downtime code reload: the master re-executes itself
+                      with the socket, preloads the new code, then replaces
+                      the workers one at a time, each only after its
+                      replacement is serving
+
+State kept in process memory (metrics, SSE subscribers, profiles) is per
+worker.
+
+Examples:
+    python serve.py --workers 4 --port 8000 --pid-file serve.pid
+    kill -HUP $(cat serve.pid)
+"""
+
+import argparse
+import logging
+import os
+import random
+import select
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger("wine_inventory.serve")
+
+LISTEN_FD_ENV = "SERVE_LISTEN_FD"
+INHERITED_WORKERS_ENV = "SERVE_INHERITED_WORKERS"
+# Checked by the app's lifespan (main.py)
+DATABASE_PREPARED_ENV = "SERVE_DATABASE_PREPARED"
+
+
+def default_workers() -> int:
+    return os.cpu_count() or 1
+
+
+def bind_socket(host: str, port: int, backlog: int) -> socket.socket:
+    inherited = os.getenv(LISTEN_FD_ENV)
+    if inherited:
+        sock = socket.socket(fileno=int(inherited))
+    else:
+        family = socket.AF_INET6 if ":" in host else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((host, port))
+        sock.listen(backlog)
+    # Survives the re-exec on SIGHUP
+    sock.set_inheritable(True)
+    return sock
+
+
+def prepare_database():
+    """One-time startup work, done in the master so workers don't race on it"""
+    from database import engine, all_engines, Base, add_missing_columns, create_missing_indexes
+    from seed import seed_admin_user
+
+    Base.metadata.create_all(bind=engine)
+    add_missing_columns()
+    create_missing_indexes()
+    seed_admin_user()
+    # Tells the workers' lifespan it's done
+    os.environ[DATABASE_PREPARED_ENV] = "1"
+    # Forked workers must not share pooled connections with the master
+    for bound in all_engines:
+        bound.dispose()
+
+
+def run_worker(app, sock: socket.socket, args, ready_fd: int):
+    """Body of a forked worker; never returns"""
+    import uvicorn
+    from database import all_engines
+
+    for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGCHLD):
+        signal.signal(sig, signal.SIG_DFL)
+    random.seed()
+    for bound in all_engines:
+        bound.dispose(close=False)
+
+    max_requests = None
+    if args.max_requests:
+        max_requests = args.max_requests + random.randint(0, args.max_requests_jitter)
+    config = uvicorn.Config(
+        app,
+        lifespan="on",
+        log_level=args.log_level,
+        access_log=args.access_log,
+        proxy_headers=True,
+        limit_max_requests=max_requests,
+        timeout_keep_alive=args.keep_alive,
+        timeout_graceful_shutdown=args.graceful_timeout,
+    )
+    server = uvicorn.Server(config)
+
+    def notify_ready():
+        while not server.started and not server.should_exit:
+            time.sleep(0.02)
+        try:
+            os.write(ready_fd, b"1" if server.started else b"0")
+        finally:
+            os.close(ready_fd)
+
+    threading.Thread(target=notify_ready, daemon=True).start()
+    try:
+        server.run(sockets=[sock])
+    finally:
+        os._exit(0 if server.started else 1)
+
+
+class Master:
+    """Forks, supervises, recycles and rolls workers"""
+
+    def __init__(self, app, sock: socket.socket, args):
+        self.app = app
+        self.sock = sock
+        self.args = args
+        self.workers: Dict[int, float] = {}
+        self.stopping = False
+        self.reload_requested = False
+
+    def spawn(self) -> Optional[int]:
+        """Fork a worker and wait until it is accepting requests"""
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            run_worker(self.app, self.sock, self.args, write_fd)
+        os.close(write_fd)
+        try:
+            ready, _, _ = select.select([read_fd], [], [], self.args.startup_timeout)
+            ok = bool(ready) and os.read(read_fd, 1) == b"1"
+        except InterruptedError:
+            ok = False
+        finally:
+            os.close(read_fd)
+        self.workers[pid] = time.monotonic()
+        if not ok:
+            logger.error("Worker %d did not start within %.0fs", pid, self.args.startup_timeout)
+            self.stop_worker(pid)
+            return None
+        logger.info("Worker %d ready", pid)
+        return pid
+
+    def stop_worker(self, pid: int):
+        """SIGTERM a worker and wait for it, killing it after the grace period"""
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            self.workers.pop(pid, None)
+            return
+        deadline = time.monotonic() + self.args.graceful_timeout + 5
+        while time.monotonic() < deadline:
+            if os.waitpid(pid, os.WNOHANG)[0] == pid:
+                break
+            time.sleep(0.05)
+        else:
+            logger.warning("Worker %d did not stop in time; killing it", pid)
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        self.workers.pop(pid, None)
+
+    def reap(self) -> List[int]:
+        exited = []
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            if self.workers.pop(pid, None) is not None:
+                exited.append(pid)
+                code = os.waitstatus_to_exitcode(status)
+                if code == 0:
+                    reason = "recycled"
+                elif code == -signal.SIGTERM:
+                    reason = "stopped"
+                else:
+                    reason = f"code {code}"
+                logger.info("Worker %d exited (%s)", pid, reason)
+        return exited
+
+    def roll(self, old_workers: List[int]):
+        """Replace workers one at a time so capacity never drops"""
+        for index, pid in enumerate(old_workers):
+            if self.stopping:
+                return
+            if self.spawn() is None:
+                logger.error("Rolling restart aborted; %d old worker(s) keep serving", len(old_workers) - index)
+                return
+            self.stop_worker(pid)
+
+    def reload(self):
+        """Re-execute the master with the new code, keeping socket and workers"""
+        check = subprocess.run([sys.executable, "-c", "import main"], cwd=os.path.dirname(os.path.abspath(__file__)))
+        if check.returncode != 0:
+            logger.error("New code fails to import; keeping the current workers")
+            return
+        os.environ[LISTEN_FD_ENV] = str(self.sock.fileno())
+        os.environ[INHERITED_WORKERS_ENV] = ",".join(str(pid) for pid in self.workers)
+        logger.info("Reloading: re-executing master %d", os.getpid())
+        os.execv(sys.executable, [sys.executable, os.path.abspath(__file__)] + sys.argv[1:])
+
+    def shutdown(self):
+        logger.info("Stopping %d worker(s)", len(self.workers))
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + self.args.graceful_timeout + 5
+        while self.workers and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.05)
+        for pid in list(self.workers):
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            self.workers.pop(pid)
+
+    def run(self):
+        def on_stop(signum, frame):
+            self.stopping = True
+
+        def on_reload(signum, frame):
+            self.reload_requested = True
+
+        signal.signal(signal.SIGTERM, on_stop)
+        signal.signal(signal.SIGINT, on_stop)
+        signal.signal(signal.SIGHUP, on_reload)
+
+        inherited = [int(pid) for pid in os.environ.pop(INHERITED_WORKERS_ENV, "").split(",") if pid]
+        os.environ.pop(LISTEN_FD_ENV, None)
+        if inherited:
+            for pid in inherited:
+                self.workers[pid] = time.monotonic()
+            logger.info("Reloaded; replacing %d worker(s)", len(inherited))
+            self.roll(inherited)
+
+        while not self.stopping:
+            if self.reload_requested:
+                self.reload_requested = False
+                self.reload()
+            self.reap()
+            while len(self.workers) < self.args.workers and not self.stopping:
+                if self.spawn() is None:
+                    time.sleep(1)
+            while len(self.workers) > self.args.workers:
+                self.stop_worker(max(self.workers, key=self.workers.get))
+            time.sleep(0.2)
+        self.shutdown()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Run the API with pre-forked worker processes")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "0")) or default_workers())
+    parser.add_argument("--max-requests", type=int, default=10000, help="recycle a worker after this many requests (0 = never)")
+    parser.add_argument("--max-requests-jitter", type=int, default=1000)
+    parser.add_argument("--graceful-timeout", type=int, default=30, help="seconds in-flight requests get on shutdown")
+    parser.add_argument("--startup-timeout", type=float, default=60)
+    parser.add_argument("--keep-alive", type=int, default=5)
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--access-log", action="store_true")
+    parser.add_argument("--pid-file", help="write the master PID here (for kill -HUP)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s [%(process)d] %(message)s")
+    # Workers read and write the same file concurrently
+    os.environ.setdefault("SQLITE_JOURNAL_MODE", "wal")
+
+    sock = bind_socket(args.host, args.port, args.backlog)
+    from main import app
+    prepare_database()
+    if args.pid_file:
+        with open(args.pid_file, "w") as f:
+            f.write(str(os.getpid()))
+    logger.info("Master %d serving on %s:%d with %d worker(s)", os.getpid(), args.host, args.port, args.workers)
+    Master(app, sock, args).run()
+    if args.pid_file and os.path.exists(args.pid_file):
+        os.remove(args.pid_file)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
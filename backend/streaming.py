@@ -0,0 +1,69 @@
+"""Newline-delimited JSON streams for integrations that read whole tables.
+
+``ndjson_response`` pages through a filtered query by primary key, ``batch``
+rows at a time, each batch in its own short read session, and sends every
+batch as soon as it is serialized. Memory stays constant however many rows
+match, and no read transaction is held open while the client reads (which in
+rollback-journal mode would block writers). Rows committed during the stream
+appear if they sort after the current position; there is no snapshot.
+
+The request's own session is closed before a streaming body is sent, so the
+query is rebuilt on a fresh session for every batch.
+"""
+
+import os
+from typing import Callable, Iterator
+
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Query, Session
+
+from database import ReadSessionLocal
+from metrics import registry
+
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "1000"))
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+streamed_rows_total = registry.counter("streamed_rows_total", "Rows sent by NDJSON streams, by stream")
+
+
+def _batches(
+    name: str,
+    build: Callable[[Session], Query],
+    key,
+    serialize: Callable[[object], str],
+    batch: int
+) -> Iterator[str]:
+    last = None
+    while True:
+        db = ReadSessionLocal()
+        try:
+            query = build(db)
+            if last is not None:
+                query = query.filter(key > last)
+            rows = query.order_by(key).limit(batch).all()
+            if not rows:
+                return
+            chunk = "".join(serialize(row) + "\n" for row in rows)
+            last = getattr(rows[-1], key.key)
+        finally:
+            db.close()
+        streamed_rows_total.inc(len(rows), stream=name)
+        yield chunk
+        if len(rows) < batch:
+            return
+
+
+def ndjson_response(
+    name: str,
+    build: Callable[[Session], Query],
+    key,
+    serialize: Callable[[object], str],
+    batch: int = STREAM_BATCH_SIZE
+) -> StreamingResponse:
+    """Stream build(db) in key order, one JSON document per line"""
+    return StreamingResponse(
+        _batches(name, build, key, serialize, batch),
+        media_type=NDJSON_MEDIA_TYPE,
+        headers={"Cache-Control": "no-store"}
+    )
@@ -0,0 +1,46 @@
+"""Test setup: the app against a throwaway database file.
+
+Run from backend/: ``python -m pytest tests``
+"""
+
+import os
+import sys
+import tempfile
+
+# Before anything imports database.py, which reads these at import time
+_workdir = tempfile.mkdtemp(prefix="wine_inventory_tests_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_workdir, 'test.db')}"
+os.environ.setdefault("SCHEDULER_ENABLED", "0")
+os.environ.setdefault("BACKUP_DIR", os.path.join(_workdir, "backups"))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from fastapi.testclient import TestClient
+
+
+@pytest.fixture(scope="session")
+def client():
+    import main
+
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+@pytest.fixture(scope="session")
+def auth_headers(client):
+    response = client.post("/api/auth/login", json={"email": "admin@wine.com", "password": "admin123"})
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture(scope="session")
+def make_wine(client, auth_headers):
+    def make(**fields):
+        data = {"name": "测试红酒", "vintage_year": 2018, "region": "测试产区", "current_stock": 0, "price": 100}
+        data.update(fields)
+        response = client.post("/api/wines", json=data, headers=auth_headers)
+        assert response.status_code == 201, response.text
+        return response.json()
+
+    return make
@@ -0,0 +1,94 @@
+"""The wine change feed must neither skip nor repeat changes."""
+
+import base64
+import json
+
+from changes import purge_tombstones
+from database import writer_engine
+
+
+def _sync(client, auth_headers, token=None, limit=100):
+    """Follow the feed until caught up: (changed wine IDs, deleted IDs, token)"""
+    changed, deleted = [], []
+    while True:
+        params = {"limit": limit}
+        if token:
+            params["since"] = token
+        response = client.get("/api/wines/changes", params=params, headers=auth_headers)
+        assert response.status_code == 200, response.text
+        body = response.json()
+        changed += [wine["id"] for wine in body["changes"]]
+        deleted += body["deleted"]
+        token = body["token"]
+        if not body["has_more"]:
+            return changed, deleted, token
+
+
+def test_full_then_incremental_sync(client, auth_headers, make_wine):
+    kept, removed = make_wine(), make_wine()
+    changed, _, token = _sync(client, auth_headers, limit=7)
+    assert len(changed) == len(set(changed))
+    assert {kept["id"], removed["id"]} <= set(changed)
+
+    assert _sync(client, auth_headers, token)[:2] == ([], [])
+
+    client.put(f"/api/wines/{kept['id']}", json={"notes": "改"}, headers=auth_headers)
+    client.put(f"/api/wines/{kept['id']}", json={"notes": "再改"}, headers=auth_headers)
+    client.delete(f"/api/wines/{removed['id']}", headers=auth_headers)
+    changed, deleted, token = _sync(client, auth_headers, token)
+    assert changed == [kept["id"]]
+    assert deleted == [removed["id"]]
+
+    assert _sync(client, auth_headers, token)[:2] == ([], [])
+
+
+def test_change_committed_after_token_is_not_skipped(client, auth_headers, make_wine):
+    wine = make_wine()
+    _, _, token = _sync(client, auth_headers)
+
+    # A write transaction that stays open while the client syncs
+    connection = writer_engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("UPDATE wines SET notes = 'slow' WHERE id = ?", (wine["id"],))
+        changed, _, token = _sync(client, auth_headers, token)
+        assert changed == []
+        cursor.execute("COMMIT")
+    finally:
+        connection.close()
+
+    changed, _, _ = _sync(client, auth_headers, token)
+    assert changed == [wine["id"]]
+
+
+def test_token_before_purged_tombstones_expires(client, auth_headers, make_wine):
+    wine = make_wine()
+    _, _, old_token = _sync(client, auth_headers)
+    client.delete(f"/api/wines/{wine['id']}", headers=auth_headers)
+    _, deleted, new_token = _sync(client, auth_headers, old_token)
+    assert deleted == [wine["id"]]
+
+    connection = writer_engine.raw_connection()
+    try:
+        connection.execute(
+            "UPDATE wine_tombstones SET deleted_at = '2000-01-01 00:00:00' WHERE wine_id = ?", (wine["id"],)
+        )
+        connection.commit()
+    finally:
+        connection.close()
+    assert purge_tombstones() >= 1
+
+    response = client.get("/api/wines/changes", params={"since": old_token}, headers=auth_headers)
+    assert response.status_code == 410
+    response = client.get("/api/wines/changes", params={"since": new_token}, headers=auth_headers)
+    assert response.status_code == 200
+
+
+def test_timestamp_tokens_expire_and_garbage_is_rejected(client, auth_headers):
+    legacy = base64.urlsafe_b64encode(json.dumps({"t": "2026-01-01 00:00:00", "w": [1], "d": []}).encode()).decode()
+    response = client.get("/api/wines/changes", params={"since": legacy}, headers=auth_headers)
+    assert response.status_code == 410
+
+    response = client.get("/api/wines/changes", params={"since": "not-a-token"}, headers=auth_headers)
+    assert response.status_code == 400
@@ -0,0 +1,64 @@
+"""An Idempotency-Key must not stay locked after its request died."""
+
+import asyncio
+import json
+from datetime import timedelta
+
+import pytest
+from starlette.requests import Request
+
+from auth import get_user_id_from_authorization
+from idempotency import IdempotencyMiddleware, _claim_key, _request_hash, _utcnow
+
+PATH = "/api/inventory/in"
+
+
+def _body(wine):
+    return json.dumps({"wine_id": wine["id"], "quantity": 1}).encode()
+
+
+def _post(client, auth_headers, key, body):
+    headers = {**auth_headers, "Idempotency-Key": key, "Content-Type": "application/json"}
+    return client.post(PATH, content=body, headers=headers)
+
+
+def _request(auth_headers, key, body):
+    headers = [(b"authorization", auth_headers["Authorization"].encode()), (b"idempotency-key", key.encode())]
+    scope = {"type": "http", "method": "POST", "path": PATH, "query_string": b"", "headers": headers}
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    return Request(scope, receive)
+
+
+def test_retry_after_cancelled_request(client, auth_headers, make_wine):
+    body = _body(make_wine(current_stock=5))
+
+    async def disconnected(request):
+        raise asyncio.CancelledError
+
+    middleware = IdempotencyMiddleware(app=None)
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(middleware.dispatch(_request(auth_headers, "cancelled", body), disconnected))
+
+    response = _post(client, auth_headers, "cancelled", body)
+    assert response.status_code == 201, response.text
+    replay = _post(client, auth_headers, "cancelled", body)
+    assert replay.headers["Idempotent-Replayed"] == "true"
+    assert replay.json() == response.json()
+
+
+def test_abandoned_claim_is_taken_over_once_its_lease_runs_out(client, auth_headers, make_wine):
+    body = _body(make_wine(current_stock=5))
+    user_id = get_user_id_from_authorization(auth_headers["Authorization"])
+    request_hash = _request_hash("POST", PATH, body)
+
+    # A worker that claimed the key and crashed
+    assert _claim_key(user_id, "crashed", "POST", PATH, request_hash, _utcnow() + timedelta(seconds=60)) is None
+    assert _post(client, auth_headers, "crashed", body).status_code == 409
+
+    # Same, but its lease has run out
+    assert _claim_key(user_id, "stale", "POST", PATH, request_hash, _utcnow() - timedelta(seconds=1)) is None
+    response = _post(client, auth_headers, "stale", body)
+    assert response.status_code == 201, response.text
@@ -0,0 +1,110 @@
+"""Concurrent stock movements must never take stock below zero."""
+
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+from database import SessionLocal
+from models import User, Wine
+from routers.inventory import _batch_stock_movement, _stock_out
+from schemas import BatchTransactionCreate, TransactionCreate
+from write_queue import run_write, writer
+
+
+def _run_concurrently(movement, payloads):
+    """Submit movement(session, payload, ...) for every payload at once through run_write"""
+    if writer.running:
+        pytest.skip("the write queue runs operations one at a time")
+    admin = _admin_id()
+    barrier = threading.Barrier(len(payloads))
+
+    def op(payload):
+        def run(session):
+            # Line every thread up so their checks and updates interleave
+            barrier.wait()
+            return movement(session, payload, admin, "admin")
+        return run
+
+    async def submit(payload):
+        db = SessionLocal()
+        try:
+            return await run_write(db, op(payload))
+        except HTTPException as exc:
+            return exc
+        finally:
+            db.close()
+
+    async def main():
+        return await asyncio.gather(*(submit(payload) for payload in payloads))
+
+    return asyncio.run(main())
+
+
+def _admin_id() -> int:
+    db = SessionLocal()
+    try:
+        return db.query(User.id).filter(User.email == "admin@wine.com").scalar()
+    finally:
+        db.close()
+
+
+def _stock(wine_id: int) -> int:
+    db = SessionLocal()
+    try:
+        return db.query(Wine.current_stock).filter(Wine.id == wine_id).scalar()
+    finally:
+        db.close()
+
+
+def test_concurrent_batch_stock_out_cannot_overdraw(make_wine):
+    wine = make_wine(current_stock=10)
+    batch = BatchTransactionCreate(lines=[
+        {"wine_id": wine["id"], "transaction_type": "out", "quantity": 1},
+        {"wine_id": wine["id"], "transaction_type": "out", "quantity": 2},
+    ])
+
+    results = _run_concurrently(_batch_stock_movement, [batch] * 8)
+
+    succeeded = [r for r in results if not isinstance(r, HTTPException)]
+    failed = [r for r in results if isinstance(r, HTTPException)]
+    assert len(succeeded) == 3
+    assert all(exc.status_code == 400 for exc in failed)
+    assert _stock(wine["id"]) == 1
+
+
+def test_concurrent_stock_out_cannot_overdraw(make_wine):
+    wine = make_wine(current_stock=10)
+    transaction = TransactionCreate(wine_id=wine["id"], quantity=3)
+
+    results = _run_concurrently(_stock_out, [transaction] * 8)
+
+    succeeded = [r for r in results if not isinstance(r, HTTPException)]
+    failed = [r for r in results if isinstance(r, HTTPException)]
+    assert len(succeeded) == 3
+    assert all(exc.status_code == 400 for exc in failed)
+    assert _stock(wine["id"]) == 1
+
+
+def test_batch_checks_stock_line_by_line(client, auth_headers, make_wine):
+    wine = make_wine(current_stock=2)
+    response = client.post("/api/inventory/batch", headers=auth_headers, json={"lines": [
+        {"wine_id": wine["id"], "transaction_type": "out", "quantity": 3},
+        {"wine_id": wine["id"], "transaction_type": "in", "quantity": 5},
+    ]})
+
+    assert response.status_code == 400
+    assert "第1行" in response.json()["detail"]
+    assert _stock(wine["id"]) == 2
+
+
+def test_batch_reports_missing_wines(client, auth_headers, make_wine):
+    wine = make_wine(current_stock=5)
+    response = client.post("/api/inventory/batch", headers=auth_headers, json={"lines": [
+        {"wine_id": wine["id"], "transaction_type": "out", "quantity": 1},
+        {"wine_id": 999999, "transaction_type": "in", "quantity": 1},
+    ]})
+
+    assert response.status_code == 404
+    assert _stock(wine["id"]) == 5
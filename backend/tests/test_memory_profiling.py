@@ -0,0 +1,29 @@
+"""Per-request memory profiling counts ORM objects on read and write sessions."""
+
+import pytest
+
+
+@pytest.fixture
+def memory_profiling(client, auth_headers):
+    response = client.post("/api/profiles/memory/start", headers=auth_headers)
+    assert response.status_code == 200, response.text
+    yield
+    client.post("/api/profiles/memory/stop", headers=auth_headers)
+
+
+def _route(client, auth_headers, route):
+    response = client.get("/api/profiles/memory", headers=auth_headers)
+    assert response.status_code == 200, response.text
+    return response.json()["routes"][route]
+
+
+def test_get_requests_count_orm_objects(client, auth_headers, make_wine, memory_profiling):
+    wine = make_wine(region="内存产区")
+
+    response = client.get("/api/wines", params={"region": "内存产区"}, headers=auth_headers)
+    assert response.status_code == 200, response.text
+    assert _route(client, auth_headers, "GET /api/wines")["max_orm_objects_by_class"].get("Wine", 0) >= 1
+
+    response = client.put(f"/api/wines/{wine['id']}", json={"notes": "内存"}, headers=auth_headers)
+    assert response.status_code == 200, response.text
+    assert _route(client, auth_headers, "PUT /api/wines/{wine_id}")["max_orm_objects"] >= 1
@@ -0,0 +1,65 @@
+"""List, detail and dashboard endpoints must not issue a query per row (N+1)."""
+
+import pytest
+
+from query_debug import N_PLUS_ONE_THRESHOLD, detect_queries
+
+# More rows than the N+1 threshold, so a per-row query would show up
+ROWS = N_PLUS_ONE_THRESHOLD * 2 + 2
+
+
+@pytest.fixture(scope="module")
+def seeded(client, auth_headers, make_wine):
+    wines = [make_wine(name=f"N+1 检查 {i}", region="N+1产区", current_stock=20) for i in range(ROWS)]
+    lines = [{"wine_id": w["id"], "transaction_type": t, "quantity": 1} for w in wines for t in ("in", "out")]
+    response = client.post("/api/inventory/batch", json={"lines": lines}, headers=auth_headers)
+    assert response.status_code == 201, response.text
+
+    # A distinct performer per row: lookups of one repeated user would be
+    # answered by the identity map and hide a per-row query
+    for i in range(ROWS):
+        email = f"n-plus-one-{i}@wine.test"
+        response = client.post(
+            "/api/users", json={"email": email, "name": f"检查员{i}", "password": "password123"}, headers=auth_headers
+        )
+        assert response.status_code == 201, response.text
+        response = client.post("/api/auth/login", json={"email": email, "password": "password123"})
+        assert response.status_code == 200, response.text
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        response = client.post("/api/inventory/in", json={"wine_id": wines[0]["id"], "quantity": 1}, headers=headers)
+        assert response.status_code == 201, response.text
+
+    return {"wine": wines[0]["id"], "transaction": response.json()["id"]}
+
+
+ENDPOINTS = [
+    ("/api/wines", {"page_size": 100}),
+    ("/api/wines", {"region": "N+1产区", "page_size": 100}),
+    ("/api/wines/low-stock", {}),
+    ("/api/wines/{wine}", {}),
+    ("/api/inventory", {"page_size": 100}),
+    ("/api/inventory/{transaction}", {}),
+    ("/api/inventory/wine/{wine}", {}),
+    ("/api/dashboard/summary", {}),
+    ("/api/dashboard/trends", {"days": 30}),
+    ("/api/dashboard/distribution/region", {}),
+    ("/api/dashboard/distribution/variety", {}),
+    ("/api/dashboard/alerts", {}),
+    ("/api/logs", {"page_size": 100}),
+    ("/api/logs", {"action_type": "stock_in", "page_size": 100}),
+    ("/api/export/wines", {"region": "N+1产区"}),
+    ("/api/export/transactions", {}),
+    ("/api/users", {}),
+]
+
+
+@pytest.mark.parametrize("path, params", ENDPOINTS)
+def test_no_repeated_statements(client, auth_headers, seeded, path, params):
+    url = path.format(**seeded)
+    with detect_queries() as report:
+        response = client.get(url, params=params, headers=auth_headers)
+
+    assert response.status_code == 200, response.text
+    assert report.query_count > 0
+    repeated = [f"{s.count}x {s.fingerprint} at {', '.join(s.call_sites)}" for s in report.repeated()]
+    assert not repeated, "\n".join(repeated)
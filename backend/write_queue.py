@@ -0,0 +1,184 @@
+"""Single-writer queue with group commit (WRITE_QUEUE=1).
+
+SQLite has one write lock. With WRITE_QUEUE off, every write endpoint runs in
+its own threadpool transaction and they queue on that lock (or fail with
+``database is locked``). With it on, write endpoints hand their work to one
+writer thread per process instead. The writer collects whatever arrives
+within ``WRITE_QUEUE_WINDOW_MS`` of the first pending operation (at most
+``WRITE_QUEUE_MAX_BATCH``), runs each in its own SAVEPOINT so a failing one
+(404, insufficient stock, ...) is rolled back alone, and commits the batch
+once. Handlers await their operation's result without holding a thread.
+
+Operations are plain ``fn(db) -> result`` callables. They must not commit and
+must return values that are usable after the session is closed (response
+models, not ORM objects). Each runs in the context of the request that
+submitted it, so per-request context variables (query and memory profiling)
+see its work.
+
+Every wine, inventory, user and import write goes through ``run_write``. A few
+writes still commit on the request session, and with the queue on they take
+the write lock beside the writer thread (waiting out ``busy_timeout``):
+
+- the auth router (login/logout logs, profile, password change and reset):
+  single-row writes behind a bcrypt check that is too slow for the writer
+  thread;
+- the export audit logs: one row committed by a sync GET handler
+  (``get_write_db``);
+- Idempotency-Key records, written by the middleware around the request;
+- maintenance, backups, the scheduler and its purges, which run outside any
+  request.
+"""
+
+import asyncio
+import contextvars
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Optional, Tuple, TypeVar
+
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from database import SessionLocal, writer_engine
+from metrics import registry, LATENCY_BUCKETS, QUERY_COUNT_BUCKETS
+
+logger = logging.getLogger("wine_inventory.write_queue")
+
+WRITE_QUEUE = os.getenv("WRITE_QUEUE", "").lower() in ("1", "true", "yes")
+WRITE_QUEUE_WINDOW_SECONDS = float(os.getenv("WRITE_QUEUE_WINDOW_MS", "2")) / 1000
+WRITE_QUEUE_MAX_BATCH = int(os.getenv("WRITE_QUEUE_MAX_BATCH", "100"))
+
+T = TypeVar("T")
+Operation = Callable[[Session], T]
+Pending = Tuple[Operation, Future, float, contextvars.Context]
+
+write_batch_size = registry.histogram(
+    "write_queue_batch_size", "Operations committed together by the single writer", QUERY_COUNT_BUCKETS
+)
+write_batch_duration = registry.histogram(
+    "write_queue_batch_seconds", "Time the single writer spends running and committing one batch", LATENCY_BUCKETS
+)
+write_queue_wait = registry.histogram(
+    "write_queue_wait_seconds", "Time operations spend queued before the writer runs them", LATENCY_BUCKETS
+)
+
+
+def _apply(op: Operation, db: Session):
+    result = op(db)
+    db.flush()
+    return result
+
+
+class WriteQueue:
+    """One writer thread that group-commits submitted operations"""
+
+    def __init__(self, window: float = WRITE_QUEUE_WINDOW_SECONDS, max_batch: int = WRITE_QUEUE_MAX_BATCH):
+        self.window = window
+        self.max_batch = max_batch
+        self._queue: "queue.Queue[Optional[Pending]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Finish everything already queued, then stop the writer"""
+        if self._thread:
+            self._queue.put(None)
+            self._thread.join()
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def submit(self, op: Operation) -> Future:
+        future: Future = Future()
+        self._queue.put((op, future, time.monotonic(), contextvars.copy_context()))
+        return future
+
+    def _collect(self) -> Tuple[List[Pending], bool]:
+        """Block for one operation, then take whatever else arrives within the window"""
+        first = self._queue.get()
+        if first is None:
+            return [], True
+        batch = [first]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _execute(self, batch: List[Pending]):
+        started = time.monotonic()
+        committed: List[Tuple[Future, object]] = []
+        db = SessionLocal(bind=writer_engine, expire_on_commit=False)
+        try:
+            for op, future, submitted, context in batch:
+                write_queue_wait.observe(started - submitted)
+                if not future.set_running_or_notify_cancel():
+                    continue
+                savepoint = db.begin_nested()
+                try:
+                    result = context.run(_apply, op, db)
+                    savepoint.commit()
+                except Exception as exc:
+                    savepoint.rollback()
+                    future.set_exception(exc)
+                else:
+                    committed.append((future, result))
+            db.commit()
+        except Exception as exc:
+            # The batch as a whole failed (e.g. the write lock timed out)
+            logger.warning("Write batch of %d failed: %s", len(batch), exc)
+            db.rollback()
+            for future, _ in committed:
+                future.set_exception(exc)
+            for _, future, _, _ in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        finally:
+            db.close()
+        write_batch_size.observe(len(committed))
+        write_batch_duration.observe(time.monotonic() - started)
+        for future, result in committed:
+            future.set_result(result)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch, stopping = self._collect()
+            if batch:
+                self._execute(batch)
+
+
+writer = WriteQueue()
+
+
+async def run_write(db: Session, op: Operation) -> T:
+    """Run op and commit it, through the single writer when WRITE_QUEUE is on"""
+    if writer.running:
+        return await asyncio.wrap_future(writer.submit(op))
+
+    def run():
+        try:
+            result = op(db)
+            db.commit()
+        except Exception:
+            # Don't leave a failed op's writes (and the write lock) to the session's close
+            db.rollback()
+            raise
+        return result
+
+    return await run_in_threadpool(run)